@@ -141,6 +141,10 @@ IMPORT_TUPLES = [
     ('Preferences', ['Pref']),
 ]
 
+if sys.version_info >= (3, 6):
+    # async generators are a syntax error on older versions
+    IMPORT_TUPLES.append(('util_async', None))
+
 
 DOELSE = False
 
@@ -218,6 +222,9 @@ if DOELSE:
     from utool import DynamicStruct
     from utool import Preferences
 
+    if sys.version_info >= (3, 6):
+        from utool import util_async
+
     from utool.util_alg import (
         FOOT_PER_MILE,
         HAVE_NUMPY,
@@ -400,25 +407,34 @@ if DOELSE:
     from utool.util_cache import (
         Cachable,
         CacheMissException,
+        CacheStore,
         Cacher,
         GlobalShelfContext,
         KeyedDefaultDict,
         LRUDict,
         LazyDict,
         LazyList,
+        PackStore,
         ShelfCacher,
+        SqliteKVStore,
+        ThreadSafeLRUDict,
         USE_CACHE,
         VERBOSE_CACHE,
         cached_func,
+        cached_generate2,
         cachestr_repr,
+        check_dependency_record,
         chain,
         consensed_cfgstr,
         delete_global_cache,
         from_json,
         get_cfgstr_from_args,
         get_default_appname,
+        get_dependency_hash,
         get_func_result_cachekey,
         get_global_cache_dir,
+        get_global_kv_fpath,
+        get_global_kv_store,
         get_global_shelf_fpath,
         get_lru_cache,
         global_cache_dump,
@@ -427,7 +443,9 @@ if DOELSE:
         load_cache,
         make_utool_json_encoder,
         save_cache,
+        save_cache_list,
         shelf_open,
+        single_flight,
         text_dict_read,
         text_dict_write,
         time_different_diskstores,
@@ -436,6 +454,7 @@ if DOELSE:
         tryload_cache_list,
         tryload_cache_list_with_compute,
         view_global_cache_dir,
+        write_dependency_record,
     )
     from utool.util_cplat import (
         COMPUTER_NAME,
@@ -1002,24 +1021,35 @@ if DOELSE:
         ALPHABET_27,
         ALPHABET_41,
         BIGBASE,
+        DEFAULT_HASH_BACKEND,
         DictProxyType,
+        FileHashIndex,
+        HASH_BACKENDS,
         HASH_LEN,
         HASH_LEN2,
+        IncrementalHasher,
         SEP_BYTE,
         SEP_STR,
         augment_uuid,
+        augment_uuids,
         b,
+        benchmark_hash_backends,
         combine_hashes,
+        combine_uuid_bytes,
         combine_uuids,
+        combine_uuids_batch,
         convert_bytes_to_bigbase,
         convert_hexstr_to_bigbase,
         digest_data,
         freeze_hash_bytes,
         get_file_hash,
         get_file_uuid,
+        get_file_uuids,
+        get_hasher,
         get_zero_uuid,
         hash_data,
         hashable_to_uuid,
+        hashables_to_uuids,
         hashid_arr,
         hashstr,
         hashstr27,
@@ -1028,6 +1058,7 @@ if DOELSE:
         hashstr_md5,
         hashstr_sha1,
         image_uuid,
+        iter_file_hashes,
         make_hash,
         random_nonce,
         random_uuid,
@@ -1078,12 +1109,19 @@ if DOELSE:
     from utool.util_io import (
         HAS_H5PY,
         HAS_NUMPY,
+        HAVE_FCNTL,
         HAVE_LOCKFILE,
+        atomic_write,
+        benchmark_formats,
+        file_lock,
         load_cPkl,
+        load_compressed,
         load_data,
         load_hdf5,
         load_json,
+        load_mmap,
         load_numpy,
+        load_pkl5,
         load_pytables,
         load_text,
         lock_and_load_cPkl,
@@ -1092,10 +1130,13 @@ if DOELSE:
         read_lines_from,
         readfrom,
         save_cPkl,
+        save_compressed,
         save_data,
         save_hdf5,
         save_json,
+        save_mmap,
         save_numpy,
+        save_pkl5,
         save_pytables,
         save_text,
         try_decode,
@@ -1585,15 +1626,21 @@ if DOELSE:
         setup_repo,
     )
     from utool.util_parallel import (
+        BLAS_THREAD_ENVVARS,
         KillableProcess,
         KillableThread,
+        Pipeline,
+        PipelineError,
+        WorkerPool,
         bgfunc,
         buffered_generator,
         generate2,
+        get_available_cpus,
         get_default_numprocs,
         get_sys_thread_limit,
         in_main_process,
         init_worker,
+        limit_blas_threads,
         set_num_procs,
         spawn_background_daemon_thread,
         spawn_background_process,
@@ -1960,6 +2007,12 @@ if DOELSE:
         test_Preferences,
     )
 
+    if sys.version_info >= (3, 6):
+        from utool.util_async import (
+            abuffered_generator,
+            agenerate2,
+        )
+
     print, rrr, profile = util_inject.inject2(__name__, '[utool]')
 
     def reassign_submodule_attributes(verbose=1):
@@ -2068,6 +2121,8 @@ if DOELSE:
         get_rrr(util_web)(verbose > 1)
         get_rrr(DynamicStruct)(verbose > 1)
         get_rrr(Preferences)(verbose > 1)
+        if sys.version_info >= (3, 6):
+            get_rrr(util_async)(verbose > 1)
         rrr(verbose > 1)
         try:
             # hackish way of propogating up the new reloaded submodule attributes
@@ -1,35 +1,73 @@
 # -*- coding: utf-8 -*-
 from __future__ import absolute_import, division, print_function, unicode_literals
-import shelve
 from .meta_util_cplat import get_app_resource_dir
 from .meta_util_path import ensuredir
 from . import meta_util_arg
-from .meta_util_constants import global_cache_fname, global_cache_dname, default_appname
-from os.path import join
+from .meta_util_constants import (
+    global_cache_fname,
+    global_kv_fname,
+    global_cache_dname,
+    default_appname,
+)
+from os.path import join, exists
+
+
+def _read_global_shelf(shelf_fpath, key):
+    """
+    Reads the shelf that was used before the sqlite store. Returns a tuple
+    (found, value).
+    """
+    import contextlib
+    import shelve
+
+    try:
+        with contextlib.closing(shelve.open(shelf_fpath, 'r')) as shelf:
+            return True, shelf[key]
+    except Exception:
+        # No old shelf, no such key, or a shelf written by another dbm version
+        return False, None
 
 
 def global_cache_read(key, appname=None, **kwargs):
+    """
+    Reads the global key value store written by util_cache.global_cache_write
+    without importing utool. Keys that are not in the store are looked up in
+    the old global shelf, which utool has not necessarily migrated yet.
+    """
+    import sqlite3
+    from six.moves import cPickle as pickle
+
     if appname is None:
         appname = default_appname
     global_cache_dir = get_app_resource_dir(appname, global_cache_dname)
     ensuredir(global_cache_dir)
-    shelf_fpath = join(global_cache_dir, global_cache_fname)
-    import six
-
-    if six.PY2:
-        # key must be non-unicode in python2
-        key = str(key)
+    kv_fpath = join(global_cache_dir, global_kv_fname)
     try:
-        shelf = shelve.open(shelf_fpath)
-        if 'default' in kwargs:
-            return shelf.get(key, kwargs['default'])
+        found, value = False, None
+        if exists(kv_fpath):
+            conn = sqlite3.connect(kv_fpath, timeout=60)
+            try:
+                row = conn.execute(
+                    'SELECT value FROM kv WHERE key = ?', (key,)
+                ).fetchone()
+            finally:
+                conn.close()
+            if row is not None:
+                found, value = True, pickle.loads(row[0])
+        if not found:
+            # utool may not have migrated the old shelf into the store yet
+            shelf_fpath = join(global_cache_dir, global_cache_fname)
+            found, value = _read_global_shelf(shelf_fpath, key)
+        if found:
+            return value
+        elif 'default' in kwargs:
+            return kwargs['default']
         else:
-            return shelf[key]
-        shelf.close()
+            raise KeyError(key)
     except Exception as ex:
         print('[meta_util_cache] WARNING')
         print(ex)
-        print('[meta_util_cache] Error reading: shelf_fpath=%r' % shelf_fpath)
+        print('[meta_util_cache] Error reading: kv_fpath=%r' % kv_fpath)
         if meta_util_arg.SUPER_STRICT:
             raise
         return kwargs['default']
@@ -3,5 +3,6 @@ from __future__ import absolute_import, division, print_function, unicode_litera
 import six
 
 global_cache_fname = 'global_cache.shelf'
+global_kv_fname = 'global_cache.sqlite3'
 global_cache_dname = 'global_cache' + ('' if six.PY2 else '_py3')
 default_appname = 'utool'
@@ -0,0 +1,234 @@
+# -*- coding: utf-8 -*-
+"""
+Asyncio front-ends for the executors in :mod:`utool.util_parallel`.
+
+Async generators need Python 3.6 or newer, so this module is only imported
+by utool on those versions.
+"""
+from __future__ import absolute_import, division, print_function
+import asyncio
+import collections
+import itertools
+from concurrent import futures
+from utool import util_inject
+from utool.util_parallel import WorkerPool, buffered_generator
+
+print, rrr, profile = util_inject.inject2(__name__)
+
+
+async def agenerate2(
+    func,
+    args_gen,
+    kw_gen=None,
+    nprocs=None,
+    ordered=False,
+    futures_threaded=True,
+    pool=None,
+    limit=None,
+    timeout=None,
+):
+    r"""
+    Asyncio counterpart of :func:`utool.util_parallel.generate2`.
+
+    Tasks are dispatched to thread or process workers and awaited without
+    blocking the event loop. Results are yielded as they complete unless
+    ``ordered`` is True.
+
+    Args:
+        func (function):  live python function
+        args_gen (iterable): tuples of positional arguments. Consumed lazily.
+        kw_gen (iterable): dicts of keyword arguments or a single dict
+            (default = None)
+        nprocs (int): number of workers if pool is not given
+        ordered (bool): if True yields results in input order
+            (default = False)
+        futures_threaded (bool): use threads instead of processes if pool is
+            not given (default = True)
+        pool (WorkerPool): a persistent pool to execute tasks with
+            (default = None)
+        limit (int): maximum number of concurrent tasks
+            (default = pool.window)
+        timeout (float): per-task timeout in seconds. A task that takes
+            longer raises asyncio.TimeoutError. So that time spent waiting for
+            a worker does not count, ``limit`` is capped at ``pool.nprocs``.
+            (default = None)
+
+    Note:
+        Cancelling the consuming task or closing the generator cancels all
+        tasks that have not started yet. Tasks already running in a thread
+        cannot be interrupted and finish in the background.
+
+    CommandLine:
+        python -m utool.util_async agenerate2
+
+    Example:
+        >>> # ENABLE_DOCTEST
+        >>> import utool as ut
+        >>> import asyncio
+        >>> async def main():
+        >>>     results = []
+        >>>     async for flag in ut.agenerate2(ut.is_prime, zip(range(50)),
+        >>>                                     nprocs=2, ordered=True, limit=4):
+        >>>         results.append(flag)
+        >>>     return results
+        >>> loop = asyncio.new_event_loop()
+        >>> flag_list = loop.run_until_complete(main())
+        >>> loop.close()
+        >>> assert flag_list == [ut.is_prime(x) for x in range(50)]
+
+    Example:
+        >>> # ENABLE_DOCTEST
+        >>> import utool as ut
+        >>> import asyncio
+        >>> import time
+        >>> async def main():
+        >>>     agen = ut.agenerate2(time.sleep, [(0.01,), (1.0,)], nprocs=2,
+        >>>                          timeout=0.1)
+        >>>     try:
+        >>>         async for _ in agen:
+        >>>             pass
+        >>>     except asyncio.TimeoutError:
+        >>>         return 'timed out'
+        >>> loop = asyncio.new_event_loop()
+        >>> result = loop.run_until_complete(main())
+        >>> loop.close()
+        >>> assert result == 'timed out'
+    """
+    loop = asyncio.get_event_loop()
+    if pool is None:
+        pool_ = WorkerPool(nprocs, futures_threaded=futures_threaded)
+    else:
+        pool_ = pool
+    if limit is None:
+        limit = pool_.window
+    if timeout is not None:
+        # every submitted task starts immediately, so the timeout is run time
+        limit = min(limit, pool_.nprocs)
+    if kw_gen is None:
+        kw_gen = itertools.repeat({})
+    elif isinstance(kw_gen, dict):
+        kw_gen = itertools.repeat(kw_gen)
+    task_iter = zip(args_gen, kw_gen)
+    pending = collections.deque() if ordered else set()
+    # finished tasks that have not been yielded yet
+    ready = collections.deque()
+
+    def _submit_next():
+        for args, kw in task_iter:
+            afut = asyncio.wrap_future(pool_.submit(func, *args, **kw), loop=loop)
+            if timeout is not None:
+                afut = asyncio.ensure_future(asyncio.wait_for(afut, timeout), loop=loop)
+            if ordered:
+                pending.append(afut)
+            else:
+                pending.add(afut)
+            return True
+        return False
+
+    try:
+        exhausted = False
+        while True:
+            while not exhausted and len(pending) < limit:
+                exhausted = not _submit_next()
+            if len(pending) == 0 and len(ready) == 0:
+                break
+            if ordered:
+                afut = pending.popleft()
+                yield await afut
+            else:
+                if len(ready) == 0:
+                    done, _ = await asyncio.wait(
+                        pending, return_when=asyncio.FIRST_COMPLETED
+                    )
+                    pending.difference_update(done)
+                    ready.extend(done)
+                yield ready.popleft().result()
+    finally:
+        for afut in itertools.chain(pending, ready):
+            if not afut.done():
+                afut.cancel()
+            elif not afut.cancelled():
+                # mark the exceptions of abandoned tasks as retrieved
+                afut.exception()
+        if pool is None:
+            # do not block the event loop waiting on abandoned tasks
+            pool_.shutdown(wait=False)
+
+
+async def abuffered_generator(source_gen, buffer_size=2, use_multiprocessing=False):
+    r"""
+    Asyncio counterpart of :func:`utool.util_parallel.buffered_generator`.
+
+    The blocking ``source_gen`` is advanced in a background thread (or
+    process if use_multiprocessing is True) so the event loop stays
+    responsive. Up to ``buffer_size - 1`` items are generated ahead of the
+    consumer. Exceptions raised by the source are re-raised in the consumer.
+
+    Args:
+        source_gen (iterable): slow generator
+        buffer_size (int): the maximal number of items to pre-generate
+            (default = 2)
+        use_multiprocessing (bool): if True the source is run in a separate
+            process using :func:`utool.util_parallel.buffered_generator` (default = False)
+
+    CommandLine:
+        python -m utool.util_async abuffered_generator
+
+    Example:
+        >>> # ENABLE_DOCTEST
+        >>> import utool as ut
+        >>> import asyncio
+        >>> async def main():
+        >>>     source_gen = map(ut.is_prime, range(20))
+        >>>     return [x async for x in ut.abuffered_generator(source_gen, 4)]
+        >>> loop = asyncio.new_event_loop()
+        >>> flag_list = loop.run_until_complete(main())
+        >>> loop.close()
+        >>> assert flag_list == [ut.is_prime(x) for x in range(20)]
+    """
+    if buffer_size < 2:
+        raise RuntimeError('Minimal buffer_ size is 2!')
+    loop = asyncio.get_event_loop()
+    if use_multiprocessing:
+        source_gen = buffered_generator(source_gen, buffer_size, use_multiprocessing)
+    source_iter = iter(source_gen)
+    buffer_ = asyncio.Queue(maxsize=buffer_size - 1)
+    sentinal = StopIteration
+    executor = futures.ThreadPoolExecutor(1)
+
+    async def _produce():
+        try:
+            while True:
+                data = await loop.run_in_executor(executor, next, source_iter, sentinal)
+                await buffer_.put((True, data))
+                if data is sentinal:
+                    break
+        except Exception as ex:
+            await buffer_.put((False, ex))
+
+    producer = asyncio.ensure_future(_produce(), loop=loop)
+    try:
+        while True:
+            flag, output = await buffer_.get()
+            if not flag:
+                raise output
+            if output is sentinal:
+                break
+            yield output
+    finally:
+        producer.cancel()
+        executor.shutdown(wait=False)
+
+
+if __name__ == '__main__':
+    """
+    CommandLine:
+        python -m utool.util_async
+        python -m utool.util_async --allexamples
+    """
+    import multiprocessing
+
+    multiprocessing.freeze_support()  # for win32
+    import utool as ut  # NOQA
+
+    ut.doctest_funcs()
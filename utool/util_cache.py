@@ -9,6 +9,8 @@ import uuid
 import json
 import codecs
 import os
+import struct
+import time
 
 # import lru
 # git+https://github.com/amitdev/lru-dict
@@ -16,6 +18,7 @@ import os
 # import inspect
 import contextlib
 import collections
+import threading
 from six.moves import cPickle as pickle  # NOQA
 from six.moves import range, zip
 from os.path import join, normpath, basename, exists
@@ -33,6 +36,7 @@ from utool import util_inspect
 from utool import util_list
 from utool import util_class
 from utool import util_type
+from utool.util_const import NoParam
 
 # from utool import util_decor
 from utool import util_dict
@@ -58,14 +62,40 @@ class CacheMissException(Exception):
 # @six.add_metaclass(util_class.ReloadingMetaclass)
 @util_class.reloadable_class
 class ShelfCacher(object):
-    """ yet another cacher """
+    """
+    yet another cacher. Backed by a :class:`SqliteKVStore` in
+    ``fpath + '.sqlite3'``. The values of an old shelf in ``fpath`` are copied
+    into it when it is created.
+
+    Example:
+        >>> # ENABLE_DOCTEST
+        >>> from utool.util_cache import *  # NOQA
+        >>> import utool as ut
+        >>> dpath = ut.ensure_app_resource_dir('utool', 'test_shelfcacher')
+        >>> ut.delete(dpath)
+        >>> ut.ensuredir(dpath)
+        >>> fpath = join(dpath, 'timeings.shelf')
+        >>> with contextlib.closing(shelve.open(fpath)) as shelf:
+        >>>     shelf['old'] = 1
+        >>> cache = ShelfCacher(fpath)
+        >>> cache['new'] = 2
+        >>> assert cache['old'] == 1 and sorted(cache.keys()) == ['new', 'old']
+        >>> cache.close()
+        >>> ut.delete(dpath)
+    """
 
     def __init__(self, fpath, enabled=True):
         self.verbose = True
         if self.verbose:
             print('[shelfcache] initializing()')
         self.fpath = fpath
-        self.shelf = None if not enabled else shelve.open(fpath)
+        self.kv_fpath = fpath if fpath.endswith('.sqlite3') else fpath + '.sqlite3'
+        self.shelf = None
+        if enabled:
+            is_new = not exists(self.kv_fpath)
+            self.shelf = SqliteKVStore(self.kv_fpath)
+            if is_new and self.kv_fpath != fpath:
+                _migrate_shelf(fpath, self.shelf)
 
     def __del__(self):
         self.close()
@@ -83,7 +113,6 @@ class ShelfCacher(object):
         if self.verbose:
             print('[shelfcache] loading %s' % (cachekey,))
 
-        cachekey = cachekey.encode('ascii')
         if self.shelf is None or cachekey not in self.shelf:
             raise CacheMissException(
                 'Cache miss cachekey=%r self.fpath=%r' % (cachekey, self.fpath)
@@ -95,22 +124,189 @@ class ShelfCacher(object):
         if self.verbose:
             print('[shelfcache] saving %s' % (cachekey,))
 
-        cachekey = cachekey.encode('ascii')
         if self.shelf is not None:
             self.shelf[cachekey] = data
-        self.shelf.sync()
 
     def clear(self):
         if self.verbose:
             print('[shelfcache] clearing cache')
         self.shelf.clear()
-        self.shelf.sync()
 
     def close(self):
         if self.verbose:
             print('[shelfcache] closing()')
         if self.shelf is not None:
             self.shelf.close()
+            self.shelf = None
+
+
+class SqliteKVStore(object):
+    r"""
+    A persistent dictionary backed by sqlite in WAL mode.
+
+    The connection stays open for the life of the object, so reads and
+    writes do not pay the cost of opening the database. Several processes
+    can read and write the same file at once. Values are pickled.
+
+    It has the same mapping interface as a shelf and adds batched
+    :func:`SqliteKVStore.get_many` / :func:`SqliteKVStore.set_many`, which
+    run in a single transaction.
+
+    Args:
+        fpath (str): path to the sqlite database
+        timeout (float): seconds to wait for another process to release a
+            write lock (default = 60)
+
+    CommandLine:
+        python -m utool.util_cache SqliteKVStore
+
+    Example:
+        >>> # ENABLE_DOCTEST
+        >>> from utool.util_cache import *  # NOQA
+        >>> import utool as ut
+        >>> dpath = ut.ensure_app_resource_dir('utool', 'test_kvstore')
+        >>> fpath = join(dpath, 'kv.sqlite3')
+        >>> ut.delete(fpath)
+        >>> with SqliteKVStore(fpath) as kv:
+        >>>     kv['a'] = [1, 2]
+        >>>     kv.set_many({'b': 2, 'c': {'d': 3}})
+        >>>     assert kv['a'] == [1, 2] and 'b' in kv and len(kv) == 3
+        >>>     assert kv.get_many(['c', 'x'], default=0) == [{'d': 3}, 0]
+        >>>     del kv['a']
+        >>>     assert sorted(kv.keys()) == ['b', 'c']
+        >>> # Other processes see the writes
+        >>> kv2 = SqliteKVStore(fpath)
+        >>> assert kv2.get('b') == 2
+        >>> kv2.close()
+        >>> ut.delete(dpath)
+    """
+
+    def __init__(self, fpath, timeout=60):
+        import sqlite3
+
+        self.fpath = fpath
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(
+            fpath, timeout=timeout, check_same_thread=False, isolation_level=None
+        )
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value BLOB)'
+        )
+
+    def __repr__(self):
+        return '<SqliteKVStore(%r)>' % (self.fpath,)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type_, value, trace):
+        self.close()
+        return False
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        with self._lock:
+            # Take the write lock up front so concurrent writers queue on the
+            # busy timeout instead of failing to upgrade a read lock
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                yield self._conn
+            except BaseException:
+                self._conn.execute('ROLLBACK')
+                raise
+            else:
+                self._conn.execute('COMMIT')
+
+    def __getitem__(self, key):
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT value FROM kv WHERE key = ?', (key,)
+            ).fetchone()
+        if row is None:
+            raise KeyError(key)
+        return pickle.loads(row[0])
+
+    def __setitem__(self, key, value):
+        self.set_many([(key, value)])
+
+    def __delitem__(self, key):
+        with self._transaction() as conn:
+            cur = conn.execute('DELETE FROM kv WHERE key = ?', (key,))
+        if cur.rowcount == 0:
+            raise KeyError(key)
+
+    def __contains__(self, key):
+        with self._lock:
+            row = self._conn.execute('SELECT 1 FROM kv WHERE key = ?', (key,)).fetchone()
+        return row is not None
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM kv').fetchone()[0]
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def get_many(self, keys, default=None):
+        """ Returns the values of keys in one query """
+        keys = list(keys)
+        found = {}
+        with self._lock:
+            # stay below the sqlite limit on the number of parameters
+            for start in range(0, len(keys), 500):
+                chunk = keys[start : start + 500]
+                rows = self._conn.execute(
+                    'SELECT key, value FROM kv WHERE key IN (%s)'
+                    % (','.join('?' * len(chunk)),),
+                    chunk,
+                ).fetchall()
+                found.update(rows)
+        return [
+            pickle.loads(found[key]) if key in found else default for key in keys
+        ]
+
+    def set_many(self, items):
+        """ Writes a dict or a list of (key, value) pairs in one transaction """
+        if isinstance(items, dict):
+            items = items.items()
+        rows = [(key, pickle.dumps(value, protocol=2)) for key, value in items]
+        with self._transaction() as conn:
+            conn.executemany('INSERT OR REPLACE INTO kv (key, value) VALUES (?, ?)', rows)
+
+    def keys(self):
+        with self._lock:
+            rows = self._conn.execute('SELECT key FROM kv').fetchall()
+        return [row[0] for row in rows]
+
+    def items(self):
+        with self._lock:
+            rows = self._conn.execute('SELECT key, value FROM kv').fetchall()
+        return [(key, pickle.loads(value)) for key, value in rows]
+
+    def values(self):
+        return [value for key, value in self.items()]
+
+    def clear(self):
+        with self._transaction() as conn:
+            conn.execute('DELETE FROM kv')
+
+    def sync(self):
+        """ Writes are committed immediately. Exists for shelf compatibility """
+        pass
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
 
 
 def get_default_appname():
@@ -202,6 +398,17 @@ def _args2_fpath(dpath, fname, cfgstr, ext):
     """
     if len(ext) > 0 and ext[0] != '.':
         raise ValueError('Please be explicit and use a dot in ext')
+    fname_cfgstr = _args2_fname(fname, cfgstr)
+    fpath = join(dpath, fname_cfgstr + ext)
+    fpath = normpath(fpath)
+    return fpath
+
+
+def _args2_fname(fname, cfgstr):
+    """
+    The name of a cache entry without its extension. Also used as the key
+    of the entry in a CacheStore.
+    """
     max_len = 128
     # should hashlen be larger?
     cfgstr_hashlen = 16
@@ -209,9 +416,7 @@ def _args2_fpath(dpath, fname, cfgstr, ext):
     fname_cfgstr = consensed_cfgstr(
         prefix, cfgstr, max_len=max_len, cfgstr_hashlen=cfgstr_hashlen
     )
-    fpath = join(dpath, fname_cfgstr + ext)
-    fpath = normpath(fpath)
-    return fpath
+    return fname_cfgstr
 
 
 def save_cache(dpath, fname, cfgstr, data, ext='.cPkl', verbose=None):
@@ -286,13 +491,113 @@ def tryload_cache(dpath, fname, cfgstr, verbose=None):
         return None
 
 
+def _load_cache_fpath(fpath):
+    """ Returns the data and size of a cache file or (None, 0) if corrupt """
+    try:
+        data = util_io.load_data(fpath, verbose=False)
+    except Exception:
+        print('CORRUPTED? fpath = %s' % (fpath,))
+        return None, 0
+    return data, os.path.getsize(fpath)
+
+
+def _save_cache_fpath(fpath, data):
+    util_io.save_data(fpath, data, verbose=False)
+    return os.path.getsize(fpath)
+
+
+def _threaded_map(func, args_list, nprocs=None):
+    """ Maps IO bound work over a thread pool """
+    if len(args_list) < 2 or nprocs == 1:
+        return [func(*args) for args in args_list]
+    from concurrent import futures
+
+    with futures.ThreadPoolExecutor(nprocs) as executor:
+        return list(executor.map(lambda args: func(*args), args_list))
+
+
+def _batch_load_cache(dpath, fname, cfgstr_list, ext='.cPkl', nprocs=None):
+    """
+    Checks which cache files exist with a single directory scan and loads
+    them on a thread pool. Returns data_list, ismiss_list and the bytes read.
+    """
+    data_list = [None] * len(cfgstr_list)
+    if not USE_CACHE or not exists(dpath):
+        return data_list, [True] * len(cfgstr_list), 0
+    existing = set(os.listdir(dpath))
+    fpath_list = [_args2_fpath(dpath, fname, cfgstr, ext) for cfgstr in cfgstr_list]
+    hit_indices = [
+        index
+        for index, fpath in enumerate(fpath_list)
+        if basename(fpath) in existing
+    ]
+    results = _threaded_map(
+        _load_cache_fpath, [(fpath_list[index],) for index in hit_indices], nprocs
+    )
+    nbytes = 0
+    for index, (data, size) in zip(hit_indices, results):
+        data_list[index] = data
+        nbytes += size
+    ismiss_list = [data is None for data in data_list]
+    return data_list, ismiss_list, nbytes
+
+
+def save_cache_list(dpath, fname, cfgstr_list, data_list, ext='.cPkl', nprocs=None):
+    """
+    Saves a list of similar cached datas concurrently. Returns the number of
+    bytes written.
+    """
+    util_path.ensuredir(dpath)
+    args_list = [
+        (_args2_fpath(dpath, fname, cfgstr, ext), data)
+        for cfgstr, data in zip(cfgstr_list, data_list)
+    ]
+    return sum(_threaded_map(_save_cache_fpath, args_list, nprocs))
+
+
+def _print_cache_list_report(fname, dpath, num_total, num_hits, nread, nwrite=0):
+    msg = '[cache] %d/%d cache hits for %s in %s (read %s' % (
+        num_hits,
+        num_total,
+        fname,
+        util_path.tail(dpath),
+        util_str.byte_str2(nread),
+    )
+    if nwrite:
+        msg += ', wrote %s' % (util_str.byte_str2(nwrite),)
+    print(msg + ')')
+
+
 @profile
-def tryload_cache_list(dpath, fname, cfgstr_list, verbose=False):
+def tryload_cache_list(dpath, fname, cfgstr_list, verbose=False, nprocs=None):
     """
     loads a list of similar cached datas. Returns flags that needs to be computed
+
+    Existence is checked with one scan of ``dpath`` and the hits are loaded
+    concurrently on ``nprocs`` threads. If verbose a single summary of the
+    hits and bytes read is printed.
+
+    Example:
+        >>> # ENABLE_DOCTEST
+        >>> from utool.util_cache import *  # NOQA
+        >>> import utool as ut
+        >>> dpath = ut.ensure_app_resource_dir('utool', 'test_cache_list')
+        >>> ut.delete(dpath)
+        >>> cfgstr_list = ['_%d' % (x,) for x in range(10)]
+        >>> nbytes = save_cache_list(dpath, 'sq', cfgstr_list[::2],
+        >>>                          [x ** 2 for x in range(0, 10, 2)])
+        >>> data_list, ismiss_list = tryload_cache_list(dpath, 'sq', cfgstr_list,
+        >>>                                             verbose=True)
+        >>> assert data_list[::2] == [0, 4, 16, 36, 64]
+        >>> assert ismiss_list == [False, True] * 5
+        >>> ut.delete(dpath)
     """
-    data_list = [tryload_cache(dpath, fname, cfgstr, verbose) for cfgstr in cfgstr_list]
-    ismiss_list = [data is None for data in data_list]
+    data_list, ismiss_list, nbytes = _batch_load_cache(
+        dpath, fname, cfgstr_list, nprocs=nprocs
+    )
+    if verbose:
+        num_hits = len(ismiss_list) - sum(ismiss_list)
+        _print_cache_list_report(fname, dpath, len(cfgstr_list), num_hits, nbytes)
     return data_list, ismiss_list
 
 
@@ -311,36 +616,382 @@ def tryload_cache_list_with_compute(
         data_list = compute_fn(ismiss_list, *args)
         return data_list
     else:
-        data_list, ismiss_list = tryload_cache_list(
-            dpath, fname, cfgstr_list, verbose=False
-        )
+        data_list, ismiss_list, nread = _batch_load_cache(dpath, fname, cfgstr_list)
     num_total = len(cfgstr_list)
     if any(ismiss_list):
         # Compute missing values
         newdata_list = compute_fn(ismiss_list, *args)
         newcfgstr_list = util_list.compress(cfgstr_list, ismiss_list)
         index_list = util_list.list_where(ismiss_list)
-        print(
-            '[cache] %d/%d cache hits for %s in %s'
-            % (num_total - len(index_list), num_total, fname, util_path.tail(dpath))
-        )
         # Cache write
-        for newcfgstr, newdata in zip(newcfgstr_list, newdata_list):
-            save_cache(dpath, fname, newcfgstr, newdata, verbose=False)
+        nwrite = save_cache_list(dpath, fname, newcfgstr_list, newdata_list)
+        _print_cache_list_report(
+            fname, dpath, num_total, num_total - len(index_list), nread, nwrite
+        )
         # Populate missing result
         for index, newdata in zip(index_list, newdata_list):
             data_list[index] = newdata
     else:
+        _print_cache_list_report(fname, dpath, num_total, num_total, nread)
+    return data_list
+
+
+def cached_generate2(
+    func,
+    args_gen,
+    kw_gen=None,
+    fname=None,
+    cfgstr='',
+    cache_dir='default',
+    appname='utool',
+    verbose=None,
+    **kwargs
+):
+    r"""
+    Resumable version of :func:`utool.util_parallel.generate2` that
+    checkpoints each result to disk as soon as it is computed.
+
+    Results are keyed by a hash of each task's args and kwargs (via
+    :func:`utool.util_hash.hash_data`) prefixed by ``cfgstr``. If a run dies,
+    restarting it loads the finished results and only sends the missing tasks
+    to the workers. This is like :func:`tryload_cache_list_with_compute`,
+    but incremental and parallel.
+
+    Args:
+        func (function): live python function
+        args_gen (iterable): tuples of positional arguments
+        kw_gen (iterable): dicts of keyword arguments or a single dict
+            (default = None)
+        fname (str): prefix of the cache files (defaults to function name)
+        cfgstr (str): identifies the version of func. Change it to invalidate
+            old results. (default = '')
+        cache_dir (str): (default = 'default')
+        appname (str): (default = 'utool')
+        verbose (int): verbosity flag (default = None)
+        **kwargs: passed to generate2. Output is always ordered.
+
+    Yields:
+        object: result of each call to func, in order
+
+    CommandLine:
+        python -m utool.util_cache cached_generate2
+
+    Example:
+        >>> # ENABLE_DOCTEST
+        >>> from utool.util_cache import *  # NOQA
+        >>> import utool as ut
+        >>> cache_dir = ut.ensure_app_resource_dir('utool', 'test_cached_generate2')
+        >>> ut.delete(cache_dir)
+        >>> args_list = list(zip(range(20)))
+        >>> kw = dict(cache_dir=cache_dir, nprocs=2, verbose=0)
+        >>> # Simulate a job that dies halfway through
+        >>> import itertools as it
+        >>> result_gen = cached_generate2(ut.is_prime, args_list, **kw)
+        >>> first_half = list(it.islice(result_gen, 10))
+        >>> result_gen.close()
+        >>> assert len(ut.glob(cache_dir, 'is_prime_*')) >= 10
+        >>> # The restarted job only computes the missing results
+        >>> counter = []
+        >>> def is_prime(x):
+        ...     counter.append(x)
+        ...     return ut.is_prime(x)
+        >>> flags = list(cached_generate2(is_prime, args_list, force_serial=True, **kw))
+        >>> assert flags == [ut.is_prime(x) for x in range(20)]
+        >>> assert len(counter) <= 10
+        >>> ut.delete(cache_dir)
+    """
+    from utool import util_parallel
+
+    if verbose is None:
+        verbose = VERBOSE_CACHE
+    if fname is None:
+        fname = util_inspect.get_funcname(func)
+    if cache_dir == 'default':
+        cache_dir = util_cplat.get_app_resource_dir(appname)
+    util_path.ensuredir(cache_dir)
+    records = kwargs.pop('records', False)
+    kwargs['ordered'] = True
+    args_list = list(args_gen)
+    if kw_gen is None:
+        kw_list = [{}] * len(args_list)
+    elif isinstance(kw_gen, dict):
+        kw_list = [kw_gen] * len(args_list)
+    else:
+        kw_list = list(kw_gen)
+    cfgstr_list = [
+        '_' + cfgstr + util_hash.hash_data([args, sorted(kw.items())])
+        for args, kw in zip(args_list, kw_list)
+    ]
+    existing_fnames = set(os.listdir(cache_dir))
+    ismiss_list = [
+        basename(_args2_fpath(cache_dir, fname, cfgstr_, '.cPkl')) not in existing_fnames
+        for cfgstr_ in cfgstr_list
+    ]
+    num_total = len(cfgstr_list)
+    miss_idxs = util_list.list_where(ismiss_list)
+    if verbose:
         print(
             '[cache] %d/%d cache hits for %s in %s'
-            % (num_total, num_total, fname, util_path.tail(dpath))
+            % (num_total - len(miss_idxs), num_total, fname, util_path.tail(cache_dir))
         )
-    return data_list
+    newdata_gen = util_parallel.generate2(
+        func,
+        util_list.take(args_list, miss_idxs),
+        util_list.take(kw_list, miss_idxs),
+        records=records,
+        verbose=verbose,
+        **kwargs
+    )
+    for index, (args, kw, cfgstr_, ismiss) in enumerate(
+        zip(args_list, kw_list, cfgstr_list, ismiss_list)
+    ):
+        if ismiss:
+            data = six.next(newdata_gen)
+            if records:
+                data = data[1]
+            if not (records and isinstance(data, Exception)):
+                # Checkpoint immediately so a restart can resume from here
+                save_cache(cache_dir, fname, cfgstr_, data, verbose=False)
+        else:
+            try:
+                data = load_cache(cache_dir, fname, cfgstr_, verbose=False)
+            except IOError:
+                # A corrupted checkpoint is recomputed
+                data = func(*args, **kw)
+                save_cache(cache_dir, fname, cfgstr_, data, verbose=False)
+        if records:
+            yield (index, data)
+        else:
+            yield data
+
+
+_SINGLE_FLIGHT_GUARD = threading.Lock()
+# key -> [lock, number of callers using the lock]
+_SINGLE_FLIGHT_LOCKS = {}
+
+
+@contextlib.contextmanager
+def single_flight(key, lock_fpath=None, timeout=None):
+    """
+    Lets only one caller at a time into the context for each ``key``, so
+    concurrent callers that need the same cache entry wait for one
+    computation instead of repeating it. Callers should check the cache again
+    once they are inside.
+
+    Callers are excluded between threads of this process. If ``lock_fpath``
+    is given an advisory file lock also excludes other processes and hosts.
+
+    Example:
+        >>> # ENABLE_DOCTEST
+        >>> from utool.util_cache import *  # NOQA
+        >>> import utool as ut
+        >>> import time
+        >>> computed = []
+        >>> def compute(x):
+        ...     with single_flight('key'):
+        ...         if not computed:
+        ...             time.sleep(0.01)
+        ...             computed.append(x)
+        ...     return computed[0]
+        >>> results = list(ut.generate2(compute, zip(range(20)), nprocs=4,
+        >>>                             futures_threaded=True, verbose=0))
+        >>> assert len(computed) == 1 and len(set(results)) == 1
+    """
+    with _SINGLE_FLIGHT_GUARD:
+        entry = _SINGLE_FLIGHT_LOCKS.get(key, None)
+        if entry is None:
+            entry = _SINGLE_FLIGHT_LOCKS[key] = [threading.Lock(), 0]
+        entry[1] += 1
+    try:
+        with entry[0]:
+            if lock_fpath is None:
+                yield
+            else:
+                with util_io.file_lock(lock_fpath, timeout=timeout):
+                    yield
+    finally:
+        with _SINGLE_FLIGHT_GUARD:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del _SINGLE_FLIGHT_LOCKS[key]
+
+
+def _dependency_label(dep):
+    if isinstance(dep, (Cacher, Cachable)):
+        return 'cache:' + basename(dep.get_fpath())
+    elif isinstance(dep, six.string_types):
+        return 'file:' + normpath(dep)
+    elif callable(dep):
+        return 'func:%s.%s' % (
+            getattr(dep, '__module__', ''),
+            util_inspect.get_funcname(dep),
+        )
+    else:
+        raise TypeError('Unknown cache dependency type=%r' % (type(dep),))
+
+
+def _hash_cache_fpath(fpath):
+    """ Content hash of a cache file or of a directory format like .mmap """
+    if os.path.isdir(fpath):
+        fname_list = sorted(os.listdir(fpath))
+        hash_list = [
+            _hash_cache_fpath(join(fpath, fname)) for fname in fname_list
+        ]
+        return util_hash.hashstr27(repr(list(zip(fname_list, hash_list))))
+    return util_hash.get_file_hash(fpath, hexdigest=True)
+
+
+def _cache_fpath_stamp(fpath):
+    """ changes whenever the cache entry in fpath is replaced """
+    stat = os.stat(fpath)
+    mtime_ns = getattr(stat, 'st_mtime_ns', None)
+    if mtime_ns is None:
+        mtime_ns = int(stat.st_mtime * 1e9)
+    return [stat.st_size, mtime_ns, stat.st_ino]
+
+
+def _read_dependency_record(fpath):
+    """
+    Returns the dependency record of fpath, or None if there is none or it
+    was written for a different version of the entry. The record is written
+    after the entry, so a reader in between sees the record of the previous
+    version and must not trust it.
+    """
+    deps_fpath = fpath + '.deps.json'
+    if not exists(deps_fpath):
+        return None
+    try:
+        with open(deps_fpath, 'r') as file_:
+            record = json.load(file_)
+        if record.get('stamp') != _cache_fpath_stamp(fpath):
+            return None
+    except (ValueError, OSError):
+        return None
+    return record
+
+
+def get_dependency_hash(dep):
+    """
+    Returns the content hash of a cache dependency, or None if it does not
+    exist.
+
+    Args:
+        dep (Cacher or Cachable or str or func): an upstream cache entry, a
+            file path or a function. Functions are hashed by their source.
+    """
+    if isinstance(dep, (Cacher, Cachable)):
+        fpath = dep.get_fpath()
+        record = _read_dependency_record(fpath)
+        if record is not None:
+            # The product hash was recorded when the entry was saved
+            return record['product']
+        if not exists(fpath):
+            return None
+        return _hash_cache_fpath(fpath)
+    elif isinstance(dep, six.string_types):
+        if not exists(dep):
+            return None
+        return util_hash.get_file_hash(dep, hexdigest=True)
+    elif callable(dep):
+        try:
+            sourcecode = util_inspect.get_func_sourcecode(dep)
+        except (IOError, OSError, TypeError):
+            # No source for interactively defined functions, use the bytecode
+            code = dep.__code__
+            sourcecode = repr((code.co_code, code.co_consts, code.co_names))
+        return util_hash.hashstr27(sourcecode)
+    else:
+        raise TypeError('Unknown cache dependency type=%r' % (type(dep),))
+
+
+def write_dependency_record(fpath, depends):
+    """
+    Records the hashes of the dependencies of the cache entry in ``fpath``
+    and the hash of the entry itself in ``fpath + '.deps.json'``. The record
+    also stamps the size, mtime and inode of the entry so it is only trusted
+    for the version of the entry it was written for.
+    """
+    # stamp before hashing, so an entry replaced meanwhile never matches
+    stamp = _cache_fpath_stamp(fpath)
+    record = {
+        'depends': {
+            _dependency_label(dep): get_dependency_hash(dep) for dep in depends
+        },
+        'product': _hash_cache_fpath(fpath),
+        'stamp': stamp,
+    }
+    with util_io.atomic_write(fpath + '.deps.json', 'w') as file_:
+        json.dump(record, file_, indent=2, sort_keys=True)
+    return record
+
+
+def check_dependency_record(fpath, depends, verbose=None):
+    """
+    Returns the labels of the dependencies that changed since the entry in
+    ``fpath`` was saved. An empty list means the entry is up to date.
+    """
+    record = _read_dependency_record(fpath)
+    if record is None:
+        return ['<no dependency record>']
+    old_hashes = record['depends']
+    labels = [_dependency_label(dep) for dep in depends]
+    changed = []
+    for label, dep in zip(labels, depends):
+        old_hash = old_hashes.get(label, None)
+        if old_hash is None or old_hash != get_dependency_hash(dep):
+            changed.append(label)
+    # Dependencies that were removed also invalidate the entry
+    changed += sorted(set(old_hashes) - set(labels))
+    if verbose and changed:
+        print(
+            '[cache] %s is stale. changed: %s' % (basename(fpath), ', '.join(changed))
+        )
+    return changed
 
 
 class Cacher(object):
     """
     old non inhertable version of cachable
+
+    If ``store`` is a :class:`CacheStore` the data is kept in the store
+    instead of in its own file in ``cache_dir``. The key is the name the file
+    would have without its extension.
+
+    Files are written atomically. :func:`Cacher.ensure` lets only one thread
+    compute a missing entry, and if ``lock`` is True an advisory file lock
+    extends this to other processes and hosts sharing the cache dir.
+
+    If ``depends`` is a list of upstream Cachers or Cachables, file paths or
+    functions, their content hashes are recorded next to the saved entry and
+    the entry is treated as a miss when any of them changes.
+
+    Example:
+        >>> # ENABLE_DOCTEST
+        >>> import utool as ut
+        >>> dpath = ut.ensure_app_resource_dir('utool', 'test_cache_depends')
+        >>> ut.delete(dpath)
+        >>> def make_feats():
+        ...     return [1, 2, 3]
+        >>> feats = ut.Cacher('feats', cfgstr='v1', cache_dir=dpath,
+        >>>                   depends=[make_feats], verbose=0)
+        >>> index = ut.Cacher('index', cfgstr='v1', cache_dir=dpath,
+        >>>                   depends=[feats], verbose=0)
+        >>> counts = []
+        >>> def make_index():
+        ...     counts.append(1)
+        ...     return sum(feats.ensure(make_feats))
+        >>> assert index.ensure(make_index) == 6
+        >>> assert index.ensure(make_index) == 6 and len(counts) == 1
+        >>> # Recomputing upstream with the same result does not invalidate
+        >>> feats.save([1, 2, 3])
+        >>> assert index.ensure(make_index) == 6 and len(counts) == 1
+        >>> # A changed upstream result does
+        >>> feats.save([1, 2, 4])
+        >>> assert index.ensure(make_index) == 7 and len(counts) == 2
+        >>> # Data without its own dependency record is not trusted
+        >>> ut.save_cache(dpath, 'index', 'v1', 8)
+        >>> assert index.ensure(make_index) == 7 and len(counts) == 3
+        >>> ut.delete(dpath)
     """
 
     def __init__(
@@ -352,10 +1003,17 @@ class Cacher(object):
         ext='.cPkl',
         verbose=None,
         enabled=True,
+        store=None,
+        lock=False,
+        depends=None,
     ):
         if verbose is None:
             verbose = VERBOSE
-        if cache_dir == 'default':
+        if store is not None and depends:
+            raise ValueError('Dependency tracking requires a file based Cacher')
+        if store is not None:
+            cache_dir = store.dpath
+        elif cache_dir == 'default':
             cache_dir = util_cplat.get_app_resource_dir(appname)
         util_path.ensuredir(cache_dir)
         self.dpath = cache_dir
@@ -364,25 +1022,54 @@ class Cacher(object):
         self.verbose = verbose
         self.ext = ext
         self.enabled = enabled
+        self.store = store
+        self.lock = lock
+        self.depends = depends
 
-    def get_fpath(self):
-        fpath = _args2_fpath(self.dpath, self.fname, self.cfgstr, self.ext)
+    def get_fpath(self, cfgstr=None):
+        cfgstr = self.cfgstr if cfgstr is None else cfgstr
+        fpath = _args2_fpath(self.dpath, self.fname, cfgstr, self.ext)
         return fpath
 
+    def get_store_key(self, cfgstr=None):
+        cfgstr = self.cfgstr if cfgstr is None else cfgstr
+        if cfgstr is None:
+            cfgstr = ''
+        return _args2_fname(self.fname, cfgstr)
+
     def existing_versions(self):
         """
         Returns data with different cfgstr values that were previously computed
-        with this cacher.
+        with this cacher. With a store these are keys instead of fpaths.
         """
         import glob
 
+        if self.store is not None:
+            # same pattern as the files. The separator keeps e.g. 'feat' from
+            # matching 'featweights'
+            prefix = self.fname + '_'
+            for key in self.store.keys():
+                if key.startswith(prefix):
+                    yield key
+            return
         pattern = self.fname + '_*' + self.ext
         for fname in glob.glob1(self.dpath, pattern):
             fpath = join(self.dpath, fname)
             yield fpath
 
     def exists(self, cfgstr=None):
-        return exists(self.get_fpath())
+        if self.store is not None:
+            return self.get_store_key(cfgstr) in self.store
+        return exists(self.get_fpath(cfgstr))
+
+    def single_flight(self, cfgstr=None, timeout=None):
+        """
+        Context in which only one caller computes the entry for ``cfgstr``.
+        See :func:`single_flight`.
+        """
+        fpath = self.get_fpath(cfgstr)
+        lock_fpath = fpath if self.lock else None
+        return single_flight(fpath, lock_fpath=lock_fpath, timeout=timeout)
 
     def load(self, cfgstr=None):
         cfgstr = self.cfgstr if cfgstr is None else cfgstr
@@ -394,6 +1081,19 @@ class Cacher(object):
             cfgstr = ''
         assert self.fname is not None, 'no fname'
         assert self.dpath is not None, 'no dpath'
+        if self.store is not None:
+            if not USE_CACHE or not self.enabled:
+                raise IOError(3, 'Cache Loading Is Disabled')
+            data = self.store.load(self.get_store_key(cfgstr))
+            if self.verbose > 1:
+                print('[cache] ... ' + self.fname + ' Cacher hit')
+            return data
+        if self.depends and self.enabled and USE_CACHE:
+            fpath = self.get_fpath(cfgstr)
+            if exists(fpath) and check_dependency_record(
+                fpath, self.depends, verbose=self.verbose
+            ):
+                raise IOError(2, 'Stale cache: %r' % (fpath,))
         # TODO: use the computed fpath from this object instead
         data = load_cache(
             self.dpath,
@@ -437,8 +1137,13 @@ class Cacher(object):
     def ensure(self, func, *args, **kwargs):
         data = self.tryload()
         if data is None:
-            data = func(*args, **kwargs)
-            self.save(data)
+            with self.single_flight():
+                # Another caller may have computed it while we waited
+                if self.exists():
+                    data = self.tryload()
+                if data is None:
+                    data = func(*args, **kwargs)
+                    self.save(data)
         return data
 
     def save(self, data, cfgstr=None):
@@ -455,7 +1160,669 @@ class Cacher(object):
         assert self.dpath is not None, 'no dpath'
         if self.verbose > 0:
             print('[cache] ... ' + self.fname + ' Cacher save')
-        save_cache(self.dpath, self.fname, cfgstr, data, self.ext)
+        if self.store is not None:
+            self.store.save(self.get_store_key(cfgstr), data)
+        else:
+            fpath = save_cache(self.dpath, self.fname, cfgstr, data, self.ext)
+            if self.depends:
+                write_dependency_record(fpath, self.depends)
+
+
+class CacheStore(object):
+    r"""
+    A content addressed, size bounded disk cache.
+
+    Each value is pickled and written once to a blob named by the hash of its
+    bytes, so identical results saved under different keys share storage. A
+    sqlite index in ``dpath`` maps keys to blobs and tracks the size, last
+    access time and number of hits of every entry. When the total size of
+    the blobs exceeds ``max_bytes`` entries are evicted by ``policy``.
+
+    A store can be passed to :class:`Cacher`, :func:`cached_func` or set as
+    the ``store`` attribute of a :class:`Cachable` to replace their one file
+    per cfgstr layout.
+
+    Args:
+        dpath (str): directory that holds the index and the blobs
+        max_bytes (int): byte budget of the store. None is unbounded.
+            (default = None)
+        policy (str): 'lru' evicts the least recently used entries, 'lfu'
+            evicts the least frequently used entries (default = 'lru')
+        verbose (int): verbosity flag (default = None)
+
+    CommandLine:
+        python -m utool.util_cache CacheStore
+
+    Example:
+        >>> # ENABLE_DOCTEST
+        >>> from utool.util_cache import *  # NOQA
+        >>> import utool as ut
+        >>> dpath = ut.ensure_app_resource_dir('utool', 'test_cachestore')
+        >>> ut.delete(dpath)
+        >>> store = CacheStore(dpath, max_bytes=2500, policy='lru')
+        >>> store.save('a', b'a' * 1000)
+        >>> store.save('b', b'b' * 1000)
+        >>> store.save('c', b'a' * 1000)  # shares the blob of 'a'
+        >>> assert store.stats()['nblobs'] == 2
+        >>> assert store.load('a') == b'a' * 1000
+        >>> store.save('d', b'd' * 1000)  # 'b' is the least recently used
+        >>> assert sorted(store.keys()) == ['a', 'c', 'd']
+        >>> assert store.total_bytes() <= 2500
+        >>> assert store.tryload('b') is None
+        >>> # Plug the store into a Cacher
+        >>> cacher = ut.Cacher('myfunc', cfgstr='_cfg1', store=store)
+        >>> cacher.save([1, 2, 3])
+        >>> assert cacher.exists() and cacher.load() == [1, 2, 3]
+        >>> fname = basename(cacher.get_fpath())
+        >>> assert cacher.get_store_key() + cacher.ext == fname
+        >>> ut.Cacher('myfuncweights', cfgstr='_cfg1', store=store).save([4])
+        >>> assert list(cacher.existing_versions()) == ['myfunc_cfg1']
+        >>> # Or into a Cachable
+        >>> class Thing(ut.Cachable):
+        >>>     store = store
+        >>> thing = Thing()
+        >>> thing.value = 4
+        >>> _ = thing.save(cfgstr='four', verbose=0)
+        >>> thing2 = Thing()
+        >>> thing2.load(cfgstr='four', verbose=0)
+        >>> assert thing2.value == 4
+        >>> # dependencies are only tracked next to files
+        >>> thing2.depends = [ut.Cacher('feats', cfgstr='v1', verbose=0)]
+        >>> ut.assert_raises(ValueError, thing2.save, cfgstr='four', verbose=0)
+        >>> ut.assert_raises(ValueError, thing2.load, cfgstr='four', verbose=0)
+        >>> store.close()
+        >>> ut.delete(dpath)
+    """
+
+    def __init__(self, dpath, max_bytes=None, policy='lru', verbose=None):
+        import sqlite3
+
+        if policy not in ('lru', 'lfu'):
+            raise ValueError('unknown eviction policy=%r' % (policy,))
+        if verbose is None:
+            verbose = VERBOSE
+        util_path.ensuredir(join(dpath, 'blobs'))
+        self.dpath = dpath
+        self.max_bytes = max_bytes
+        self.policy = policy
+        self.verbose = verbose
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(
+            join(dpath, 'index.sqlite3'), timeout=60, check_same_thread=False
+        )
+        with self._conn:
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS entries (
+                    key TEXT PRIMARY KEY,
+                    digest TEXT NOT NULL,
+                    nbytes INTEGER NOT NULL,
+                    atime REAL NOT NULL,
+                    hits INTEGER NOT NULL DEFAULT 0
+                )
+                """
+            )
+            self._conn.execute(
+                'CREATE INDEX IF NOT EXISTS entries_digest ON entries (digest)'
+            )
+
+    def __repr__(self):
+        return '<CacheStore(dpath=%r, policy=%s, max_bytes=%r)>' % (
+            self.dpath,
+            self.policy,
+            self.max_bytes,
+        )
+
+    def __contains__(self, key):
+        return self.exists(key)
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM entries').fetchone()[0]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type_, value, trace):
+        self.close()
+        return False
+
+    def _blob_fpath(self, digest):
+        return join(self.dpath, 'blobs', digest[0:2], digest[2:])
+
+    def exists(self, key):
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT 1 FROM entries WHERE key = ?', (key,)
+            ).fetchone()
+        return row is not None
+
+    def keys(self):
+        with self._lock:
+            rows = self._conn.execute('SELECT key FROM entries').fetchall()
+        return [row[0] for row in rows]
+
+    def save(self, key, data):
+        """
+        Writes ``data`` under ``key`` and evicts entries if the store is over
+        its budget. Returns the digest of the blob.
+        """
+        import hashlib
+
+        blob = pickle.dumps(data, protocol=2)
+        digest = hashlib.sha1(blob).hexdigest()
+        fpath = self._blob_fpath(digest)
+        with self._lock:
+            if not exists(fpath):
+                util_path.ensuredir(os.path.dirname(fpath))
+                # Write then rename so readers never see a partial blob
+                tmp_fpath = fpath + '.tmp%d' % (os.getpid(),)
+                with open(tmp_fpath, 'wb') as file_:
+                    file_.write(blob)
+                os.replace(tmp_fpath, fpath)
+            old = self._conn.execute(
+                'SELECT digest FROM entries WHERE key = ?', (key,)
+            ).fetchone()
+            with self._conn:
+                self._conn.execute(
+                    'INSERT OR REPLACE INTO entries (key, digest, nbytes, atime, hits) '
+                    'VALUES (?, ?, ?, ?, 0)',
+                    (key, digest, len(blob), time.time()),
+                )
+            if old is not None and old[0] != digest:
+                self._remove_unreferenced(old[0])
+            if self.verbose > 1:
+                print('[cachestore] save key=%r nbytes=%d' % (key, len(blob)))
+            if self.max_bytes is not None:
+                self.evict(protect=key)
+        return digest
+
+    def load(self, key):
+        """
+        Returns the data stored under ``key``. Raises IOError on a miss, like
+        :func:`load_cache`.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT digest FROM entries WHERE key = ?', (key,)
+            ).fetchone()
+            if row is None:
+                if self.verbose > 1:
+                    print('[cachestore] miss key=%r' % (key,))
+                raise IOError(2, 'No such cache key: %r' % (key,))
+            fpath = self._blob_fpath(row[0])
+            try:
+                with open(fpath, 'rb') as file_:
+                    blob = file_.read()
+            except (IOError, OSError):
+                # The blob was removed behind our back
+                print('CORRUPTED? fpath = %s' % (fpath,))
+                self.delete(key)
+                raise IOError(2, 'Missing blob for cache key: %r' % (key,))
+            with self._conn:
+                self._conn.execute(
+                    'UPDATE entries SET atime = ?, hits = hits + 1 WHERE key = ?',
+                    (time.time(), key),
+                )
+        try:
+            data = pickle.loads(blob)
+        except (EOFError, ValueError, pickle.UnpicklingError) as ex:
+            print('CORRUPTED? fpath = %s' % (fpath,))
+            self.delete(key)
+            raise IOError(str(ex))
+        if self.verbose > 2:
+            print('[cachestore] hit key=%r' % (key,))
+        return data
+
+    def tryload(self, key):
+        """
+        returns None if the key cannot be loaded
+        """
+        try:
+            return self.load(key)
+        except IOError:
+            return None
+
+    def delete(self, key):
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT digest FROM entries WHERE key = ?', (key,)
+            ).fetchone()
+            if row is None:
+                return
+            with self._conn:
+                self._conn.execute('DELETE FROM entries WHERE key = ?', (key,))
+            self._remove_unreferenced(row[0])
+
+    def _remove_unreferenced(self, digest):
+        """ Removes a blob if no key refers to it. Returns the bytes freed """
+        row = self._conn.execute(
+            'SELECT 1 FROM entries WHERE digest = ? LIMIT 1', (digest,)
+        ).fetchone()
+        if row is not None:
+            return 0
+        fpath = self._blob_fpath(digest)
+        try:
+            nbytes = os.path.getsize(fpath)
+            os.remove(fpath)
+        except OSError:
+            nbytes = 0
+        return nbytes
+
+    def total_bytes(self):
+        """ Returns the size of all blobs. Shared blobs are counted once """
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT SUM(nbytes) FROM '
+                '(SELECT DISTINCT digest, nbytes FROM entries)'
+            ).fetchone()
+        return row[0] or 0
+
+    def evict(self, max_bytes=None, protect=None):
+        """
+        Removes entries by the eviction policy until the store fits in
+        ``max_bytes`` (defaults to self.max_bytes). The ``protect`` key is
+        never evicted. Returns the evicted keys.
+        """
+        if max_bytes is None:
+            max_bytes = self.max_bytes
+        if max_bytes is None:
+            return []
+        if self.policy == 'lru':
+            order = 'atime ASC'
+        else:
+            order = 'hits ASC, atime ASC'
+        evicted = []
+        with self._lock:
+            total = self.total_bytes()
+            if total <= max_bytes:
+                return evicted
+            rows = self._conn.execute(
+                'SELECT key, digest FROM entries ORDER BY ' + order
+            ).fetchall()
+            for key, digest in rows:
+                if total <= max_bytes:
+                    break
+                if key == protect:
+                    continue
+                with self._conn:
+                    self._conn.execute('DELETE FROM entries WHERE key = ?', (key,))
+                total -= self._remove_unreferenced(digest)
+                evicted.append(key)
+        if self.verbose > 0 and evicted:
+            print('[cachestore] evicted %d entries' % (len(evicted),))
+        return evicted
+
+    def stats(self):
+        with self._lock:
+            nentries, nblobs, hits = self._conn.execute(
+                'SELECT COUNT(*), COUNT(DISTINCT digest), SUM(hits) FROM entries'
+            ).fetchone()
+        stats = collections.OrderedDict(
+            [
+                ('nentries', nentries),
+                ('nblobs', nblobs),
+                ('nbytes', self.total_bytes()),
+                ('max_bytes', self.max_bytes),
+                ('hits', hits or 0),
+            ]
+        )
+        return stats
+
+    def clear(self):
+        import shutil
+
+        with self._lock:
+            with self._conn:
+                self._conn.execute('DELETE FROM entries')
+            shutil.rmtree(join(self.dpath, 'blobs'))
+            util_path.ensuredir(join(self.dpath, 'blobs'))
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+class PackStore(object):
+    r"""
+    A cache store that packs many small entries into a few append-only
+    shard files instead of writing one file per cfgstr.
+
+    Each key is assigned to one of ``nshards`` pack files. A save appends a
+    record with a checksum and a delete appends a tombstone, so a record is
+    never modified in place. An in-memory index maps each key to the
+    location of its newest record, which makes lookups O(1). The index is
+    rebuilt on open by scanning the record headers, and a partially written
+    record at the end of a shard (e.g. after a crash) is truncated.
+
+    Several processes can share a store. Appends, scans and compaction of a
+    shard hold an advisory lock on ``shard_NNN.pack.lock`` (see
+    :func:`utool.util_io.file_lock`), and a shard that another process
+    compacted is reopened. Records appended by other processes are picked up
+    on a lookup miss. Like file_lock this only excludes other processes, so
+    threads should share one PackStore instance.
+
+    Overwritten and deleted records stay in the shards until
+    :func:`PackStore.compact` rewrites them.
+
+    Like :class:`CacheStore` it can be passed to :class:`Cacher` and
+    :func:`cached_func` or set as the ``store`` of a :class:`Cachable`.
+
+    Args:
+        dpath (str): directory that holds the shards
+        nshards (int): number of pack files (default = 16)
+        fsync (bool): if True each write is flushed to disk before returning
+            (default = False)
+        verbose (int): verbosity flag (default = None)
+
+    CommandLine:
+        python -m utool.util_cache PackStore
+
+    Example:
+        >>> # ENABLE_DOCTEST
+        >>> from utool.util_cache import *  # NOQA
+        >>> import utool as ut
+        >>> dpath = ut.ensure_app_resource_dir('utool', 'test_packstore')
+        >>> ut.delete(dpath)
+        >>> store = PackStore(dpath, nshards=4)
+        >>> for x in range(100):
+        >>>     store.save('sq_%d' % (x,), x ** 2)
+        >>> store.save('sq_3', 'overwritten')
+        >>> store.delete('sq_4')
+        >>> assert store.load('sq_3') == 'overwritten' and 'sq_4' not in store
+        >>> assert len(ut.glob(dpath, '*.pack')) == 4
+        >>> # A torn write at the end of a shard is discarded on open
+        >>> store.close()
+        >>> with open(store._shard_fpath(store._shard_index('sq_5')), 'ab') as file_:
+        >>>     _ = file_.write(b'UTPK\x00')
+        >>> store = PackStore(dpath, nshards=4)
+        >>> assert len(store) == 99 and store.load('sq_5') == 25
+        >>> nbytes = store.stats()['nbytes']
+        >>> store.compact()
+        >>> assert store.stats()['dead_bytes'] == 0
+        >>> assert store.stats()['nbytes'] < nbytes
+        >>> assert store.load('sq_3') == 'overwritten'
+        >>> # Another handle, e.g. in another process, follows the compaction
+        >>> other = PackStore(dpath, nshards=4)
+        >>> store.delete('sq_6')
+        >>> store.compact()
+        >>> other.save('sq_6', 'from other')
+        >>> assert store.load('sq_6') == 'from other'
+        >>> other.close()
+        >>> # Plug the store into a Cacher
+        >>> cacher = ut.Cacher('myfunc', cfgstr='cfg1', store=store, verbose=0)
+        >>> cacher.save([1, 2, 3])
+        >>> assert cacher.load() == [1, 2, 3]
+        >>> store.close()
+        >>> ut.delete(dpath)
+    """
+
+    _MAGIC = b'UTPK'
+    # magic, is_tombstone, key length, data length, crc32 of key and data
+    _HEADER = struct.Struct('<4sBIQI')
+
+    def __init__(self, dpath, nshards=16, fsync=False, verbose=None):
+        if verbose is None:
+            verbose = VERBOSE
+        util_path.ensuredir(dpath)
+        self.dpath = dpath
+        self.nshards = nshards
+        self.fsync = fsync
+        self.verbose = verbose
+        self._lock = threading.RLock()
+        # key -> (shard index, data offset, data length, record length)
+        self._index = {}
+        self._files = [None] * nshards
+        self._scanned = [0] * nshards
+        self._dead_bytes = [0] * nshards
+        for shardx in range(nshards):
+            with self._shard_lock(shardx):
+                self._scan_shard(shardx)
+
+    def __repr__(self):
+        return '<PackStore(dpath=%r, nshards=%d)>' % (self.dpath, self.nshards)
+
+    def __contains__(self, key):
+        return self.exists(key)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._index)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type_, value, trace):
+        self.close()
+        return False
+
+    def _shard_index(self, key):
+        import zlib
+
+        return zlib.crc32(key.encode('utf8')) % self.nshards
+
+    def _shard_fpath(self, shardx):
+        return join(self.dpath, 'shard_%03d.pack' % (shardx,))
+
+    def _shard_file(self, shardx):
+        file_ = self._files[shardx]
+        if file_ is None:
+            file_ = open(self._shard_fpath(shardx), 'a+b')
+            self._files[shardx] = file_
+        return file_
+
+    def _shard_lock(self, shardx):
+        """ excludes other processes from appending to or rewriting a shard """
+        return util_io.file_lock(self._shard_fpath(shardx))
+
+    def _reopen_if_replaced(self, shardx):
+        """
+        Forgets a shard that another process compacted since it was opened.
+        Must hold the shard lock.
+        """
+        file_ = self._files[shardx]
+        if file_ is None:
+            return
+        try:
+            replaced = (
+                os.fstat(file_.fileno()).st_ino
+                != os.stat(self._shard_fpath(shardx)).st_ino
+            )
+        except OSError:
+            replaced = True
+        if replaced:
+            file_.close()
+            self._files[shardx] = None
+            for key in [key for key, loc in self._index.items() if loc[0] == shardx]:
+                del self._index[key]
+            self._scanned[shardx] = 0
+            self._dead_bytes[shardx] = 0
+
+    def _scan_shard(self, shardx):
+        """
+        Adds the records after the last scanned position to the index and
+        truncates a torn record at the end of the shard. Must hold the shard
+        lock, so a record at the end is never one that is still being written.
+        """
+        self._reopen_if_replaced(shardx)
+        file_ = self._shard_file(shardx)
+        file_.seek(0, os.SEEK_END)
+        end = file_.tell()
+        offset = self._scanned[shardx]
+        header_size = self._HEADER.size
+        while offset < end:
+            file_.seek(offset)
+            header = file_.read(header_size)
+            if len(header) < header_size:
+                break
+            magic, is_dead, keylen, datalen, _ = self._HEADER.unpack(header)
+            reclen = header_size + keylen + datalen
+            if magic != self._MAGIC or offset + reclen > end:
+                break
+            key = file_.read(keylen).decode('utf8')
+            self._remove_from_index(key)
+            if is_dead:
+                self._dead_bytes[shardx] += reclen
+            else:
+                data_offset = offset + header_size + keylen
+                self._index[key] = (shardx, data_offset, datalen, reclen)
+            offset += reclen
+        if offset < end:
+            fpath = self._shard_fpath(shardx)
+            print('[packstore] truncating torn record in %s' % (fpath,))
+            file_.truncate(offset)
+        self._scanned[shardx] = offset
+
+    def _remove_from_index(self, key):
+        old = self._index.pop(key, None)
+        if old is not None:
+            self._dead_bytes[old[0]] += old[3]
+
+    def _append(self, shardx, key, blob, is_dead=False):
+        import zlib
+
+        keybytes = key.encode('utf8')
+        crc = zlib.crc32(blob, zlib.crc32(keybytes)) & 0xFFFFFFFF
+        header = self._HEADER.pack(self._MAGIC, is_dead, len(keybytes), len(blob), crc)
+        with self._shard_lock(shardx):
+            # Pick up records other processes appended before we write ours
+            self._scan_shard(shardx)
+            file_ = self._shard_file(shardx)
+            file_.seek(0, os.SEEK_END)
+            offset = file_.tell()
+            file_.write(header + keybytes + blob)
+            file_.flush()
+            if self.fsync:
+                os.fsync(file_.fileno())
+        reclen = len(header) + len(keybytes) + len(blob)
+        self._scanned[shardx] = offset + reclen
+        return offset + len(header) + len(keybytes), reclen
+
+    def exists(self, key):
+        with self._lock:
+            if key not in self._index:
+                shardx = self._shard_index(key)
+                with self._shard_lock(shardx):
+                    self._scan_shard(shardx)
+            return key in self._index
+
+    def keys(self):
+        with self._lock:
+            return list(self._index.keys())
+
+    def save(self, key, data):
+        blob = pickle.dumps(data, protocol=2)
+        shardx = self._shard_index(key)
+        with self._lock:
+            offset, reclen = self._append(shardx, key, blob)
+            self._remove_from_index(key)
+            self._index[key] = (shardx, offset, len(blob), reclen)
+        if self.verbose > 1:
+            print('[packstore] save key=%r nbytes=%d' % (key, len(blob)))
+
+    def load(self, key):
+        """
+        Returns the data stored under ``key``. Raises IOError on a miss, like
+        :func:`load_cache`.
+        """
+        import zlib
+
+        with self._lock:
+            if not self.exists(key):
+                if self.verbose > 1:
+                    print('[packstore] miss key=%r' % (key,))
+                raise IOError(2, 'No such cache key: %r' % (key,))
+            shardx, offset, datalen, reclen = self._index[key]
+            file_ = self._shard_file(shardx)
+            header_offset = offset - len(key.encode('utf8')) - self._HEADER.size
+            file_.seek(header_offset)
+            crc = self._HEADER.unpack(file_.read(self._HEADER.size))[4]
+            keybytes = file_.read(offset - header_offset - self._HEADER.size)
+            blob = file_.read(datalen)
+        if zlib.crc32(blob, zlib.crc32(keybytes)) & 0xFFFFFFFF != crc:
+            print('CORRUPTED? key = %r in %s' % (key, self._shard_fpath(shardx)))
+            raise IOError('Checksum mismatch for cache key: %r' % (key,))
+        return pickle.loads(blob)
+
+    def tryload(self, key):
+        """
+        returns None if the key cannot be loaded
+        """
+        try:
+            return self.load(key)
+        except IOError:
+            return None
+
+    def delete(self, key):
+        with self._lock:
+            if not self.exists(key):
+                return
+            shardx = self._shard_index(key)
+            _, reclen = self._append(shardx, key, b'', is_dead=True)
+            self._remove_from_index(key)
+            self._dead_bytes[shardx] += reclen
+
+    def compact(self, min_dead_fraction=0.0):
+        """
+        Rewrites shards without their overwritten and deleted records. Only
+        shards where the dead bytes are more than ``min_dead_fraction`` of the
+        shard are rewritten. Each shard is written to a temporary file and
+        renamed, so a crash during compaction loses nothing.
+        """
+        with self._lock:
+            for shardx in range(self.nshards):
+                with self._shard_lock(shardx):
+                    self._compact_shard(shardx, min_dead_fraction)
+
+    def _compact_shard(self, shardx, min_dead_fraction):
+        """ rewrites one shard. Must hold the shard lock. """
+        self._scan_shard(shardx)
+        dead = self._dead_bytes[shardx]
+        if dead == 0 or dead <= min_dead_fraction * self._scanned[shardx]:
+            return
+        live = [(key, loc) for key, loc in self._index.items() if loc[0] == shardx]
+        fpath = self._shard_fpath(shardx)
+        tmp_fpath = fpath + '.tmp'
+        src = self._shard_file(shardx)
+        new_locs = []
+        with open(tmp_fpath, 'wb') as dst:
+            for key, (_, offset, datalen, reclen) in live:
+                src.seek(offset + datalen - reclen)
+                record = src.read(reclen)
+                new_offset = dst.tell() + (reclen - datalen)
+                dst.write(record)
+                new_locs.append((key, (shardx, new_offset, datalen, reclen)))
+            dst.flush()
+            os.fsync(dst.fileno())
+        src.close()
+        self._files[shardx] = None
+        os.replace(tmp_fpath, fpath)
+        self._index.update(new_locs)
+        self._scanned[shardx] = sum(loc[3] for _, loc in new_locs)
+        self._dead_bytes[shardx] = 0
+        if self.verbose > 0:
+            print('[packstore] compacted %s, freed %d bytes' % (basename(fpath), dead))
+
+    def stats(self):
+        with self._lock:
+            stats = collections.OrderedDict(
+                [
+                    ('nentries', len(self._index)),
+                    ('nshards', self.nshards),
+                    ('nbytes', sum(self._scanned)),
+                    ('dead_bytes', sum(self._dead_bytes)),
+                ]
+            )
+        return stats
+
+    def close(self):
+        with self._lock:
+            for shardx, file_ in enumerate(self._files):
+                if file_ is not None:
+                    file_.close()
+                    self._files[shardx] = None
 
 
 # @util_decor.memoize
@@ -837,12 +2204,22 @@ def cached_func(
     key_kwds=None,
     use_cache=None,
     verbose=None,
+    store=None,
+    mem_size=0,
+    mem_bytes=None,
+    lock=False,
 ):
     r"""
     Wraps a function with a Cacher object
 
     uses a hash of arguments as input
 
+    Results can also be kept in an in-process LRU tier in front of the disk
+    tier, so repeated calls do not unpickle the same data. Memory hits return
+    the same object, so callers must not modify the result. Hit and miss
+    counts of each tier, the time spent loading from disk and the bytes held
+    in memory are in the ``stats`` attribute of the wrapped function.
+
     Args:
         fname (str):  file name (defaults to function name)
         cache_dir (unicode): (default = u'default')
@@ -850,6 +2227,17 @@ def cached_func(
         key_argx (None): (default = None)
         key_kwds (None): (default = None)
         use_cache (bool):  turns on disk based caching(default = None)
+        store (CacheStore): size bounded store to keep results in instead
+            of one file per call (default = None)
+        mem_size (int): number of results kept in memory. 0 disables the
+            memory tier. (default = 0)
+        mem_bytes (int): estimated bytes of results kept in memory
+            (default = None)
+        lock (bool): if True concurrent processes and hosts that miss the
+            same entry wait for one of them to compute it. This leaves an
+            empty ``.lock`` file next to each entry, see
+            :func:`utool.util_io.file_lock`. Threads always wait for each
+            other. (default = False)
 
     CommandLine:
         python -m utool.util_cache --exec-cached_func
@@ -873,6 +2261,27 @@ def cached_func(
         >>> assert ans5 == ans4
         >>> assert ans5 == ans0
         >>> assert ans1 != ans0
+
+    Example:
+        >>> # ENABLE_DOCTEST
+        >>> import utool as ut
+        >>> def costly_func2(a):
+        ...     return [a] * 1000
+        >>> efficient_func = ut.cached_func('costly_func2', appname='utool_test',
+        >>>                                 mem_size=2, verbose=0)(costly_func2)
+        >>> results = [efficient_func(a) for a in [1, 1, 2, 3, 1]]
+        >>> assert results == [[a] * 1000 for a in [1, 1, 2, 3, 1]]
+        >>> stats = efficient_func.stats
+        >>> assert stats['mem_hits'] == 1 and stats['mem_misses'] == 4
+        >>> assert stats['disk_hits'] + stats['disk_misses'] == 4
+        >>> assert len(efficient_func.mem_cache) == 2 and stats['mem_bytes'] > 0
+        >>> # None is remembered like any other result
+        >>> def returns_none(a):
+        ...     return None
+        >>> none_func = ut.cached_func('returns_none', appname='utool_test',
+        >>>                            mem_size=2, verbose=0)(returns_none)
+        >>> assert none_func(1) is None and none_func(1) is None
+        >>> assert none_func.stats['mem_hits'] == 1
     """
     if verbose is None:
         verbose = VERBOSE_CACHE
@@ -887,11 +2296,47 @@ def cached_func(
         if ut.is_method(func):
             # ignore self for methods
             argnames = argnames[1:]
-        cacher = Cacher(fname_, cache_dir=cache_dir, appname=appname, verbose=verbose)
+        cacher = Cacher(
+            fname_,
+            cache_dir=cache_dir,
+            appname=appname,
+            verbose=verbose,
+            store=store,
+            lock=lock,
+        )
         if use_cache is None:
             use_cache_ = not util_arg.get_argflag('--nocache-' + fname_)
         else:
             use_cache_ = use_cache
+        if mem_size:
+            # The wrapper may be called from the threads of generate2
+            mem_cache = ThreadSafeLRUDict(
+                mem_size, max_bytes=mem_bytes, sizer=_estimate_nbytes
+            )
+        else:
+            mem_cache = None
+        stats = collections.OrderedDict(
+            [
+                ('mem_hits', 0),
+                ('mem_misses', 0),
+                ('disk_hits', 0),
+                ('disk_misses', 0),
+                ('load_time', 0.0),
+                ('mem_bytes', 0),
+            ]
+        )
+        # guards stats, which the threads of generate2 update concurrently
+        stats_lock = threading.Lock()
+
+        def _count(key, value=1):
+            with stats_lock:
+                stats[key] += value
+
+        def _mem_store(cfgstr, data):
+            if mem_cache is not None:
+                mem_cache[cfgstr] = data
+                with stats_lock:
+                    stats['mem_bytes'] = mem_cache.nbytes
         # _dbgdict = dict(fname_=fname_, key_kwds=key_kwds, appname=appname,
         #                key_argx=key_argx, use_cache_=use_cache_)
 
@@ -916,10 +2361,31 @@ def cached_func(
                 assert cfgstr is not None, 'cfgstr=%r cannot be None' % (cfgstr,)
                 use_cache__ = kwargs.pop('use_cache', use_cache_)
                 if use_cache__:
+                    if mem_cache is not None:
+                        # None is a valid cached result
+                        data = mem_cache.get(cfgstr, NoParam)
+                        if data is not NoParam:
+                            _count('mem_hits')
+                            return data
+                        _count('mem_misses')
                     # Make cfgstr from specified input
+                    tt = time.time()
                     data = cacher.tryload(cfgstr)
-                    if data is not None:
-                        return data
+                    _count('load_time', time.time() - tt)
+                    if data is None:
+                        with cacher.single_flight(cfgstr):
+                            # Another caller may have computed it while we waited
+                            if cacher.exists(cfgstr):
+                                data = cacher.tryload(cfgstr)
+                            if data is None:
+                                _count('disk_misses')
+                                data = func(*args, **kwargs)
+                                cacher.save(data, cfgstr)
+                                _mem_store(cfgstr, data)
+                                return data
+                    _count('disk_hits')
+                    _mem_store(cfgstr, data)
+                    return data
                 # Cached missed compute function
                 data = func(*args, **kwargs)
                 # Cache save
@@ -946,6 +2412,8 @@ def cached_func(
         # Give function a handle to the cacher object
         cached_wraper = util_decor.preserve_sig(cached_wraper, func)
         cached_wraper.cacher = cacher
+        cached_wraper.mem_cache = mem_cache
+        cached_wraper.stats = stats
         return cached_wraper
 
     return cached_closure
@@ -1008,80 +2476,102 @@ def shelf_open(fpath):
 #        self.shelf = shelve.open(shelf_fpath)
 
 
-class GlobalShelfContext(object):
-    """ older class. might need update """
+def get_global_kv_fpath(appname='default', ensure=False):
+    """ Returns the filepath to the global key value store """
+    global_cache_dir = get_global_cache_dir(appname, ensure=ensure)
+    kv_fpath = join(global_cache_dir, meta_util_constants.global_kv_fname)
+    return kv_fpath
 
-    def __init__(self, appname):
-        self.appname = appname
 
-    def __enter__(self):
-        # self.shelf = get_global_shelf(self.appname)
+# (appname, pid) -> SqliteKVStore. Connections are not shared with forks.
+__GLOBAL_KV_STORES__ = {}
 
-        try:
-            import dbm
 
-            DBMError = dbm.error
-        except Exception:
-            DBMError = OSError
+def get_global_kv_store(appname='default'):
+    """
+    Returns the long lived global key value store of an application. The
+    values of an old global shelf are copied into it when it is created.
+    """
+    if appname is None or appname == 'default':
+        appname = get_default_appname()
+    key = (appname, os.getpid())
+    store = __GLOBAL_KV_STORES__.get(key, None)
+    if store is None:
+        kv_fpath = get_global_kv_fpath(appname, ensure=True)
+        is_new = not exists(kv_fpath)
+        if VERBOSE:
+            print('[cache] open: ' + kv_fpath)
+        store = SqliteKVStore(kv_fpath)
+        if is_new:
+            _migrate_global_shelf(appname, store)
+        __GLOBAL_KV_STORES__[key] = store
+    return store
+
+
+def _migrate_global_shelf(appname, store):
+    _migrate_shelf(get_global_shelf_fpath(appname), store)
+
+
+def _migrate_shelf(shelf_fpath, store):
+    """ copies the items of an old shelf into a SqliteKVStore """
+    try:
+        with contextlib.closing(shelve.open(shelf_fpath, 'r')) as shelf:
+            items = list(shelf.items())
+    except Exception:
+        # No old shelf or one written by another dbm version
+        return
+    store.set_many(items)
 
-        try:
-            shelf_fpath = get_global_shelf_fpath(self.appname, ensure=True)
-            if VERBOSE:
-                print('[cache] open: ' + shelf_fpath)
-            self.shelf = shelve.open(shelf_fpath)
-        except DBMError as ex:
-            from utool import util_dbg
-
-            util_dbg.printex(
-                ex,
-                'Failed opening shelf_fpath due to bad version, remove and retry',
-                key_list=['shelf_fpath'],
-            )
-            import utool as ut
 
-            ut.delete(shelf_fpath)
-            self.shelf = shelve.open(shelf_fpath)
-        except Exception as ex:
-            from utool import util_dbg
+class GlobalShelfContext(object):
+    """ older class. Returns the global key value store """
 
-            util_dbg.printex(ex, 'Failed opening shelf_fpath', key_list=['shelf_fpath'])
-            raise
+    def __init__(self, appname):
+        self.appname = appname
+
+    def __enter__(self):
+        self.shelf = get_global_kv_store(self.appname)
         return self.shelf
 
     def __exit__(self, type_, value, trace):
-        self.shelf.close()
         if trace is not None:
             print('[cache] Error under GlobalShelfContext!: ' + str(value))
             return False  # return a falsey value on error
-        # close_global_shelf(self.appname)
 
 
 def global_cache_read(key, appname='default', **kwargs):
-    with GlobalShelfContext(appname) as shelf:
-        if 'default' in kwargs:
-            return shelf.get(key, kwargs['default'])
-        else:
-            return shelf[key]
+    store = get_global_kv_store(appname)
+    if 'default' in kwargs:
+        return store.get(key, kwargs['default'])
+    else:
+        return store[key]
 
 
 def global_cache_dump(appname='default'):
-    shelf_fpath = get_global_shelf_fpath(appname)
-    print('shelf_fpath = %r' % shelf_fpath)
-    with GlobalShelfContext(appname) as shelf:
-        print(util_str.repr4(shelf))
+    kv_fpath = get_global_kv_fpath(appname)
+    print('kv_fpath = %r' % kv_fpath)
+    print(util_str.repr4(dict(get_global_kv_store(appname).items())))
 
 
 def global_cache_write(key, val, appname='default'):
     """ Writes cache files to a safe place in each operating system """
-    with GlobalShelfContext(appname) as shelf:
-        shelf[key] = val
+    get_global_kv_store(appname)[key] = val
 
 
 def delete_global_cache(appname='default'):
     """ Reads cache files to a safe place in each operating system """
-    # close_global_shelf(appname)
+    if appname is None or appname == 'default':
+        appname = get_default_appname()
+    store = __GLOBAL_KV_STORES__.pop((appname, os.getpid()), None)
+    if store is not None:
+        store.close()
+    kv_fpath = get_global_kv_fpath(appname)
+    for fpath in [kv_fpath, kv_fpath + '-wal', kv_fpath + '-shm']:
+        if exists(fpath):
+            util_path.remove_file(fpath, verbose=True, dryrun=False)
     shelf_fpath = get_global_shelf_fpath(appname)
-    util_path.remove_file(shelf_fpath, verbose=True, dryrun=False)
+    if exists(shelf_fpath):
+        util_path.remove_file(shelf_fpath, verbose=True, dryrun=False)
 
 
 # import abc  # abstract base class
@@ -1097,9 +2587,18 @@ class Cachable(object):
 
     must implement get_cfgstr()
 
+    Set ``store`` to a :class:`CacheStore` to keep the object dictionarys in
+    a size bounded store instead of one file per cfgstr.
+
+    Set ``depends`` (or override get_depends) to track upstream dependencies
+    like :class:`Cacher` does. A stale object raises an IOError on load.
+    Like in a Cacher, dependencies cannot be tracked with a store.
+
     """
 
     ext = '.cPkl'  # TODO: Capt'n Proto backend to replace pickle backend
+    store = None
+    depends = None
 
     # @abc.abstractmethod
     def get_cfgstr(self):
@@ -1139,16 +2638,35 @@ class Cachable(object):
         fpath = _args2_fpath(_dpath, _fname, _cfgstr, _ext)
         return fpath
 
+    def get_store_key(self, cfgstr=None):
+        _cfgstr = self.get_cfgstr() if cfgstr is None else cfgstr
+        return _args2_fname(self.get_prefix(), _cfgstr)
+
+    def get_depends(self):
+        return self.depends
+
     def delete(
         self, cachedir=None, cfgstr=None, verbose=True or VERBOSE or util_arg.VERBOSE
     ):
         """
         saves query result to directory
         """
+        if self.store is not None:
+            key = self.get_store_key(cfgstr)
+            if verbose:
+                print('[Cachable] cache delete: %r' % (key,))
+            self.store.delete(key)
+            return
         fpath = self.get_fpath(cachedir, cfgstr=cfgstr)
         if verbose:
             print('[Cachable] cache delete: %r' % (basename(fpath),))
-        os.remove(fpath)
+        if os.path.isdir(fpath):
+            # memory mapped formats are directories
+            import shutil
+
+            shutil.rmtree(fpath)
+        else:
+            os.remove(fpath)
 
     @profile
     def save(
@@ -1157,7 +2675,12 @@ class Cachable(object):
         """
         saves query result to directory
         """
-        fpath = self.get_fpath(cachedir, cfgstr=cfgstr)
+        if self.store is not None:
+            if self.get_depends():
+                raise ValueError('Dependency tracking requires a file based Cacher')
+            fpath = self.get_store_key(cfgstr)
+        else:
+            fpath = self.get_fpath(cachedir, cfgstr=cfgstr)
         if verbose:
             print('[Cachable] cache save: %r' % (basename(fpath),))
 
@@ -1175,14 +2698,23 @@ class Cachable(object):
                 if key not in ignore_keys
             }
 
-        util_io.save_data(fpath, save_dict)
+        if self.store is not None:
+            self.store.save(fpath, save_dict)
+        else:
+            util_io.save_data(fpath, save_dict)
+            depends = self.get_depends()
+            if depends:
+                write_dependency_record(fpath, depends)
         return fpath
         # save_cache(cachedir, '', cfgstr, self.__dict__)
         # with open(fpath, 'wb') as file_:
         #    pickle.dump(self.__dict__, file_)
 
     def _unsafe_load(self, fpath, ignore_keys=None):
-        loaded_dict = util_io.load_data(fpath)
+        if self.store is not None:
+            loaded_dict = self.store.load(fpath)
+        else:
+            loaded_dict = util_io.load_data(fpath)
         if ignore_keys is not None:
             for key in ignore_keys:
                 if key in loaded_dict:
@@ -1234,10 +2766,23 @@ class Cachable(object):
         """
         if verbose is None:
             verbose = getattr(self, 'verbose', VERBOSE)
+        if self.store is not None:
+            if self.get_depends():
+                raise ValueError('Dependency tracking requires a file based Cacher')
+            if fpath is None:
+                fpath = self.get_store_key(cfgstr)
+            if verbose:
+                print('[Cachable] cache tryload: %r' % (fpath,))
+            self._unsafe_load(fpath, ignore_keys)
+            return
         if fpath is None:
             fpath = self.get_fpath(cachedir, cfgstr=cfgstr)
         if verbose:
             print('[Cachable] cache tryload: %r' % (basename(fpath),))
+        depends = self.get_depends()
+        if depends and exists(fpath):
+            if check_dependency_record(fpath, depends, verbose=verbose):
+                raise IOError(2, 'Stale cache: %r' % (fpath,))
         try:
             self._unsafe_load(fpath, ignore_keys)
             if verbose:
@@ -1282,6 +2827,23 @@ class Cachable(object):
             raise
 
 
+def _estimate_nbytes(value):
+    """
+    Cheap estimate of the memory used by a cached value
+    """
+    import sys
+
+    nbytes = getattr(value, 'nbytes', None)
+    if isinstance(nbytes, six.integer_types):
+        # numpy arrays
+        return nbytes
+    if isinstance(value, (six.binary_type, six.text_type)):
+        return sys.getsizeof(value)
+    from utool import util_dev
+
+    return util_dev.get_object_nbytes(value)
+
+
 def get_lru_cache(max_size=5):
     """
     Args:
@@ -1326,11 +2888,22 @@ class LRUDict(object):
     """
     Pure python implementation for lru cache fallback
 
+    Hits are O(1) with OrderedDict.move_to_end. The cache can be bounded by
+    the number of items, by the estimated bytes of the values, or both, and
+    items can expire after ``ttl`` seconds.
+
     References:
         http://www.kunxi.org/blog/2014/05/lru-cache-in-python/
 
     Args:
-        max_size (int): (default = 5)
+        max_size (int): maximum number of items (default = 5)
+        max_bytes (int): maximum estimated bytes of the values. Values are
+            sized with ``sizer`` when they are inserted. (default = None)
+        ttl (float): seconds after insertion that an item expires
+            (default = None)
+        sizer (func): returns the size of a value in bytes. Defaults to the
+            ndarray ``nbytes`` or ``get_object_nbytes``. Values are only sized
+            if ``max_bytes`` or ``sizer`` is given. (default = None)
 
     Returns:
         LRUDict: cache_obj
@@ -1360,20 +2933,74 @@ class LRUDict(object):
             6: 6,
             7: 7,
         })
+
+    Example:
+        >>> # ENABLE_DOCTEST
+        >>> from utool.util_cache import *  # NOQA
+        >>> import numpy as np
+        >>> self = LRUDict(max_size=None, max_bytes=3000, ttl=60)
+        >>> for key in 'abcd':
+        ...     self[key] = np.zeros(1000, dtype=np.uint8)
+        >>> assert list(self.keys()) == ['b', 'c', 'd'] and self.nbytes == 3000
+        >>> self.ttl = 0
+        >>> assert 'b' not in self and len(self) == 0 and self.nbytes == 0
+        >>> self = LRUDict(max_size=0, sizer=len)
+        >>> self['a'] = [1, 2]
+        >>> assert len(self) == 0 and self.nbytes == 0
     """
 
-    def __init__(self, max_size):
+    __slots__ = (
+        '_max_size',
+        'max_bytes',
+        'ttl',
+        'sizer',
+        'nbytes',
+        '_cache',
+        '_nbytes',
+        '_expires',
+    )
+
+    def __init__(self, max_size=5, max_bytes=None, ttl=None, sizer=None):
+        if sizer is None and max_bytes is not None:
+            sizer = _estimate_nbytes
         self._max_size = max_size
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.sizer = sizer
+        self.nbytes = 0
         self._cache = collections.OrderedDict()
+        self._nbytes = {}
+        self._expires = {}
 
     def has_key(self, item):
         return item in self
 
+    def _expired(self, key):
+        if self.ttl is None:
+            return False
+        if time.time() - self._expires[key] < self.ttl:
+            return False
+        self._remove(key)
+        return True
+
+    def _remove(self, key):
+        del self._cache[key]
+        self._expires.pop(key, None)
+        self.nbytes -= self._nbytes.pop(key, 0)
+
+    def expire(self):
+        """
+        Removes all expired items
+        """
+        if self.ttl is not None:
+            for key in list(self._cache.keys()):
+                self._expired(key)
+
     def __contains__(self, item):
-        return item in self._cache
+        return item in self._cache and not self._expired(item)
 
     def __delitem__(self, key):
-        del self._cache[key]
+        self._remove(key)
 
     def __str__(self):
         import utool as ut
@@ -1387,49 +3014,145 @@ class LRUDict(object):
         # return repr(self._cache)
 
     def __iter__(self):
+        self.expire()
         return iter(self._cache)
 
     def items(self):
+        self.expire()
         return self._cache.items()
 
     def keys(self):
+        self.expire()
         return self._cache.keys()
 
     def values(self):
+        self.expire()
         return self._cache.values()
 
     def iteritems(self):
-        return self._cache.iteritems()
+        return iter(self.items())
 
     def iterkeys(self):
-        return self._cache.iterkeys()
+        return iter(self.keys())
 
     def itervalues(self):
-        return self._cache.itervalues()
+        return iter(self.values())
 
     def clear(self):
-        return self._cache.clear()
+        self._cache.clear()
+        self._nbytes.clear()
+        self._expires.clear()
+        self.nbytes = 0
 
     def __len__(self):
+        self.expire()
         return len(self._cache)
 
     def __getitem__(self, key):
+        if self._expired(key):
+            raise KeyError(key)
+        self._cache.move_to_end(key)
+        return self._cache[key]
+
+    def get(self, key, default=None):
         try:
-            value = self._cache.pop(key)
-            self._cache[key] = value
-            return value
+            return self[key]
         except KeyError:
-            raise
+            return default
 
     def __setitem__(self, key, value):
-        try:
-            self._cache.pop(key)
-        except KeyError:
-            if len(self._cache) >= self._max_size:
-                self._cache.popitem(last=False)
+        if self._max_size == 0:
+            # the cache holds nothing, so do not size or evict
+            return
+        if key in self._cache:
+            self._remove(key)
+        if self.sizer is not None:
+            nbytes = self.sizer(value)
+            if self.max_bytes is not None:
+                if nbytes > self.max_bytes:
+                    # Never evict everything for a value that cannot fit
+                    return
+                while self._cache and self.nbytes + nbytes > self.max_bytes:
+                    self._remove(next(iter(self._cache)))
+            self._nbytes[key] = nbytes
+            self.nbytes += nbytes
+        if self._max_size is not None:
+            while self._cache and len(self._cache) >= self._max_size:
+                self._remove(next(iter(self._cache)))
+        if self.ttl is not None:
+            self._expires[key] = time.time()
         self._cache[key] = value
 
 
+class ThreadSafeLRUDict(LRUDict):
+    """
+    LRUDict that can be shared between threads, e.g. the workers of a
+    threaded :func:`utool.generate2`.
+
+    Example:
+        >>> # ENABLE_DOCTEST
+        >>> from utool.util_cache import *  # NOQA
+        >>> import utool as ut
+        >>> self = ThreadSafeLRUDict(max_size=10)
+        >>> def work(x):
+        ...     self[x % 20] = x
+        ...     return self.get(x % 20)
+        >>> results = list(ut.generate2(work, zip(range(1000)), nprocs=4,
+        >>>                             futures_threaded=True, verbose=0))
+        >>> assert len(self) == 10
+    """
+
+    __slots__ = ('_lock',)
+
+    def __init__(self, *args, **kwargs):
+        super(ThreadSafeLRUDict, self).__init__(*args, **kwargs)
+        self._lock = threading.RLock()
+
+    def __contains__(self, item):
+        with self._lock:
+            return super(ThreadSafeLRUDict, self).__contains__(item)
+
+    def __delitem__(self, key):
+        with self._lock:
+            return super(ThreadSafeLRUDict, self).__delitem__(key)
+
+    def __getitem__(self, key):
+        with self._lock:
+            return super(ThreadSafeLRUDict, self).__getitem__(key)
+
+    def __setitem__(self, key, value):
+        with self._lock:
+            return super(ThreadSafeLRUDict, self).__setitem__(key, value)
+
+    def __len__(self):
+        with self._lock:
+            return super(ThreadSafeLRUDict, self).__len__()
+
+    def __iter__(self):
+        with self._lock:
+            return iter(list(super(ThreadSafeLRUDict, self).__iter__()))
+
+    def items(self):
+        with self._lock:
+            return list(super(ThreadSafeLRUDict, self).items())
+
+    def keys(self):
+        with self._lock:
+            return list(super(ThreadSafeLRUDict, self).keys())
+
+    def values(self):
+        with self._lock:
+            return list(super(ThreadSafeLRUDict, self).values())
+
+    def expire(self):
+        with self._lock:
+            return super(ThreadSafeLRUDict, self).expire()
+
+    def clear(self):
+        with self._lock:
+            return super(ThreadSafeLRUDict, self).clear()
+
+
 def time_different_diskstores():
     """
     %timeit shelf_write_test()    # 15.1 ms per loop
@@ -9,12 +9,15 @@ TODO: the same hashing algorithm should be used everywhere
 Currently there is a mix of sha1, sha256, and sha512 in different places.
 """
 from __future__ import absolute_import, division, print_function, unicode_literals
+import collections
 import hashlib
-import copy
+import itertools as it
+import math
 import os
 import six
 import uuid
 import random
+import struct
 import warnings
 from six.moves import zip, map
 from utool import util_inject
@@ -192,6 +195,90 @@ BIGBASE = len(ALPHABET)
 DictProxyType = type(object.__dict__)
 
 
+def _fast_backend_name():
+    for name in ['xxh3_128', 'blake3']:
+        if name in HASH_BACKENDS:
+            try:
+                HASH_BACKENDS[name]()
+                return name
+            except ImportError:
+                pass
+    return 'blake2b'
+
+
+def _xxh3_128():
+    import xxhash
+
+    return xxhash.xxh3_128()
+
+
+def _xxh64():
+    import xxhash
+
+    return xxhash.xxh64()
+
+
+def _blake3():
+    import blake3
+
+    return blake3.blake3()
+
+
+# name -> function that returns a new hasher. hashlib backends are always
+# available. xxhash and blake3 are used if they are installed.
+HASH_BACKENDS = {
+    'sha512': hashlib.sha512,
+    'sha256': hashlib.sha256,
+    'sha1': hashlib.sha1,
+    'md5': hashlib.md5,
+    'blake2b': hashlib.blake2b,
+    'xxh3_128': _xxh3_128,
+    'xxh64': _xxh64,
+    'blake3': _blake3,
+}
+
+# The backend of hash_data. Changing it changes every hash, and thus every
+# cache key built from one.
+DEFAULT_HASH_BACKEND = 'sha512'
+
+
+def get_hasher(hasher=None):
+    """
+    Returns a new hasher object.
+
+    Args:
+        hasher (str or func or hasher): a name in HASH_BACKENDS, 'fast' for
+            the fastest installed non-cryptographic backend, a function that
+            returns a hasher, or a hasher object which is returned as is.
+            (default = DEFAULT_HASH_BACKEND)
+
+    Example:
+        >>> # ENABLE_DOCTEST
+        >>> from utool.util_hash import *  # NOQA
+        >>> assert get_hasher().name == 'sha512'
+        >>> assert get_hasher('sha1').name == 'sha1'
+        >>> assert hasattr(get_hasher('fast'), 'update')
+    """
+    if hasher is None:
+        hasher = DEFAULT_HASH_BACKEND
+    if isinstance(hasher, six.string_types):
+        if hasher == 'fast':
+            hasher = _fast_backend_name()
+        try:
+            factory = HASH_BACKENDS[hasher]
+        except KeyError:
+            raise ValueError(
+                'Unknown hash backend %r. Choose from %r' % (hasher, sorted(HASH_BACKENDS))
+            )
+        return factory()
+    elif hasattr(hasher, 'update'):
+        return hasher
+    elif callable(hasher):
+        return hasher()
+    else:
+        raise TypeError('Cannot make a hasher from %r' % (hasher,))
+
+
 def make_hash(o):
     r"""
     Makes a hash from a dictionary, list, tuple or set to any level, that
@@ -219,9 +306,8 @@ def make_hash(o):
         return tuple([make_hash(e) for e in o])
     elif not isinstance(o, dict):
         return hash(o)
-    new_o = copy.deepcopy(o)
-    for k, v in new_o.items():
-        new_o[k] = make_hash(v)
+    # The values are replaced by their hashes, so the dict is never copied
+    new_o = {k: make_hash(v) for k, v in o.items()}
     return hash(tuple(frozenset(sorted(new_o.items()))))
 
 
@@ -307,6 +393,16 @@ if six.PY3:
     stringlike = (str, bytes)  # NOQA
 
 
+def _ndarray_header(arr):
+    """ dtype and shape of an ndarray, so equal bytes with a different layout
+    do not collide. Only used by hash_version 2. """
+    if arr.dtype.names is None:
+        dtype_str = arr.dtype.str
+    else:
+        dtype_str = repr(arr.dtype.descr)
+    return b'NDARR' + dtype_str.encode('ascii') + repr(arr.shape).encode('ascii')
+
+
 def _covert_to_hashable(data):
     r"""
     Args:
@@ -347,18 +443,23 @@ def _covert_to_hashable(data):
         prefix = b'UUID'
     elif isinstance(data, int):
         # warnings.warn('[util_hash] Hashing ints is slow, numpy is prefered')
-        hashable = _int_to_bytes(data)
+        # bools hash like the ints they equal
+        if data < 0:
+            hashable = b'NEG' + _int_to_bytes(-data)
+        else:
+            hashable = _int_to_bytes(data)
         # hashable = data.to_bytes(8, byteorder='big')
         prefix = b'INT'
-    # elif isinstance(data, float):
-    #     hashable = repr(data).encode('utf8')
-    #     prefix = b'FLT'
-    elif util_type.HAVE_NUMPY and isinstance(data, np.int64):
+    elif isinstance(data, float):
+        hashable = b'FLT' + struct.pack('>d', data)
+        prefix = b'FLT'
+    elif data is None:
+        hashable = b'NONE'
+        prefix = b'NONE'
+    elif util_type.HAVE_NUMPY and isinstance(data, (np.integer, np.bool_)):
         return _covert_to_hashable(int(data))
-    elif util_type.HAVE_NUMPY and isinstance(data, np.float64):
-        a, b = float(data).as_integer_ratio()
-        hashable = a.to_bytes(8, byteorder='big') + b.to_bytes(8, byteorder='big')
-        prefix = b'FLOAT'
+    elif util_type.HAVE_NUMPY and isinstance(data, np.floating):
+        return _covert_to_hashable(float(data))
     else:
         raise TypeError('unknown hashable type=%r' % (type(data)))
         # import bencode
@@ -368,11 +469,37 @@ def _covert_to_hashable(data):
     return prefix, hashable
 
 
-def _update_hasher(hasher, data):
+def _update_hasher(hasher, data, hash_version=1):
     """
     This is the clear winner over the generate version.
     Used by hash_data
 
+    Nested data is walked with an explicit stack instead of recursion, so
+    deep or long containers do not hit the recursion limit and nothing is
+    copied. Dicts and sets hash the same regardless of their order.
+    See hash_data for hash_version.
+
+    Example:
+        >>> # ENABLE_DOCTEST
+        >>> from utool.util_hash import *  # NOQA
+        >>> from utool.util_hash import _update_hasher
+        >>> def digest(data):
+        >>>     hasher = hashlib.sha1()
+        >>>     _update_hasher(hasher, data)
+        >>>     return hasher.hexdigest()
+        >>> assert digest({'a': 1, 'b': [2, 3]}) == digest({'b': [2, 3], 'a': 1})
+        >>> assert digest({1, 2, 3}) == digest(frozenset([3, 2, 1]))
+        >>> assert digest([1.5, None, True]) != digest([1.5, None, False])
+        >>> assert digest({'a': 1}) != digest({'a': 2})
+        >>> # keys and set items cannot run into their neighbors
+        >>> assert digest({'a': 'b:c'}) != digest({'a:b': 'c'})
+        >>> assert digest({'a', 'b'}) != digest({'aSEPb'})
+        >>> assert digest(['a', ('b', 'c')]) == digest(['a', ['b', 'c']])
+        >>> deep = []
+        >>> for _ in range(10000):
+        >>>     deep = [deep]
+        >>> assert len(digest(deep)) == 40
+
     Ignore:
         import utool
         rng = np.random.RandomState(0)
@@ -447,44 +574,179 @@ def _update_hasher(hasher, data):
         hasher.update(np.array(['1'], dtype=object))
         print(hasher.hexdigest())
 
+        # Large config dicts against hashing their sorted repr, which is what
+        # callers did before dicts were supported
+        cfg = {'cfg%d' % i: {'sz': i, 'name': 'feat_%d' % i,
+                             'flags': [True, False, i],
+                             'sub': {'k%d' % j: j for j in range(10)}}
+               for i in range(2000)}
+        %timeit hash_data(cfg)
+        %timeit hashstr27(repr(sorted(cfg.items())))
+        %timeit make_hash(cfg)
     """
-    if isinstance(data, (tuple, list, zip)):
-        needs_iteration = True
-    elif util_type.HAVE_NUMPY and isinstance(data, np.ndarray) and data.dtype.kind == 'O':
-        # ndarrays of objects cannot be hashed directly.
-        needs_iteration = True
-    else:
-        needs_iteration = False
-
-    if needs_iteration:
-        # try to nest quickly without recursive calls
-        SEP = b'SEP'
-        iter_prefix = b'ITER'
-        # if isinstance(data, tuple):
-        #     iter_prefix = b'TUP'
-        # else:
-        #     iter_prefix = b'LIST'
-        iter_ = iter(data)
-        hasher.update(iter_prefix)
-        try:
-            for item in iter_:
-                prefix, hashable = _covert_to_hashable(data)
-                binary_data = SEP + prefix + hashable
-                # b''.join([SEP, prefix, hashable])
-                hasher.update(binary_data)
-        except TypeError:
-            # need to use recursive calls
-            # Update based on current item
-            _update_hasher(hasher, item)
-            for item in iter_:
-                # Ensure the items have a spacer between them
-                hasher.update(SEP)
-                _update_hasher(hasher, item)
-    else:
-        prefix, hashable = _covert_to_hashable(data)
-        binary_data = prefix + hashable
-        # b''.join([prefix, hashable])
-        hasher.update(binary_data)
+    update = hasher.update
+    # Small pieces are joined before they are hashed, which is much faster
+    # than one update per leaf
+    parts = []
+    append = parts.append
+    # Each frame is an iterator over the pieces of one container
+    stack = [iter([data])]
+    while stack:
+        if len(stack) > _MAX_HASH_DEPTH:
+            raise ValueError('Cannot hash data nested deeper than %d' % (_MAX_HASH_DEPTH,))
+        for data in stack[-1]:
+            type_ = type(data)
+            # Raw bytes are also used for the separators and prefixes of the
+            # frames. They hash the same as a bytes leaf would.
+            if type_ is bytes:
+                append(data)
+            elif type_ is str:
+                append(data.encode('utf-8'))
+            elif type_ is int and data >= 0:
+                # inlined _int_to_bytes
+                append(data.to_bytes(max(4, data.bit_length()), 'big'))
+            elif isinstance(data, (tuple, list, zip)):
+                append(b'ITER')
+                stack.append(_separated(data))
+                break
+            elif isinstance(data, dict):
+                append(b'DICT')
+                stack.append(_dict_frame(data))
+                break
+            elif isinstance(data, (set, frozenset)):
+                append(b'SET')
+                stack.append(
+                    _separated(sorted(_length_prefixed(_encode_bytes(item)) for item in data))
+                )
+                break
+            elif util_type.HAVE_NUMPY and isinstance(data, np.ndarray):
+                if hash_version >= 2:
+                    append(_ndarray_header(data))
+                if data.dtype.kind == 'O':
+                    # ndarrays of objects are hashed item by item
+                    if hash_version == 1:
+                        append(b'ITER')
+                    stack.append(_separated(data.ravel().tolist()))
+                    break
+                update(b''.join(parts))
+                del parts[:]
+                arr = np.ascontiguousarray(data)
+                try:
+                    update(memoryview(arr).cast('B'))
+                except (TypeError, ValueError):
+                    # dtypes without a buffer format
+                    update(arr.tobytes())
+            else:
+                try:
+                    prefix, hashable = _covert_to_hashable(data)
+                except TypeError:
+                    state = _object_state(data)
+                    if state is None:
+                        raise
+                    cls = type(data)
+                    append(b'OBJ')
+                    append((cls.__module__ + '.' + cls.__name__).encode('utf-8'))
+                    stack.append(iter([state]))
+                    break
+                append(prefix + hashable)
+            if len(parts) > 4096:
+                update(b''.join(parts))
+                del parts[:]
+        else:
+            stack.pop()
+    update(b''.join(parts))
+
+
+_SEP = b'SEP'
+# Guards against containers that contain themselves
+_MAX_HASH_DEPTH = 100000
+
+
+def _separated(items):
+    """ iterates over items with a separator between them """
+    if isinstance(items, (list, tuple)):
+        if not items:
+            return iter(())
+        todo = [_SEP] * (2 * len(items) - 1)
+        todo[::2] = items
+        return iter(todo)
+    iter_ = iter(items)
+    for first in iter_:
+        return it.chain([first], it.chain.from_iterable(zip(it.repeat(_SEP), iter_)))
+    return iter_
+
+
+def _dict_frame(data):
+    # Sort by the encoded keys so the order of insertion is ignored
+    keyed = sorted(
+        ((_encode_bytes(key), value) for key, value in _iter_dict_items(data)),
+        key=_first,
+    )
+    todo = []
+    for key_bytes, value in keyed:
+        todo.append(_SEP)
+        todo.append(_length_prefixed(key_bytes))
+        todo.append(value)
+    return iter(todo)
+
+
+def _length_prefixed(bytes_):
+    """ frames bytes so they cannot run into the bytes that follow them """
+    return len(bytes_).to_bytes(8, 'big') + bytes_
+
+
+def _first(pair):
+    return pair[0]
+
+
+def _iter_dict_items(data):
+    if type(data) is DictProxyType:
+        return ((k, v) for k, v in data.items() if not k.startswith('__'))
+    return data.items()
+
+
+class _ByteCollector(object):
+    """ hasher-like object that keeps the bytes it is updated with """
+
+    def __init__(self):
+        self.chunks = []
+
+    def update(self, bytes_):
+        self.chunks.append(bytes(bytes_))
+
+
+def _encode_bytes(data):
+    """ the bytes _update_hasher would hash for data """
+    type_ = type(data)
+    if type_ is str:
+        return data.encode('utf-8')
+    elif type_ is bytes:
+        return data
+    collector = _ByteCollector()
+    _update_hasher(collector, data)
+    return b''.join(collector.chunks)
+
+
+def _object_state(data):
+    """
+    Returns the state used to hash a dataclass or an object that defines
+    __getstate__, or None if the object has neither.
+    """
+    try:
+        import dataclasses
+    except ImportError:
+        dataclasses = None
+    if (
+        dataclasses is not None
+        and dataclasses.is_dataclass(data)
+        and not isinstance(data, type)
+    ):
+        return {f.name: getattr(data, f.name) for f in dataclasses.fields(data)}
+    getstate = getattr(type(data), '__getstate__', None)
+    # objects inherit a default __getstate__ in python 3.11
+    if getstate is None or getstate is getattr(object, '__getstate__', None):
+        return None
+    return data.__getstate__()
 
 
 # def _bytes_generator(data):
@@ -565,7 +827,7 @@ def combine_hashes(bytes_list, hasher=None):
 
 
 @profile
-def hash_data(data, hashlen=None, alphabet=None):
+def hash_data(data, hashlen=None, alphabet=None, hasher=None, hash_version=1):
     r"""
     Get a unique hash depending on the state of the data.
 
@@ -573,6 +835,12 @@ def hash_data(data, hashlen=None, alphabet=None):
         data (object): any sort of loosely organized data
         hashlen (None): (default = None)
         alphabet (None): (default = None)
+        hasher (str or func): hash backend, see get_hasher. Each backend
+            gives different hashes. (default = DEFAULT_HASH_BACKEND)
+        hash_version (int): encoding of ndarrays. Version 1 hashes only
+            their raw bytes, like older versions of utool, so arrays with
+            the same bytes but a different dtype or shape collide. Version 2
+            also hashes the dtype and shape. (default = 1)
 
     Returns:
         str: text -  hash string
@@ -604,11 +872,21 @@ def hash_data(data, hashlen=None, alphabet=None):
         >>> import numpy as np
         >>> rng = np.random.RandomState(0)
         >>> check_hash(rng.rand(100000), 'bdwosuey')
+        >>> arr = np.array([1, 2, 3])
+        >>> assert ut.hash_data(arr) == ut.hash_data(arr.reshape(3, 1))
+        >>> assert (ut.hash_data(arr, hash_version=2) !=
+        >>>         ut.hash_data(arr.reshape(3, 1), hash_version=2))
+        >>> data = ['1', np.array([1,2,3]), '3']
+        >>> assert ut.hash_data(data, hash_version=2).startswith('rqdysxor')
+        >>> data = np.random.RandomState(0).rand(100000)
+        >>> assert ut.hash_data(data, hash_version=2).startswith('xoxzrqwm')
         >>> for got, input_, count, want in failed:
         >>>     print('failed {} on {}'.format(count, input_))
         >>>     print('got={}, want={}'.format(got, want))
         >>> assert not failed
     """
+    if hash_version not in (1, 2):
+        raise ValueError('Unknown hash_version=%r' % (hash_version,))
     if alphabet is None:
         alphabet = ALPHABET_27
     if hashlen is None:
@@ -617,15 +895,146 @@ def hash_data(data, hashlen=None, alphabet=None):
         # Make a special hash for empty data
         text = alphabet[0] * hashlen
     else:
-        hasher = hashlib.sha512()
-        _update_hasher(hasher, data)
-        # Get a 128 character hex string
-        text = hasher.hexdigest()
-        # Shorten length of string (by increasing base)
-        hashstr2 = convert_hexstr_to_bigbase(text, alphabet, bigbase=len(alphabet))
-        # Truncate
-        text = hashstr2[:hashlen]
-        return text
+        hasher = get_hasher(hasher)
+        _update_hasher(hasher, data, hash_version)
+        # Shorten length of string (by increasing base) and truncate. Only
+        # the first hashlen digits are computed.
+        x = _bytes_to_int(hasher.digest())
+        text = _int_to_bigbase(x, alphabet, maxlen=hashlen)[:hashlen]
+    return text
+
+
+# Modulus and base of the polynomial that combines item digests in a
+# mergeable IncrementalHasher
+_ROLL_MODULUS = 2 ** 127 - 1
+_ROLL_BASE = int(hashlib.sha1(b'utool.IncrementalHasher').hexdigest(), 16) % _ROLL_MODULUS
+
+
+class IncrementalHasher(object):
+    """
+    Hashes a stream of items without holding them in memory. Items use the
+    same encoding as hash_data.
+
+    By default the result equals hash_data of the list of all items. With
+    mergeable=True each item is hashed on its own and the item digests are
+    combined with a polynomial. Then the partial hashers of consecutive
+    shards can be merged in order, for example after hashing them in
+    separate workers, but the result differs from hash_data.
+
+    Args:
+        hasher (str): backend name, see get_hasher
+            (default = DEFAULT_HASH_BACKEND)
+        mergeable (bool): allow merge (default = False)
+        hash_version (int): encoding of ndarrays, see hash_data
+            (default = 1)
+
+    Example:
+        >>> # ENABLE_DOCTEST
+        >>> from utool.util_hash import *  # NOQA
+        >>> import utool as ut
+        >>> items = [{'a': 1}, 'text', [1, (2, 3)], b'bytes']
+        >>> stream = IncrementalHasher()
+        >>> for item in ut.buffered_generator(iter(items)):
+        >>>     stream.update(item)
+        >>> assert stream.hexdigest27() == hash_data(items)
+        >>> # Shards hashed separately and merged in order
+        >>> left = IncrementalHasher(mergeable=True)
+        >>> left.extend(items[0:3])
+        >>> right = IncrementalHasher(mergeable=True)
+        >>> right.extend(items[3:])
+        >>> whole = IncrementalHasher(mergeable=True)
+        >>> whole.extend(items)
+        >>> assert left.merge(right).hexdigest27() == whole.hexdigest27()
+        >>> assert left.count == 4
+    """
+
+    def __init__(self, hasher=None, mergeable=False, hash_version=1):
+        if hash_version not in (1, 2):
+            raise ValueError('Unknown hash_version=%r' % (hash_version,))
+        if hasher is None:
+            hasher = DEFAULT_HASH_BACKEND
+        self.hasher = hasher
+        self.mergeable = mergeable
+        self.hash_version = hash_version
+        self.count = 0
+        if mergeable:
+            # polynomial of the item digests. It pickles, so partial hashers
+            # can be sent back from workers.
+            self._value = 0
+            self._stream = None
+        else:
+            self._value = None
+            self._stream = get_hasher(hasher)
+            self._stream.update(b'ITER')
+
+    def update(self, item):
+        """ Adds the next item """
+        if self.mergeable:
+            item_hasher = get_hasher(self.hasher)
+            _update_hasher(item_hasher, item, self.hash_version)
+            item_int = _bytes_to_int(item_hasher.digest()) % _ROLL_MODULUS
+            self._value = (self._value * _ROLL_BASE + item_int) % _ROLL_MODULUS
+        else:
+            if self.count:
+                self._stream.update(_SEP)
+            _update_hasher(self._stream, item, self.hash_version)
+        self.count += 1
+
+    def extend(self, items):
+        """ Adds each item of an iterable, such as a generator """
+        for item in items:
+            self.update(item)
+
+    def merge(self, other):
+        """
+        Appends the items hashed by other, as if they were added to self
+        after its own items. Returns self.
+        """
+        if not (self.mergeable and other.mergeable):
+            raise ValueError('Only hashers made with mergeable=True can be merged')
+        if self.hasher != other.hasher:
+            raise ValueError(
+                'Cannot merge hashers with backends %r and %r'
+                % (self.hasher, other.hasher)
+            )
+        if self.hash_version != other.hash_version:
+            raise ValueError(
+                'Cannot merge hashers with hash_version %r and %r'
+                % (self.hash_version, other.hash_version)
+            )
+        shift = pow(_ROLL_BASE, other.count, _ROLL_MODULUS)
+        self._value = (self._value * shift + other._value) % _ROLL_MODULUS
+        self.count += other.count
+        return self
+
+    def copy(self):
+        new = IncrementalHasher.__new__(IncrementalHasher)
+        new.__dict__.update(self.__dict__)
+        if self._stream is not None:
+            new._stream = self._stream.copy()
+        return new
+
+    def digest(self):
+        if self.mergeable:
+            final = get_hasher(self.hasher)
+            final.update(b'ROLL')
+            final.update(_int_to_bytes(self.count))
+            final.update(self._value.to_bytes(16, 'big'))
+            return final.digest()
+        else:
+            return self._stream.copy().digest()
+
+    def hexdigest(self):
+        return freeze_hash_bytes(self.digest())
+
+    def hexdigest27(self, hashlen=None, alphabet=None):
+        """ The digest as a string like the ones of hash_data """
+        if alphabet is None:
+            alphabet = ALPHABET_27
+        if hashlen is None:
+            hashlen = HASH_LEN2
+        x = _bytes_to_int(self.digest())
+        return _int_to_bigbase(x, alphabet, maxlen=hashlen)[:hashlen]
 
 
 def digest_data(data, alg='sha256'):
@@ -772,12 +1181,9 @@ def hashstr(data, hashlen=HASH_LEN, alphabet=ALPHABET):
         # Make a special hash for empty data
         text = alphabet[0] * hashlen
     else:
-        # Get a 128 character hex string
-        text = hashlib.sha512(data).hexdigest()
-        # Shorten length of string (by increasing base)
-        hashstr2 = convert_hexstr_to_bigbase(text, alphabet, bigbase=len(alphabet))
-        # Truncate
-        text = hashstr2[:hashlen]
+        # Shorten length of string (by increasing base) and truncate
+        x = _bytes_to_int(hashlib.sha512(data).digest())
+        text = _int_to_bigbase(x, alphabet, maxlen=hashlen)[:hashlen]
     return text
 
 
@@ -858,7 +1264,49 @@ def _test_int_byte_conversion():
         assert int_ == int_0
 
 
-def convert_bytes_to_bigbase(bytes_, alphabet=ALPHABET_27):
+# Number of digits per machine sized chunk for each base
+_CHUNK_DIGITS = {}
+
+
+def _int_to_bigbase(x, alphabet, maxlen=None):
+    """
+    Returns the digits of an int in base len(alphabet), least significant
+    first. If maxlen is given only the first maxlen digits are computed,
+    which is much faster for the long ints of a digest.
+    """
+    bigbase = len(alphabet)
+    if x == 0:
+        return '0'
+    if x < 0:
+        return '-' + _int_to_bigbase(-x, alphabet)[::-1]
+    npad = 0
+    if maxlen is not None:
+        modulus = bigbase ** maxlen
+        if x >= modulus:
+            # Only the low order digits are kept and they include any zeros
+            x %= modulus
+            npad = maxlen
+    ndigits = _CHUNK_DIGITS.get(bigbase, None)
+    if ndigits is None:
+        ndigits = int(math.log(2 ** 63, bigbase))
+        _CHUNK_DIGITS[bigbase] = ndigits
+    chunk_base = bigbase ** ndigits
+    digits = []
+    # Split into machine sized chunks so the inner loop uses small ints
+    while x:
+        x, chunk = divmod(x, chunk_base)
+        for _ in range(ndigits):
+            chunk, rem = divmod(chunk, bigbase)
+            digits.append(alphabet[rem])
+            if not x and not chunk:
+                break
+    text = ''.join(digits)
+    if len(text) < npad:
+        text = text + alphabet[0] * (npad - len(text))
+    return text
+
+
+def convert_bytes_to_bigbase(bytes_, alphabet=ALPHABET_27, maxlen=None):
     r"""
     Args:
         bytes_ (bytes):
@@ -882,23 +1330,12 @@ def convert_bytes_to_bigbase(bytes_, alphabet=ALPHABET_27):
         fervudwhpustklnptklklcgswbmvtustqocdpgiwkgrvwytvneardkpytd
     """
     x = _bytes_to_int(bytes_)
-    if x == 0:
-        return '0'
-    sign = 1 if x > 0 else -1
-    x *= sign
-    digits = []
-    bigbase = len(alphabet)
-    while x:
-        digits.append(alphabet[x % bigbase])
-        x //= bigbase
-    if sign < 0:
-        digits.append('-')
-        digits.reverse()
-    newbase_str = ''.join(digits)
-    return newbase_str
+    return _int_to_bigbase(x, alphabet, maxlen=maxlen)
 
 
-def convert_hexstr_to_bigbase(hexstr, alphabet=ALPHABET, bigbase=BIGBASE):
+def convert_hexstr_to_bigbase(
+    hexstr, alphabet=ALPHABET, bigbase=BIGBASE, maxlen=None
+):
     r"""
     Packs a long hexstr into a shorter length string with a larger base
 
@@ -926,19 +1363,7 @@ def convert_hexstr_to_bigbase(hexstr, alphabet=ALPHABET, bigbase=BIGBASE):
         info(27, 216)
     """
     x = int(hexstr, 16)  # first convert to base 16
-    if x == 0:
-        return '0'
-    sign = 1 if x > 0 else -1
-    x *= sign
-    digits = []
-    while x:
-        digits.append(alphabet[x % bigbase])
-        x //= bigbase
-    if sign < 0:
-        digits.append('-')
-        digits.reverse()
-    newbase_str = ''.join(digits)
-    return newbase_str
+    return _int_to_bigbase(x, alphabet[0:bigbase], maxlen=maxlen)
 
 
 def hashstr_md5(data):
@@ -969,7 +1394,8 @@ def get_file_hash(fpath, blocksize=65536, hasher=None, stride=1, hexdigest=False
     Args:
         fpath (str):  file path string
         blocksize (int): 2 ** 16. Affects speed of reading file
-        hasher (None):  defaults to sha1 for fast (but insecure) hashing
+        hasher (None):  defaults to sha1 for fast (but insecure) hashing.
+                        Can also be a backend name, see get_hasher.
         stride (int): strides > 1 skip data to hash, useful for faster
                       hashing, but less accurate, also makes hash dependant on
                       blocksize.
@@ -1018,20 +1444,89 @@ def get_file_hash(fpath, blocksize=65536, hasher=None, stride=1, hexdigest=False
         file_ = open(fpath, 'rb')
     """
     if hasher is None:
-        hasher = hashlib.sha1()
+        hasher = 'sha1'
+    hasher = get_hasher(hasher)
     with open(fpath, 'rb') as file_:
-        buf = file_.read(blocksize)
-        while len(buf) > 0:
-            hasher.update(buf)
-            if stride > 1:
-                file_.seek(blocksize * (stride - 1), 1)  # skip blocks
+        if stride == 1:
+            # Read into one reused buffer, the hash does not depend on the
+            # blocksize in this case
+            buf = bytearray(blocksize)
+            view = memoryview(buf)
+            nread = file_.readinto(buf)
+            while nread:
+                hasher.update(view[:nread])
+                nread = file_.readinto(buf)
+        else:
             buf = file_.read(blocksize)
+            while len(buf) > 0:
+                hasher.update(buf)
+                file_.seek(blocksize * (stride - 1), 1)  # skip blocks
+                buf = file_.read(blocksize)
         if hexdigest:
             return hasher.hexdigest()
         else:
             return hasher.digest()
 
 
+def benchmark_hash_backends(backends=None, num=3, verbose=True):
+    r"""
+    Times hash_data with each installed backend on a short string, a nested
+    list and a large ndarray. Backends that are not installed are skipped.
+
+    Args:
+        backends (list): names in HASH_BACKENDS (default = all)
+        num (int): repetitions. The fastest time is reported. (default = 3)
+
+    Returns:
+        list: a dict per backend with the time for each kind of data
+
+    CommandLine:
+        python -m utool.util_hash benchmark_hash_backends
+
+    Example:
+        >>> # ENABLE_DOCTEST
+        >>> from utool.util_hash import *  # NOQA
+        >>> rows = benchmark_hash_backends(['sha512', 'blake2b'], num=1, verbose=False)
+        >>> assert [row['backend'] for row in rows] == ['sha512', 'blake2b']
+        >>> assert all(row['nested'] > 0 for row in rows)
+    """
+    import collections
+    import time
+
+    if backends is None:
+        backends = list(HASH_BACKENDS.keys())
+    datas = collections.OrderedDict()
+    datas['string'] = 'feat_cfg(sz=450,nfeat=2000)_annots(n=1000)'
+    datas['nested'] = [[str(x), x, [b'%d' % x, (x, x + 1)]] for x in range(1000)]
+    if util_type.HAVE_NUMPY:
+        datas['ndarray'] = np.random.RandomState(0).rand(2 ** 20)
+    rows = []
+    for backend in backends:
+        try:
+            get_hasher(backend)
+        except ImportError:
+            if verbose:
+                print('[util_hash] skipping %s: not installed' % (backend,))
+            continue
+        row = collections.OrderedDict()
+        row['backend'] = backend
+        for key, data in datas.items():
+            times = []
+            for _ in range(num):
+                start = time.time()
+                hash_data(data, hasher=backend)
+                times.append(time.time() - start)
+            row[key] = min(times)
+        rows.append(row)
+    if verbose:
+        keys = list(datas.keys())
+        fmtstr = '{:>10}' + ' {:>12}' * len(keys)
+        print(fmtstr.format('backend', *keys))
+        for row in rows:
+            print(fmtstr.format(row['backend'], *['%.6f' % row[k] for k in keys]))
+    return rows
+
+
 def write_hash_file(fpath, hash_tag='md5', recompute=False):
     r"""Creates a hash file for each file in a path
 
@@ -1071,8 +1566,12 @@ def write_hash_file(fpath, hash_tag='md5', recompute=False):
         return hash_fpath
 
 
-def write_hash_file_for_path(path, recompute=False):
-    r"""Creates a hash file for each file in a path
+def write_hash_file_for_path(
+    path, recompute=False, hash_tag='md5', nprocs=None, verbose=False
+):
+    r"""Creates a hash file for each file in a path. The files are hashed
+    concurrently with iter_file_hashes. Files that cannot be read are skipped
+    with a warning.
 
     CommandLine:
         python -m utool.util_hash --test-write_hash_file_for_path
@@ -1089,14 +1588,27 @@ def write_hash_file_for_path(path, recompute=False):
         >>>     assert os.path.exists(hash_fpath)
         >>>     ut.delete(hash_fpath)
     """
+    # Find the files that need a hash file, see write_hash_file
+    fpath_list = []
+    for fpath in _walk_fpaths(path):
+        if fpath.endswith('.%s' % (hash_tag,)):
+            continue
+        hash_fpath = '%s.%s' % (fpath, hash_tag)
+        if os.path.exists(hash_fpath) and not recompute:
+            continue
+        if util_path.get_path_type(fpath) == 'file':
+            fpath_list.append(fpath)
     hash_fpath_list = []
-    for root, dname_list, fname_list in os.walk(path):
-        for fname in sorted(fname_list):
-            # fpath = os.path.join(path, fname)
-            fpath = os.path.join(root, fname)
-            hash_fpath = write_hash_file(fpath, recompute=recompute)
-            if hash_fpath is not None:
-                hash_fpath_list.append(hash_fpath)
+    hash_iter = iter_file_hashes(
+        fpath_list, hasher=hash_tag, nprocs=nprocs, hexdigest=True, ordered=True
+    )
+    for fpath, hash_local in hash_iter:
+        if verbose:
+            print('[utool] Adding:', fpath, hash_local)
+        hash_fpath = '%s.%s' % (fpath, hash_tag)
+        with open(hash_fpath, 'w') as hash_file:
+            hash_file.write(hash_local)
+        hash_fpath_list.append(hash_fpath)
     return hash_fpath_list
 
 
@@ -1113,6 +1625,326 @@ def get_file_uuid(fpath, hasher=None, stride=1):
     return uuid_
 
 
+# Files at least this big are hashed through mmap in a single update
+__FILE_HASH_MMAP_MIN__ = 2 ** 22
+
+
+def _backend_name(hasher):
+    """ name of a hash backend, used to key the file hash index """
+    if hasher is None:
+        return 'sha1'
+    if isinstance(hasher, six.string_types):
+        return _fast_backend_name() if hasher == 'fast' else hasher
+    return getattr(get_hasher(hasher), 'name', repr(hasher))
+
+
+def _hash_file_contents(fpath, hasher, blocksize=2 ** 20, mmap_min_nbytes=None):
+    """ digest of a whole file. Used by the workers of iter_file_hashes """
+    hasher = get_hasher(hasher)
+    with open(fpath, 'rb') as file_:
+        size = os.fstat(file_.fileno()).st_size
+        if mmap_min_nbytes is not None and size >= max(mmap_min_nbytes, 1):
+            import mmap
+
+            mm = mmap.mmap(file_.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                # hashlib releases the GIL for large updates
+                hasher.update(mm)
+            finally:
+                mm.close()
+        elif size <= blocksize:
+            hasher.update(file_.read())
+        else:
+            buf = bytearray(blocksize)
+            view = memoryview(buf)
+            nread = file_.readinto(buf)
+            while nread:
+                hasher.update(view[:nread])
+                nread = file_.readinto(buf)
+    return hasher.digest()
+
+
+class FileHashIndex(object):
+    """
+    A sqlite sidecar index of file digests. An entry is only used while the
+    size, mtime and inode of its file are unchanged, so files that did not
+    change are never read again.
+
+    Args:
+        fpath (str): path of the index database
+
+    Example:
+        >>> # ENABLE_DOCTEST
+        >>> from utool.util_hash import *  # NOQA
+        >>> from os.path import join
+        >>> import utool as ut
+        >>> dpath = ut.ensure_app_resource_dir('utool', 'test_filehashindex')
+        >>> fpath = join(dpath, 'data.txt')
+        >>> ut.write_to(fpath, 'hello', verbose=False)
+        >>> index = FileHashIndex(join(dpath, 'hashes.sqlite3'))
+        >>> index.clear()
+        >>> stat = os.stat(fpath)
+        >>> assert index.lookup(fpath, 'sha1', stat) is None
+        >>> index.update_many([(fpath, 'sha1', stat, b'digest')])
+        >>> assert index.lookup(fpath, 'sha1', stat) == b'digest'
+        >>> ut.write_to(fpath, 'hello world', verbose=False)
+        >>> assert index.lookup(fpath, 'sha1', os.stat(fpath)) is None
+        >>> index.close()
+    """
+
+    def __init__(self, fpath, timeout=60):
+        import sqlite3
+
+        self.fpath = fpath
+        self._conn = sqlite3.connect(fpath, timeout=timeout, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS filehash ('
+            ' path TEXT, hasher TEXT, size INTEGER, mtime_ns INTEGER,'
+            ' inode INTEGER, digest BLOB, PRIMARY KEY (path, hasher))'
+        )
+
+    @staticmethod
+    def _stat_key(stat):
+        mtime_ns = getattr(stat, 'st_mtime_ns', None)
+        if mtime_ns is None:
+            mtime_ns = int(stat.st_mtime * 1e9)
+        return stat.st_size, mtime_ns, stat.st_ino
+
+    def lookup(self, fpath, hasher, stat):
+        """ Returns the indexed digest of fpath or None if it is stale """
+        row = self._conn.execute(
+            'SELECT size, mtime_ns, inode, digest FROM filehash'
+            ' WHERE path = ? AND hasher = ?',
+            (os.path.abspath(fpath), hasher),
+        ).fetchone()
+        if row is None or tuple(row[0:3]) != self._stat_key(stat):
+            return None
+        return bytes(row[3])
+
+    def update_many(self, rows):
+        """ rows is a list of (fpath, hasher, stat, digest) """
+        records = [
+            (os.path.abspath(fpath), hasher) + self._stat_key(stat) + (digest,)
+            for fpath, hasher, stat, digest in rows
+        ]
+        if records:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                self._conn.executemany(
+                    'INSERT OR REPLACE INTO filehash VALUES (?, ?, ?, ?, ?, ?)',
+                    records,
+                )
+            except Exception:
+                self._conn.execute('ROLLBACK')
+                raise
+            else:
+                self._conn.execute('COMMIT')
+
+    def clear(self):
+        self._conn.execute('DELETE FROM filehash')
+
+    def close(self):
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type_, value, trace):
+        self.close()
+
+
+def _walk_fpaths(fpaths):
+    """ files in a directory tree, or the given paths """
+    if isinstance(fpaths, six.string_types):
+        for root, dname_list, fname_list in os.walk(fpaths):
+            for fname in sorted(fname_list):
+                yield os.path.join(root, fname)
+    else:
+        for fpath in fpaths:
+            yield fpath
+
+
+def iter_file_hashes(
+    fpaths,
+    hasher='sha1',
+    nprocs=None,
+    index_fpath=None,
+    hexdigest=False,
+    ordered=False,
+    blocksize=2 ** 20,
+    mmap_min_nbytes=__FILE_HASH_MMAP_MIN__,
+    errors='warn',
+):
+    r"""
+    Hashes many files on a thread pool and yields ``(fpath, digest)`` as each
+    one completes. Files at least mmap_min_nbytes big are hashed through
+    mmap. Gives the same digests as get_file_hash.
+
+    Args:
+        fpaths (list or str): file paths or a directory to walk
+        hasher (str): backend name, see get_hasher (default = 'sha1')
+        nprocs (int): number of threads (default = executor default)
+        index_fpath (str): sqlite sidecar index. Files whose path, size,
+            mtime and inode are in it are not read again. (default = None)
+        hexdigest (bool): yield hex strings instead of bytes
+        ordered (bool): yield in the order of fpaths instead of completion
+        blocksize (int): read size for files that are not mmapped
+        mmap_min_nbytes (int): None disables mmap
+        errors (str): what to do with a file that cannot be stat-ed or read,
+            e.g. a broken symlink or a file removed during the walk. 'warn'
+            skips it with a warning, 'ignore' skips it silently, and 'raise'
+            stops hashing. (default = 'warn')
+
+    CommandLine:
+        python -m utool.util_hash iter_file_hashes
+
+    Example:
+        >>> # ENABLE_DOCTEST
+        >>> from utool.util_hash import *  # NOQA
+        >>> from os.path import join
+        >>> import utool as ut
+        >>> dpath = ut.ensure_app_resource_dir('utool', 'test_iter_file_hashes')
+        >>> ut.delete(dpath, verbose=False)
+        >>> ut.ensuredir(join(dpath, 'sub'))
+        >>> fpath_list = [join(dpath, 'sub', 'f%d.txt' % i) for i in range(20)]
+        >>> for i, fpath in enumerate(fpath_list):
+        >>>     ut.write_to(fpath, 'data %d' % i * (i + 1), verbose=False)
+        >>> index_fpath = join(dpath, 'hashes.sqlite3')
+        >>> got = dict(iter_file_hashes(join(dpath, 'sub'), index_fpath=index_fpath,
+        >>>                             mmap_min_nbytes=100))
+        >>> assert all(got[fpath] == get_file_hash(fpath) for fpath in fpath_list)
+        >>> # the second pass is answered by the index
+        >>> again = list(iter_file_hashes(fpath_list, index_fpath=index_fpath,
+        >>>                               ordered=True, hexdigest=True))
+        >>> assert [f for f, _ in again] == fpath_list
+        >>> assert again[3][1] == get_file_hash(fpath_list[3], hexdigest=True)
+        >>> # unreadable files are skipped
+        >>> missing = join(dpath, 'missing.txt')
+        >>> got = list(iter_file_hashes([missing] + fpath_list, errors='ignore'))
+        >>> assert sorted(f for f, _ in got) == sorted(fpath_list)
+        >>> ut.assert_raises(OSError, list, iter_file_hashes([missing], errors='raise'))
+    """
+    from concurrent import futures
+
+    if errors not in {'warn', 'ignore', 'raise'}:
+        raise ValueError('unknown errors=%r' % (errors,))
+    hasher_name = _backend_name(hasher)
+    index = None if index_fpath is None else FileHashIndex(index_fpath)
+
+    def _output(fpath, digest):
+        return fpath, (freeze_hash_bytes(digest) if hexdigest else digest)
+
+    # Limit the number of files in flight so huge trees use little memory
+    max_pending = 4 * (nprocs or 8)
+    # future -> (fpath, stat). stat is None for digests from the index.
+    pending = collections.OrderedDict()
+    # finished futures in the order they complete
+    done_queue = six.moves.queue.Queue()
+    new_rows = []
+    executor = futures.ThreadPoolExecutor(nprocs)
+    try:
+        for fpath in _walk_fpaths(fpaths):
+            try:
+                stat = os.stat(fpath)
+            except OSError as ex:
+                _file_hash_error(fpath, ex, errors)
+                continue
+            digest = None if index is None else index.lookup(fpath, hasher_name, stat)
+            if digest is None:
+                future = executor.submit(
+                    _hash_file_contents, fpath, hasher, blocksize, mmap_min_nbytes
+                )
+                pending[future] = (fpath, stat)
+                if not ordered:
+                    future.add_done_callback(done_queue.put)
+            elif ordered:
+                future = futures.Future()
+                future.set_result(digest)
+                pending[future] = (fpath, None)
+            else:
+                yield _output(fpath, digest)
+            while len(pending) >= max_pending:
+                for item in _pop_finished(pending, done_queue, ordered, new_rows, errors):
+                    yield _output(*item)
+            if index is not None and len(new_rows) >= 1000:
+                index.update_many([(f, hasher_name, s, d) for f, s, d in new_rows])
+                del new_rows[:]
+        while pending:
+            for item in _pop_finished(pending, done_queue, ordered, new_rows, errors):
+                yield _output(*item)
+    finally:
+        executor.shutdown(wait=True)
+        if index is not None:
+            index.update_many([(f, hasher_name, s, d) for f, s, d in new_rows])
+            index.close()
+
+
+def _file_hash_error(fpath, ex, errors):
+    """ handles a file iter_file_hashes cannot hash """
+    if errors == 'raise':
+        raise ex
+    if errors == 'warn':
+        warnings.warn('Cannot hash %s: %s' % (fpath, ex), RuntimeWarning)
+
+
+def _pop_finished(pending, done_queue, ordered, new_rows, errors):
+    """
+    Waits for at least one pending hash and returns the (fpath, digest) pairs
+    that can be yielded. In ordered mode only the head of the queue is.
+    """
+    if ordered:
+        finished = [next(iter(pending))]
+    else:
+        finished = [done_queue.get()]
+        while True:
+            try:
+                finished.append(done_queue.get_nowait())
+            except six.moves.queue.Empty:
+                break
+    results = []
+    for future in finished:
+        fpath, stat = pending.pop(future)
+        try:
+            digest = future.result()
+        except OSError as ex:
+            _file_hash_error(fpath, ex, errors)
+            continue
+        if stat is not None:
+            new_rows.append((fpath, stat, digest))
+        results.append((fpath, digest))
+    return results
+
+
+def get_file_uuids(fpath_list, nprocs=None, index_fpath=None):
+    """
+    Creates the uuids of many files concurrently. Gives the same uuids as
+    get_file_uuid.
+
+    Example:
+        >>> # ENABLE_DOCTEST
+        >>> from utool.util_hash import *  # NOQA
+        >>> from os.path import join
+        >>> import utool as ut
+        >>> dpath = ut.ensure_app_resource_dir('utool', 'test_get_file_uuids')
+        >>> fpath_list = [join(dpath, 'f%d.txt' % i) for i in range(3)]
+        >>> for i, fpath in enumerate(fpath_list):
+        >>>     ut.write_to(fpath, str(i), verbose=False)
+        >>> uuid_list = get_file_uuids(fpath_list)
+        >>> assert uuid_list == [get_file_uuid(fpath) for fpath in fpath_list]
+    """
+    hash_iter = iter_file_hashes(
+        fpath_list,
+        hasher='sha1',
+        nprocs=nprocs,
+        index_fpath=index_fpath,
+        ordered=True,
+        errors='raise',
+    )
+    # sha1 produces 20 bytes, but UUID requires 16 bytes
+    return [uuid.UUID(bytes=digest[0:16]) for fpath, digest in hash_iter]
+
+
 def image_uuid(pil_img):
     """
     UNSAFE: DEPRICATE: JPEG IS NOT GAURENTEED TO PRODUCE CONSITENT VALUES ON
@@ -1133,6 +1965,14 @@ def augment_uuid(uuid_, *hashables):
     # from six.moves import reprlib
     # uuidhex_data   = uuid_.get_bytes()
     uuidhex_data = uuid_.bytes
+    hashable_data = _augment_suffix(hashables)
+    augmented_data = uuidhex_data + hashable_data
+    augmented_uuid_ = hashable_to_uuid(augmented_data)
+    return augmented_uuid_
+
+
+def _augment_suffix(hashables):
+    """ the bytes augment_uuid appends to a uuid """
     # hashable_str    = ''.join(map(repr, hashables))
     # Python 2 and 3 diverge here because repr returns
     # ascii data in python2 and unicode text in python3
@@ -1155,9 +1995,7 @@ def augment_uuid(uuid_, *hashables):
         hashable_text = ''.join(map(tmprepr, hashables))
         hashable_data = hashable_text.encode('utf-8')
         # hashable_data = b''.join(map(bytes, hashables))
-    augmented_data = uuidhex_data + hashable_data
-    augmented_uuid_ = hashable_to_uuid(augmented_data)
-    return augmented_uuid_
+    return hashable_data
 
 
 @profile
@@ -1223,6 +2061,166 @@ def combine_uuids(uuids, ordered=True, salt=''):
         return combined_uuid
 
 
+def _combine_flat_uuids(buf17, offsets, salt, return_bytes):
+    """
+    Combines groups of uuids packed as 16 bytes followed by a separator. The
+    uuids of group i are the rows offsets[i] to offsets[i + 1]. Gives the
+    same result as combine_uuids on each group.
+    """
+    sha1 = hashlib.sha1
+    view = memoryview(buf17)
+    prefixes = {}
+    out = []
+    append = out.append
+    zero_bytes = get_zero_uuid().bytes
+    for start, stop in zip(offsets[:-1], offsets[1:]):
+        num = stop - start
+        if num == 0:
+            append(zero_bytes)
+        elif num == 1:
+            append(bytes(view[start * 17 : start * 17 + 16]))
+        else:
+            pref = prefixes.get(num, None)
+            if pref is None:
+                pref = six.binary_type(six.b('{}{}{}'.format(salt, SEP_STR, num)))
+                prefixes[num] = pref
+            hasher = sha1(pref)
+            # the separator after the last uuid is not hashed
+            hasher.update(view[start * 17 : stop * 17 - 1])
+            append(hasher.digest()[0:16])
+    if return_bytes:
+        return out
+    UUID = uuid.UUID
+    return [UUID(bytes=bytes_) for bytes_ in out]
+
+
+def _uuid_int(uuid_):
+    return uuid_.int
+
+
+def combine_uuids_batch(uuid_groups, ordered=True, salt='', return_bytes=False):
+    """
+    Combines many groups of uuids at once. Gives the same uuids as calling
+    combine_uuids on each group, with much less overhead per group.
+
+    Args:
+        uuid_groups (list): list of lists of uuid objects
+        ordered (bool): if False each group is an orderless set
+        salt (str): salts the resulting hashes
+        return_bytes (bool): return the 16 bytes of each uuid instead
+
+    Returns:
+        list: a combined uuid per group
+
+    Example:
+        >>> # ENABLE_DOCTEST
+        >>> from utool.util_hash import *  # NOQA
+        >>> uuids = [hashable_to_uuid(x) for x in range(10)]
+        >>> uuid_groups = [uuids[0:3], [], uuids[3:4], uuids[4:10], uuids[::-1]]
+        >>> for ordered in [True, False]:
+        >>>     got = combine_uuids_batch(uuid_groups, ordered, salt='s')
+        >>>     want = [combine_uuids(g, ordered, salt='s') for g in uuid_groups]
+        >>>     assert got == want
+    """
+    offsets = [0]
+    flat_uuids = []
+    for group in uuid_groups:
+        if not ordered:
+            # uuids compare by their int, which is faster to sort by
+            group = sorted(group, key=_uuid_int)
+        flat_uuids.extend(group)
+        offsets.append(len(flat_uuids))
+    buf17 = b''.join([u.bytes + SEP_BYTE for u in flat_uuids])
+    return _combine_flat_uuids(buf17, offsets, salt, return_bytes)
+
+
+def combine_uuid_bytes(uuid_bytes, offsets, ordered=True, salt='', return_bytes=False):
+    """
+    Combines groups of uuids stored as rows of a uint8 array. Gives the same
+    uuids as combine_uuids on each group.
+
+    Args:
+        uuid_bytes (ndarray): N x 16 uint8 array of uuid bytes
+        offsets (ndarray): the rows of group i are offsets[i] to
+            offsets[i + 1], so there is one more offset than groups
+        ordered (bool): if False each group is an orderless set
+        salt (str): salts the resulting hashes
+        return_bytes (bool): return the 16 bytes of each uuid instead
+
+    Returns:
+        list: a combined uuid per group
+
+    Example:
+        >>> # ENABLE_DOCTEST
+        >>> from utool.util_hash import *  # NOQA
+        >>> import numpy as np
+        >>> uuids = [hashable_to_uuid(x) for x in range(10)]
+        >>> uuid_bytes = np.frombuffer(b''.join(u.bytes for u in uuids), dtype=np.uint8)
+        >>> uuid_bytes = uuid_bytes.reshape(-1, 16)
+        >>> offsets = np.array([0, 3, 3, 4, 10])
+        >>> groups = [uuids[0:3], [], uuids[3:4], uuids[4:10]]
+        >>> for ordered in [True, False]:
+        >>>     got = combine_uuid_bytes(uuid_bytes, offsets, ordered)
+        >>>     assert got == [combine_uuids(g, ordered) for g in groups]
+    """
+    import numpy as np
+
+    uuid_bytes = np.asarray(uuid_bytes, dtype=np.uint8).reshape(-1, 16)
+    offsets = np.asarray(offsets, dtype=np.int64)
+    if not ordered and len(uuid_bytes):
+        # Sort the rows of each group by value, the same order as sorting
+        # uuid objects. Sorting one bytes key of group id and uuid is much
+        # faster than a lexsort.
+        group_ids = np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+        keys = np.empty((len(uuid_bytes), 24), dtype=np.uint8)
+        keys[:, 0:8] = group_ids.astype('>u8').view(np.uint8).reshape(-1, 8)
+        keys[:, 8:24] = uuid_bytes
+        sortx = np.argsort(keys.view('S24').ravel(), kind='stable')
+        uuid_bytes = uuid_bytes[sortx]
+    rows17 = np.empty((len(uuid_bytes), 17), dtype=np.uint8)
+    rows17[:, 0:16] = uuid_bytes
+    rows17[:, 16] = ord(SEP_STR)
+    return _combine_flat_uuids(rows17.tobytes(), offsets.tolist(), salt, return_bytes)
+
+
+def augment_uuids(uuid_list, *hashables):
+    """
+    Augments many uuids with the same hashables. Gives the same uuids as
+    calling augment_uuid on each one.
+
+    Example:
+        >>> # ENABLE_DOCTEST
+        >>> from utool.util_hash import *  # NOQA
+        >>> uuid_list = [hashable_to_uuid(x) for x in range(5)]
+        >>> got = augment_uuids(uuid_list, 'cfg', 3, [1, 2])
+        >>> assert got == [augment_uuid(u, 'cfg', 3, [1, 2]) for u in uuid_list]
+    """
+    suffix = _augment_suffix(hashables)
+    sha1 = hashlib.sha1
+    UUID = uuid.UUID
+    return [UUID(bytes=sha1(u.bytes + suffix).digest()[0:16]) for u in uuid_list]
+
+
+def hashables_to_uuids(hashable_list):
+    """
+    Creates the uuid of each hashable. Gives the same uuids as calling
+    hashable_to_uuid on each one.
+
+    Example:
+        >>> # ENABLE_DOCTEST
+        >>> from utool.util_hash import *  # NOQA
+        >>> hashable_list = ['foobar', b'foobar', 10, [1, 2, 3]]
+        >>> got = hashables_to_uuids(hashable_list)
+        >>> assert got == [hashable_to_uuid(h) for h in hashable_list]
+    """
+    sha1 = hashlib.sha1
+    UUID = uuid.UUID
+    return [
+        UUID(bytes=sha1(_ensure_hashable_bytes(hashable_)).digest()[0:16])
+        for hashable_ in hashable_list
+    ]
+
+
 if six.PY3:
 
     def _ensure_hashable_bytes(hashable_):
@@ -1241,7 +2239,6 @@ if six.PY3:
 
 
 elif six.PY2:
-    import struct
 
     def _ensure_hashable_bytes(hashable_):
         # If hashable_ is data (python2)
@@ -4,7 +4,12 @@ import six
 from six.moves import cPickle as pickle
 from utool import util_path
 from utool import util_inject
-from os.path import splitext, basename, exists
+import os
+import contextlib
+import struct
+import time
+import uuid
+from os.path import splitext, basename, exists, join, isdir
 
 try:
     import lockfile
@@ -12,6 +17,12 @@ try:
     HAVE_LOCKFILE = True
 except ImportError:
     HAVE_LOCKFILE = False
+try:
+    import fcntl
+
+    HAVE_FCNTL = True
+except ImportError:
+    HAVE_FCNTL = False
 try:
     import numpy as np
 
@@ -45,6 +56,12 @@ def load_data(fpath, **kwargs):
         return load_text(fpath, **kwargs)
     elif HAS_NUMPY and ext in ['.npz', '.npy']:
         return load_numpy(fpath, **kwargs)
+    elif HAS_NUMPY and ext in ['.mmap']:
+        return load_mmap(fpath, **kwargs)
+    elif ext in ['.pkl5']:
+        return load_pkl5(fpath, **kwargs)
+    elif ext in ['.zst', '.lz4']:
+        return load_compressed(fpath, **kwargs)
     else:
         assert False, 'unknown ext=%r for fpath=%r' % (ext, fpath)
 
@@ -62,6 +79,12 @@ def save_data(fpath, data, **kwargs):
         return save_text(fpath, **kwargs)
     elif HAS_NUMPY and ext in ['.npz', '.npy']:
         return save_numpy(fpath, data, **kwargs)
+    elif HAS_NUMPY and ext in ['.mmap']:
+        return save_mmap(fpath, data, **kwargs)
+    elif ext in ['.pkl5']:
+        return save_pkl5(fpath, data, **kwargs)
+    elif ext in ['.zst', '.lz4']:
+        return save_compressed(fpath, data, **kwargs)
     else:
         assert False, 'unknown ext=%r for fpath=%r' % (ext, fpath)
 
@@ -259,12 +282,12 @@ def load_json(fpath):
     return data
 
 
-def save_cPkl(fpath, data, verbose=None, n=None):
+def save_cPkl(fpath, data, verbose=None, n=None, durable=False):
     """ Saves data to a pickled file with optional verbosity """
     verbose = _rectify_verb_write(verbose)
     if verbose:
         print('[util_io] * save_cPkl(%r, data)' % (util_path.tail(fpath, n=n),))
-    with open(fpath, 'wb') as file_:
+    with atomic_write(fpath, 'wb', durable=durable) as file_:
         # Use protocol 2 to support python2 and 3
         pickle.dump(data, file_, protocol=2)
 
@@ -413,13 +436,105 @@ def _python2_load_cpkl(fpath):
         return data
 
 
+@contextlib.contextmanager
+def atomic_write(fpath, mode='wb', durable=False):
+    """
+    Opens a temporary file next to ``fpath`` that is renamed to ``fpath``
+    when the context exits without an error. Readers see either the old or
+    the new file, never a partially written one.
+
+    Args:
+        fpath (str): destination path
+        mode (str): 'wb' or 'w' (default = 'wb')
+        durable (bool): if True the data is fsynced before the rename, so
+            the new file also survives a power loss. This is slow, so it is
+            off by default. (default = False)
+
+    Example:
+        >>> # ENABLE_DOCTEST
+        >>> from utool.util_io import *  # NOQA
+        >>> import utool as ut
+        >>> dpath = ut.ensure_app_resource_dir('utool', 'test_atomic')
+        >>> fpath = join(dpath, 'atomic.txt')
+        >>> with atomic_write(fpath, 'w') as file_:
+        >>>     _ = file_.write('good')
+        >>> try:
+        >>>     with atomic_write(fpath, 'w') as file_:
+        >>>         _ = file_.write('torn')
+        >>>         raise KeyboardInterrupt
+        >>> except KeyboardInterrupt:
+        >>>     pass
+        >>> assert read_from(fpath, verbose=False) == 'good'
+        >>> assert os.listdir(dpath) == ['atomic.txt']
+        >>> ut.delete(dpath)
+    """
+    dpath, fname = os.path.split(fpath)
+    tmp_fpath = join(dpath, '.' + fname + '.tmp' + uuid.uuid4().hex[0:8])
+    try:
+        with open(tmp_fpath, mode) as file_:
+            yield file_
+            if durable:
+                file_.flush()
+                os.fsync(file_.fileno())
+        os.replace(tmp_fpath, fpath)
+    except BaseException:
+        if exists(tmp_fpath):
+            os.remove(tmp_fpath)
+        raise
+
+
+@contextlib.contextmanager
+def file_lock(fpath, timeout=None):
+    """
+    Holds an advisory lock on ``fpath + '.lock'``. POSIX record locks are
+    used when available, which also work across hosts on NFS. Otherwise the
+    lockfile package is used if it is installed.
+
+    Note that POSIX locks are held per process, so they do not exclude other
+    threads of the same process.
+
+    The empty lock file is left in place afterwards. Removing it while
+    another process waits on it would let two processes hold the lock at
+    once, so it is only removed along with its directory.
+
+    Args:
+        fpath (str): path of the resource to lock
+        timeout (float): seconds to wait for the lock before raising an
+            IOError. None waits forever. (default = None)
+    """
+    lock_fpath = fpath + '.lock'
+    if HAVE_FCNTL:
+        with open(lock_fpath, 'a') as file_:
+            start = time.time()
+            while True:
+                try:
+                    flags = fcntl.LOCK_EX
+                    if timeout is not None:
+                        flags |= fcntl.LOCK_NB
+                    fcntl.lockf(file_, flags)
+                    break
+                except (IOError, OSError):
+                    if timeout is None or time.time() - start > timeout:
+                        raise IOError('Could not lock %r' % (lock_fpath,))
+                    time.sleep(0.05)
+            try:
+                yield
+            finally:
+                fcntl.lockf(file_, fcntl.LOCK_UN)
+    elif HAVE_LOCKFILE:
+        with lockfile.LockFile(fpath, timeout=timeout):
+            yield
+    else:
+        yield
+
+
 def lock_and_load_cPkl(fpath, verbose=False):
-    with lockfile.LockFile(fpath + '.lock'):
+    with file_lock(fpath):
         return load_cPkl(fpath, verbose)
 
 
 def lock_and_save_cPkl(fpath, data, verbose=False):
-    with lockfile.LockFile(fpath + '.lock'):
+    with file_lock(fpath):
         return save_cPkl(fpath, data, verbose)
 
 
@@ -750,9 +865,389 @@ def save_numpy(fpath, data, verbose=None, **kwargs):
     verbose = _rectify_verb_write(verbose)
     if verbose:
         print('[util_io] * save_numpy(%r, data)' % util_path.tail(fpath))
+    if fpath.endswith('.npy'):
+        with atomic_write(fpath, 'wb') as file_:
+            return np.save(file_, data)
     return np.save(fpath, data)
 
 
+# ndarrays smaller than this are pickled inline by save_mmap
+__MMAP_MIN_NBYTES__ = 2 ** 16
+
+
+class _MmapPickler(pickle.Pickler):
+    """ Writes large ndarrays to separate .npy files instead of the pickle """
+
+    def __init__(self, file_, dpath, min_nbytes=__MMAP_MIN_NBYTES__):
+        super(_MmapPickler, self).__init__(file_, protocol=2)
+        self.dpath = dpath
+        self.min_nbytes = min_nbytes
+        self.num_arrays = 0
+
+    def persistent_id(self, obj):
+        if (
+            isinstance(obj, np.ndarray)
+            and not obj.dtype.hasobject
+            and obj.nbytes >= self.min_nbytes
+        ):
+            npy_fname = 'arr_%04d.npy' % (self.num_arrays,)
+            self.num_arrays += 1
+            np.save(join(self.dpath, npy_fname), obj, allow_pickle=False)
+            return ('npy', npy_fname)
+        return None
+
+
+class _MmapUnpickler(FixRenamedUnpickler):
+    """ Returns the .npy files written by _MmapPickler as read-only memmaps """
+
+    def __init__(self, file_, dpath, mmap_mode='r'):
+        super(_MmapUnpickler, self).__init__(file_)
+        self.dpath = dpath
+        self.mmap_mode = mmap_mode
+
+    def persistent_load(self, pid):
+        kind, npy_fname = pid
+        if kind != 'npy':
+            raise pickle.UnpicklingError('unknown persistent id %r' % (pid,))
+        return np.load(join(self.dpath, npy_fname), mmap_mode=self.mmap_mode)
+
+
+def save_mmap(fpath, data, verbose=None, min_nbytes=__MMAP_MIN_NBYTES__):
+    r"""
+    Saves data such that large ndarrays can be memory mapped when loaded.
+
+    ``fpath`` is a directory. Every ndarray in ``data`` of at least
+    ``min_nbytes`` is written to its own .npy file and the rest of the
+    structure is pickled. The directory is written under a temporary name.
+    Then the old directory is renamed aside, the new one is renamed into
+    place, and only then is the old one deleted. A reader never sees a
+    partial save, but can briefly find no directory, i.e. a cache miss.
+
+    Args:
+        fpath (str): directory to save to (conventionally ending in .mmap)
+        data (object): any picklable structure
+        min_nbytes (int): smaller ndarrays are pickled inline
+
+    CommandLine:
+        python -m utool.util_io save_mmap
+
+    Example:
+        >>> # ENABLE_DOCTEST
+        >>> from utool.util_io import *  # NOQA
+        >>> import utool as ut
+        >>> import numpy as np
+        >>> dpath = ut.ensure_app_resource_dir('utool', 'test_mmap')
+        >>> data = {'vecs': np.arange(128000, dtype=np.float32).reshape(-1, 128),
+        >>>         'small': np.arange(3), 'name': 'foo'}
+        >>> cacher = ut.Cacher('vecs', cfgstr='v1', cache_dir=dpath, ext='.mmap')
+        >>> cacher.save(data)
+        >>> data2 = cacher.load()
+        >>> assert isinstance(data2['vecs'], np.memmap)
+        >>> assert not data2['vecs'].flags.writeable
+        >>> assert np.all(data2['vecs'][5] == data['vecs'][5])
+        >>> assert type(data2['small']) is np.ndarray and data2['name'] == 'foo'
+        >>> # Overwriting swaps in the new save and leaves no old directory
+        >>> data['name'] = 'bar'
+        >>> cacher.save(data)
+        >>> assert cacher.load()['name'] == 'bar' and data2['vecs'][5, 0] == 640
+        >>> assert len(os.listdir(dpath)) == 1
+        >>> del data2
+        >>> ut.delete(dpath)
+    """
+    import shutil
+
+    verbose = _rectify_verb_write(verbose)
+    if verbose:
+        print('[util_io] * save_mmap(%r, data)' % (util_path.tail(fpath),))
+    tmp_dpath = fpath + '.tmp' + uuid.uuid4().hex[0:8]
+    util_path.ensuredir(tmp_dpath)
+    try:
+        with open(join(tmp_dpath, 'data.cPkl'), 'wb') as file_:
+            _MmapPickler(file_, tmp_dpath, min_nbytes=min_nbytes).dump(data)
+        old_fpath = None
+        if exists(fpath):
+            old_fpath = fpath + '.old' + uuid.uuid4().hex[0:8]
+            os.rename(fpath, old_fpath)
+        try:
+            os.rename(tmp_dpath, fpath)
+        except OSError:
+            if not exists(fpath):
+                if old_fpath is not None:
+                    os.rename(old_fpath, fpath)
+                raise
+            # A concurrent save got there first. Its data is as new as ours.
+            shutil.rmtree(tmp_dpath, ignore_errors=True)
+    except Exception:
+        shutil.rmtree(tmp_dpath, ignore_errors=True)
+        raise
+    if old_fpath is not None:
+        if isdir(old_fpath):
+            # On windows files of the old save that are still mapped remain
+            shutil.rmtree(old_fpath, ignore_errors=True)
+        else:
+            os.remove(old_fpath)
+
+
+def load_mmap(fpath, verbose=None, mmap_mode='r'):
+    """
+    Loads data written by :func:`save_mmap`. Large ndarrays are returned as
+    memmaps, so only the pages that are accessed are read from disk.
+    """
+    verbose = _rectify_verb_read(verbose)
+    if verbose:
+        print('[util_io] * load_mmap(%r)' % (util_path.tail(fpath),))
+    with open(join(fpath, 'data.cPkl'), 'rb') as file_:
+        data = _MmapUnpickler(file_, fpath, mmap_mode=mmap_mode).load()
+    return data
+
+
+# magic, number of out-of-band buffers, length of the pickle
+_PKL5_HEADER = struct.Struct('<4sQQ')
+_PKL5_MAGIC = b'UTP5'
+
+
+def _read_exact(file_, nbytes):
+    """ Reads exactly nbytes into a writable buffer """
+    buf = bytearray(nbytes)
+    view = memoryview(buf)
+    pos = 0
+    while pos < nbytes:
+        num = file_.readinto(view[pos:])
+        if not num:
+            raise EOFError('Expected %d bytes, got %d' % (nbytes, pos))
+        pos += num
+    return buf
+
+
+def _dump_pkl5(data, file_):
+    if pickle.HIGHEST_PROTOCOL < 5:
+        raise NotImplementedError('pickle protocol 5 requires python 3.8')
+    buffers = []
+    main = pickle.dumps(data, protocol=5, buffer_callback=buffers.append)
+    raw_list = [buf.raw() for buf in buffers]
+    file_.write(_PKL5_HEADER.pack(_PKL5_MAGIC, len(raw_list), len(main)))
+    file_.write(struct.pack('<%dQ' % len(raw_list), *[raw.nbytes for raw in raw_list]))
+    file_.write(main)
+    for raw in raw_list:
+        file_.write(raw)
+
+
+def _load_pkl5(file_):
+    magic, num_buffers, main_len = _PKL5_HEADER.unpack(
+        _read_exact(file_, _PKL5_HEADER.size)
+    )
+    if magic != _PKL5_MAGIC:
+        raise IOError('Not a pkl5 file')
+    lens = struct.unpack(
+        '<%dQ' % num_buffers, _read_exact(file_, 8 * num_buffers)
+    )
+    main = _read_exact(file_, main_len)
+    buffers = [_read_exact(file_, nbytes) for nbytes in lens]
+    return pickle.loads(main, buffers=buffers)
+
+
+def save_pkl5(fpath, data, verbose=None, durable=False):
+    """
+    Saves data with pickle protocol 5. The memory of ndarrays and other
+    buffers is written out-of-band, without the copies protocol 2 makes.
+
+    Example:
+        >>> # ENABLE_DOCTEST
+        >>> from utool.util_io import *  # NOQA
+        >>> import utool as ut
+        >>> import numpy as np
+        >>> dpath = ut.ensure_app_resource_dir('utool', 'test_pkl5')
+        >>> data = {'arr': np.arange(1000).reshape(10, 100), 'x': [1, 'a']}
+        >>> fpath = join(dpath, 'data.pkl5')
+        >>> save_data(fpath, data, verbose=False)
+        >>> data2 = load_data(fpath, verbose=False)
+        >>> assert np.all(data2['arr'] == data['arr']) and data2['x'] == [1, 'a']
+        >>> assert data2['arr'].flags.writeable
+        >>> ut.delete(dpath)
+    """
+    verbose = _rectify_verb_write(verbose)
+    if verbose:
+        print('[util_io] * save_pkl5(%r, data)' % (util_path.tail(fpath),))
+    with atomic_write(fpath, 'wb', durable=durable) as file_:
+        _dump_pkl5(data, file_)
+
+
+def load_pkl5(fpath, verbose=None):
+    verbose = _rectify_verb_read(verbose)
+    if verbose:
+        print('[util_io] * load_pkl5(%r)' % (util_path.tail(fpath),))
+    with open(fpath, 'rb') as file_:
+        return _load_pkl5(file_)
+
+
+# default compression level of each codec
+__COMPRESS_LEVELS__ = {'.zst': 3, '.lz4': 0}
+
+
+def _compressed_writer(file_, codec, level=None, threads=-1):
+    if level is None:
+        level = __COMPRESS_LEVELS__[codec]
+    if codec == '.zst':
+        import zstandard
+
+        # threads=-1 compresses on all cpus
+        cctx = zstandard.ZstdCompressor(level=level, threads=threads)
+        return cctx.stream_writer(file_, closefd=False)
+    elif codec == '.lz4':
+        import lz4.frame
+
+        return lz4.frame.LZ4FrameFile(file_, mode='wb', compression_level=level)
+    else:
+        raise ValueError('unknown codec=%r' % (codec,))
+
+
+def _compressed_reader(file_, codec):
+    if codec == '.zst':
+        import zstandard
+
+        return zstandard.ZstdDecompressor().stream_reader(file_, closefd=False)
+    elif codec == '.lz4':
+        import lz4.frame
+
+        return lz4.frame.LZ4FrameFile(file_, mode='rb')
+    else:
+        raise ValueError('unknown codec=%r' % (codec,))
+
+
+def save_compressed(fpath, data, verbose=None, level=None, threads=-1, durable=False):
+    r"""
+    Saves a compressed pickle. The extension picks the codec and the
+    extension before it the pickle format, e.g. ``data.pkl5.zst`` or
+    ``data.cPkl.lz4``. zstd (requires zstandard) compresses on ``threads``
+    threads. lz4 (requires lz4) is single threaded but decompresses faster.
+
+    Args:
+        fpath (str): file path ending in .zst or .lz4
+        data (object): any picklable object
+        level (int): compression level (default = 3 for zstd, 0 for lz4)
+        threads (int): zstd compression threads. -1 uses all cpus.
+        durable (bool): fsync before the file is renamed into place, see
+            atomic_write (default = False)
+    """
+    inner_ext, codec = splitext(splitext(fpath)[0])[1], splitext(fpath)[1]
+    verbose = _rectify_verb_write(verbose)
+    if verbose:
+        print('[util_io] * save_compressed(%r, data)' % (util_path.tail(fpath),))
+    with atomic_write(fpath, 'wb', durable=durable) as raw:
+        with _compressed_writer(raw, codec, level=level, threads=threads) as file_:
+            if inner_ext == '.pkl5':
+                _dump_pkl5(data, file_)
+            elif inner_ext in ['.pickle', '.cPkl', '.pkl']:
+                pickle.dump(data, file_, protocol=2)
+            else:
+                raise ValueError('unknown ext=%r for fpath=%r' % (inner_ext, fpath))
+
+
+def load_compressed(fpath, verbose=None):
+    inner_ext, codec = splitext(splitext(fpath)[0])[1], splitext(fpath)[1]
+    verbose = _rectify_verb_read(verbose)
+    if verbose:
+        print('[util_io] * load_compressed(%r)' % (util_path.tail(fpath),))
+    with open(fpath, 'rb') as raw:
+        with _compressed_reader(raw, codec) as file_:
+            if inner_ext == '.pkl5':
+                return _load_pkl5(file_)
+            elif inner_ext in ['.pickle', '.cPkl', '.pkl']:
+                return FixRenamedUnpickler(file_).load()
+            else:
+                raise ValueError('unknown ext=%r for fpath=%r' % (inner_ext, fpath))
+
+
+def benchmark_formats(data, exts=None, dpath=None, num=3, verbose=True):
+    r"""
+    Measures the size and the write and read throughput of ``data`` in each
+    format supported by :func:`save_data` to help choose one per artifact.
+    Formats that cannot store the data or need a missing package are
+    skipped.
+
+    Args:
+        data (object): a representative sample of the artifact
+        exts (list): extensions to try (default = all known)
+        dpath (str): directory for the temporary files (default = temp dir)
+        num (int): repetitions. The fastest time is reported. (default = 3)
+
+    Returns:
+        list: a dict per format with ext, nbytes, write_time, read_time,
+            write_MBps and read_MBps sorted by read_time
+
+    CommandLine:
+        python -m utool.util_io benchmark_formats
+
+    Example:
+        >>> # ENABLE_DOCTEST
+        >>> from utool.util_io import *  # NOQA
+        >>> import numpy as np
+        >>> data = {'vecs': np.zeros((1000, 128), dtype=np.uint8),
+        >>>         'ids': list(range(100))}
+        >>> rows = benchmark_formats(data, num=1, verbose=False)
+        >>> exts = [row['ext'] for row in rows]
+        >>> assert '.cPkl' in exts and '.pkl5' in exts
+    """
+    import shutil
+    import tempfile
+    import collections
+
+    if exts is None:
+        exts = ['.cPkl', '.pkl5', '.mmap', '.npy', '.json', '.hdf5']
+        exts += ['.cPkl.zst', '.pkl5.zst', '.pkl5.lz4']
+    tmp_dpath = tempfile.mkdtemp(dir=dpath)
+    rows = []
+    try:
+        for ext in exts:
+            fpath = join(tmp_dpath, 'bench' + ext)
+            write_times, read_times = [], []
+            try:
+                for _ in range(num):
+                    start = time.time()
+                    save_data(fpath, data, verbose=False)
+                    write_times.append(time.time() - start)
+                    start = time.time()
+                    load_data(fpath, verbose=False)
+                    read_times.append(time.time() - start)
+            except Exception as ex:
+                if verbose:
+                    print('[util_io] skipping %s: %s' % (ext, ex))
+                continue
+            if isdir(fpath):
+                nbytes = sum(
+                    os.path.getsize(join(fpath, fname)) for fname in os.listdir(fpath)
+                )
+            else:
+                nbytes = os.path.getsize(fpath)
+            row = collections.OrderedDict()
+            row['ext'] = ext
+            row['nbytes'] = nbytes
+            row['write_time'] = min(write_times)
+            row['read_time'] = min(read_times)
+            row['write_MBps'] = nbytes / max(row['write_time'], 1e-9) / 2 ** 20
+            row['read_MBps'] = nbytes / max(row['read_time'], 1e-9) / 2 ** 20
+            rows.append(row)
+    finally:
+        shutil.rmtree(tmp_dpath, ignore_errors=True)
+    rows = sorted(rows, key=lambda row: row['read_time'])
+    if verbose:
+        fmtstr = '{:>10} {:>12} {:>10} {:>10} {:>11} {:>10}'
+        header = ['ext', 'nbytes', 'write_s', 'read_s', 'write_MBps', 'read_MBps']
+        print(fmtstr.format(*header))
+        for row in rows:
+            print(
+                fmtstr.format(
+                    row['ext'],
+                    row['nbytes'],
+                    '%.4f' % row['write_time'],
+                    '%.4f' % row['read_time'],
+                    '%.1f' % row['write_MBps'],
+                    '%.1f' % row['read_MBps'],
+                )
+            )
+    return rows
+
+
 # def save_capnp(fpath, data, verbose=False):
 #    r"""
 #    Refernces:
@@ -10,6 +10,17 @@ from concurrent import futures
 # import sys
 import signal
 import ctypes
+import collections
+import contextlib
+import functools
+import heapq
+import itertools
+import math
+import os
+import shutil
+import time
+import uuid
+import warnings
 import six
 import threading
 from six.moves import map, range, zip  # NOQA
@@ -18,6 +29,7 @@ from utool import util_progress
 from utool import util_arg
 from utool import util_inject
 from utool import util_cplat
+from utool import util_time
 
 if six.PY2:
     # import thread as _thread
@@ -36,6 +48,9 @@ if SILENT:
         pass
 
 
+# Queue that a worker process reports task start times to
+__TASK_START_QUEUE__ = None
+
 # Default number of cores to use when doing parallel processing
 __NUM_PROCS__ = util_arg.get_argval(('--nprocs', '--num-procs'), type_=int, default=None)
 
@@ -67,6 +82,18 @@ def generate2(
     verbose=None,
     futures_threaded=True,
     timeout=3600,
+    pool=None,
+    window=None,
+    transport=None,
+    stream=False,
+    retries=0,
+    delay_schedule=None,
+    task_timeout=None,
+    records=False,
+    scheduler=None,
+    costs=None,
+    blas_threads=None,
+    pin_cpus=False,
 ):
     r"""
     Interfaces to either multiprocessing or futures.
@@ -89,6 +116,44 @@ def generate2(
         ordered (bool): (default = True)
         force_serial (bool): (default = False)
         verbose (bool):  verbosity flag(default = None)
+        pool (WorkerPool): a persistent pool to execute tasks with. If
+            unspecified a temporary pool is created for this call only.
+            (default = None)
+        window (int): maximum number of chunks in flight at any time, where
+            a chunk is ``chunksize`` tasks (default = pool.window)
+        chunksize (int or str): number of tasks sent to a worker at once. If
+            'auto', a warm-up sample of tasks is timed and the chunksize is
+            chosen to amortize the dispatch overhead. (default = None)
+        transport (str): if 'shared', large ndarray arguments and results are
+            passed between processes through memory mapped files instead of
+            being pickled. See :func:`WorkerPool.imap`. (default = None)
+        stream (bool): if True and ``args_gen`` has no length it is consumed
+            lazily instead of being cast to a list. This works with infinite
+            generators, and the progress shows the rate without a total.
+            (default = False)
+        retries (int): number of times a failed task is retried
+            (default = 0)
+        delay_schedule (list): seconds to wait before each retry
+            (default = [0.1, 1, 10])
+        task_timeout (float): seconds a single task may run, measured from
+            when it starts, before the task counts as failed. Process workers
+            always use a multiprocessing.Pool so only the stuck worker is
+            killed. Only enforced in parallel. (default = None)
+        records (bool): if True yields ``(index, result)`` tuples and failed
+            tasks yield ``(index, exception)`` instead of stopping the run
+            (default = False)
+        scheduler (str): 'guided' or 'lpt' to dispatch shrinking chunks, and
+            in the case of 'lpt' the most costly tasks first, so workers do
+            not idle at the tail of the job. The parallel efficiency is
+            reported if verbose. See :func:`WorkerPool.imap`.
+            (default = None)
+        costs (list or func): estimated cost of each task for the scheduler
+            (default = None)
+        blas_threads (int): limits the BLAS / OpenMP threads of each worker
+            process so numpy heavy tasks do not oversubscribe the machine.
+            Ignored if ``pool`` is given. (default = None)
+        pin_cpus (bool): if True each worker process is pinned to its own
+            cpu. Ignored if ``pool`` is given. (default = False)
 
     CommandLine:
         python -m utool.util_parallel generate2
@@ -107,6 +172,8 @@ def generate2(
         >>> _ = list(generate2(func, args_gen, use_pool=True))
         >>> _ = list(generate2(func, args_gen, futures_threaded=True))
         >>> _ = list(generate2(func, args_gen, ordered=False, verbose=False))
+        >>> _ = list(generate2(func, args_gen, chunksize='auto'))
+        >>> _ = list(generate2(func, iter(args_gen), stream=True))
 
     Example0:
         >>> # ENABLE_DOCTEST
@@ -149,6 +216,29 @@ def generate2(
         >>> print('flag_list2 = %r' % (flag_list1,))
         >>> print('flag_list3 = %r' % (flag_list1,))
 
+    Example:
+        >>> # ENABLE_DOCTEST
+        >>> # Stream an infinite generator through a worker pool
+        >>> import utool as ut
+        >>> import itertools as it
+        >>> args_gen = zip(it.count())
+        >>> flag_gen = ut.generate2(ut.is_prime, args_gen, stream=True, nprocs=2,
+        >>>                         verbose=0)
+        >>> flag_list = list(it.islice(flag_gen, 100))
+        >>> flag_gen.close()
+        >>> assert flag_list == [ut.is_prime(x) for x in range(100)]
+
+    Example:
+        >>> # ENABLE_DOCTEST
+        >>> # A single bad input does not lose the completed work
+        >>> import utool as ut
+        >>> args_list = [(x,) for x in [-1, 2, 'x', -4]]
+        >>> for force_serial in [True, False]:
+        >>>     records = list(ut.generate2(abs, args_list, records=True, nprocs=2,
+        >>>                                 force_serial=force_serial, verbose=0))
+        >>>     assert records[0:2] == [(0, 1), (1, 2)] and records[3] == (3, 4)
+        >>>     assert isinstance(records[2][1], TypeError)
+
     Example2:
         >>> # DISABLE_DOCTEST
         >>> # UNSTABLE_DOCTEST
@@ -216,17 +306,20 @@ def generate2(
     """
     if verbose is None:
         verbose = 2
+    _check_scheduler_options(scheduler, retries, task_timeout, records)
     if ntasks is None:
         ntasks = nTasks
     if ntasks is None:
         try:
             ntasks = len(args_gen)
         except TypeError:
-            # Cast to a list
-            args_gen = list(args_gen)
-            ntasks = len(args_gen)
-    if ntasks == 1 or ntasks < __MIN_PARALLEL_TASKS__:
-        force_serial = True
+            if not stream:
+                # Cast to a list
+                args_gen = list(args_gen)
+                ntasks = len(args_gen)
+    if ntasks is not None:
+        if ntasks == 1 or ntasks < __MIN_PARALLEL_TASKS__:
+            force_serial = True
     if __FORCE_SERIAL__:
         force_serial = __FORCE_SERIAL__
     if ntasks == 0:
@@ -234,76 +327,95 @@ def generate2(
             print('[ut.generate2] submitted 0 tasks')
         return
     if nprocs is None:
-        nprocs = min(ntasks, get_default_numprocs())
+        if pool is not None:
+            nprocs = pool.nprocs
+        elif ntasks is None:
+            nprocs = get_default_numprocs()
+        else:
+            nprocs = min(ntasks, get_default_numprocs())
     if nprocs == 1:
         force_serial = True
 
     if kw_gen is None:
-        kw_gen = [{}] * ntasks
+        kw_gen = itertools.repeat({})
     if isinstance(kw_gen, dict):
         # kw_gen can be a single dict applied to everything
-        kw_gen = [kw_gen] * ntasks
+        kw_gen = itertools.repeat(kw_gen)
 
     if force_serial:
         for result in _generate_serial2(
-            func, args_gen, kw_gen, ntasks=ntasks, progkw=progkw, verbose=verbose
+            func,
+            args_gen,
+            kw_gen,
+            ntasks=ntasks,
+            progkw=progkw,
+            verbose=verbose,
+            retries=retries,
+            delay_schedule=delay_schedule,
+            records=records,
         ):
             yield result
     else:
+        if pool is None:
+            if task_timeout is not None and not futures_threaded:
+                # only a multiprocessing.Pool can replace a single killed worker
+                use_pool = True
+            pool_ = WorkerPool(
+                nprocs,
+                futures_threaded=futures_threaded,
+                use_pool=use_pool,
+                blas_threads=blas_threads,
+                pin_cpus=pin_cpus,
+            )
+        else:
+            pool_ = pool
         if verbose:
-            gentype = 'mp' if use_pool else 'futures'
             fmtstr = '[generate2] executing {} {} tasks using {} {} procs'
-            print(fmtstr.format(ntasks, get_funcname(func), nprocs, gentype))
-
-        if verbose > 1:
-            lbl = '(pargen) %s: ' % (get_funcname(func),)
-            progkw_ = dict(freq=None, bs=True, adjust=False, freq_est='absolute')
-            progkw_.update(progkw)
-            # print('progkw_.update = {!r}'.format(progkw_.update))
-            progpart = util_progress.ProgPartial(length=ntasks, lbl=lbl, **progkw_)
-
-        if use_pool:
-            # Use multiprocessing
-            if chunksize is None:
-                chunksize = max(min(4, ntasks), min(8, ntasks // (nprocs ** 2)))
+            ntasks_str = 'a stream of' if ntasks is None else ntasks
+            print(fmtstr.format(ntasks_str, get_funcname(func), nprocs, pool_.backend))
 
-            try:
-                pool = multiprocessing.Pool(nprocs)
-                if ordered:
-                    pmap_func = pool.imap
-                else:
-                    pmap_func = pool.imap_unordered
-
-                wrapped_arg_gen = zip([func] * len(args_gen), args_gen, kw_gen)
-                res_gen = pmap_func(_kw_wrap_worker, wrapped_arg_gen, chunksize)
-                if verbose > 1:
-                    res_gen = progpart(res_gen)
-                for res in res_gen:
-                    yield res
-            finally:
-                pool.close()
-                pool.join()
-        else:
-            if futures_threaded:
-                executor_cls = futures.ThreadPoolExecutor
+        if chunksize is None:
+            if pool_.backend == 'mp' and ntasks is not None:
+                chunksize = max(min(4, ntasks), min(8, ntasks // (nprocs ** 2)))
             else:
-                executor_cls = futures.ProcessPoolExecutor
+                chunksize = 1
 
-            # Use futures
-            executor = executor_cls(nprocs)
-            try:
-                fs_list = [
-                    executor.submit(func, *a, **k) for a, k in zip(args_gen, kw_gen)
-                ]
-                fs_gen = fs_list
-                if not ordered:
-                    fs_gen = futures.as_completed(fs_gen)
-                if verbose > 1:
-                    fs_gen = progpart(fs_gen)
-                for fs in fs_gen:
-                    yield fs.result(timeout=timeout)
-            finally:
-                executor.shutdown(wait=True)
+        try:
+            res_gen = pool_.imap(
+                func,
+                args_gen,
+                kw_gen,
+                ordered=ordered,
+                chunksize=chunksize,
+                window=window,
+                timeout=timeout,
+                ntasks=ntasks,
+                transport=transport,
+                retries=retries,
+                delay_schedule=delay_schedule,
+                task_timeout=task_timeout,
+                records=records,
+                scheduler=scheduler,
+                costs=costs,
+            )
+            if verbose > 1:
+                lbl = '(pargen) %s: ' % (get_funcname(func),)
+                progkw_ = dict(freq=None, bs=True, adjust=False, freq_est='absolute')
+                progkw_.update(progkw)
+                progpart = util_progress.ProgPartial(
+                    length=0 if ntasks is None else ntasks, lbl=lbl, **progkw_
+                )
+                res_gen = progpart(res_gen)
+            for res in res_gen:
+                yield res
+            if scheduler is not None and verbose and pool_.last_stats is not None:
+                print(
+                    '[generate2] parallel efficiency = %.2f%%'
+                    % (pool_.last_stats['efficiency'] * 100,)
+                )
+        finally:
+            if pool is None:
+                pool_.shutdown(wait=True)
 
 
 def _kw_wrap_worker(func_args_kw):
@@ -311,8 +423,994 @@ def _kw_wrap_worker(func_args_kw):
     return func(*args, **kw)
 
 
+def _chunk_wrap_worker(func, task_chunk):
+    """ executes a chunk of (args, kw) tasks in a single worker call """
+    return [func(*args, **kw) for args, kw in task_chunk]
+
+
+def _timed_chunk_worker(func, task_chunk):
+    """ like _chunk_wrap_worker, but also returns the duration of each task """
+    duration_list = []
+    result_list = []
+    for args, kw in task_chunk:
+        start = util_time.default_timer()
+        result_list.append(func(*args, **kw))
+        duration_list.append(util_time.default_timer() - start)
+    return duration_list, result_list
+
+
+def _identity_worker(data):
+    return data
+
+
+def _init_task_start_queue(start_queue, initializer=None, initargs=()):
+    """ Worker initializer that installs the queue task starts are sent to """
+    global __TASK_START_QUEUE__
+    __TASK_START_QUEUE__ = start_queue
+    if initializer is not None:
+        initializer(*initargs)
+
+
+def _report_start_worker(start_queue, token, func, *args, **kw):
+    """ reports (token, pid, start time) to the pool, then runs the task """
+    if start_queue is None:
+        start_queue = __TASK_START_QUEUE__
+    start_queue.put((token, os.getpid(), time.time()))
+    return func(*args, **kw)
+
+
+def _check_scheduler_options(scheduler, retries, task_timeout, records):
+    """ schedulers dispatch whole chunks and cannot retry individual tasks """
+    if scheduler is not None and (retries or task_timeout is not None or records):
+        raise ValueError(
+            'scheduler=%r cannot be combined with retries, task_timeout, '
+            'or records' % (scheduler,)
+        )
+
+
+# ndarrays smaller than this are pickled as usual by the shared transport
+__SHARED_MIN_NBYTES__ = 2 ** 16
+
+
+class _SharedArrayHandle(object):
+    """ picklable reference to an ndarray saved in a shared memory file """
+
+    def __init__(self, fpath):
+        self.fpath = fpath
+
+
+def _make_shared_dpath():
+    """ makes a temporary directory, preferably on a RAM backed filesystem """
+    import tempfile
+
+    base = '/dev/shm'
+    if not (os.path.isdir(base) and os.access(base, os.W_OK)):
+        base = None
+    return tempfile.mkdtemp(prefix='utool_shm_', dir=base)
+
+
+def _share_ndarrays(data, dpath, fpaths):
+    """
+    Replaces large ndarrays inside of nested tuples, lists, and dicts with
+    handles to files in ``dpath``. The path of each new file is appended to
+    ``fpaths``.
+    """
+    try:
+        import numpy as np
+    except ImportError:
+        return data
+
+    def _share(item):
+        type_ = type(item)
+        if isinstance(item, np.ndarray):
+            if item.nbytes < __SHARED_MIN_NBYTES__ or item.dtype.hasobject:
+                return item
+            fpath = os.path.join(dpath, uuid.uuid4().hex + '.npy')
+            np.save(fpath, item, allow_pickle=False)
+            fpaths.append(fpath)
+            return _SharedArrayHandle(fpath)
+        elif type_ is tuple or type_ is list:
+            return type_([_share(x) for x in item])
+        elif type_ is dict:
+            return {key: _share(val) for key, val in six.iteritems(item)}
+        else:
+            return item
+
+    return _share(data)
+
+
+def _unshare_ndarrays(data, unlink=False):
+    """
+    Inverse of _share_ndarrays. Handles are replaced with read-only memory
+    mapped views. If unlink is True the backing files are removed, the data
+    stays valid until the returned arrays are deleted.
+    """
+    type_ = type(data)
+    if type_ is _SharedArrayHandle:
+        import numpy as np
+
+        arr = np.load(data.fpath, mmap_mode='r')
+        if unlink:
+            _remove_shared_files([data.fpath])
+        return arr
+    elif type_ is tuple or type_ is list:
+        return type_([_unshare_ndarrays(x, unlink) for x in data])
+    elif type_ is dict:
+        return {key: _unshare_ndarrays(val, unlink) for key, val in six.iteritems(data)}
+    else:
+        return data
+
+
+def _remove_shared_files(fpaths):
+    for fpath in fpaths:
+        try:
+            os.remove(fpath)
+        except OSError:
+            # windows cannot remove files that are still mapped
+            pass
+
+
+def _shared_call_worker(_func, _dpath, *args, **kw):
+    """ worker side of the shared transport """
+    args = _unshare_ndarrays(args)
+    kw = _unshare_ndarrays(kw)
+    result = _func(*args, **kw)
+    return _share_ndarrays(result, _dpath, [])
+
+
+# Default number of in-flight tasks allowed per worker in WorkerPool.imap
+__WINDOW_FACTOR__ = 4
+
+# Default seconds to wait before each retry of a failed task
+__RETRY_DELAY_SCHEDULE__ = [0.1, 1, 10]
+
+# Seconds between checks for tasks that started since the last check
+__TASK_START_POLL__ = 0.05
+
+# Number of warm-up tasks timed on a worker when chunksize='auto'
+__AUTOCHUNK_WARMUP__ = 8
+# Fraction of a chunk's runtime that dispatch overhead is allowed to take
+__AUTOCHUNK_OVERHEAD__ = 0.1
+__AUTOCHUNK_MAX__ = 4096
+
+
+class WorkerPool(object):
+    r"""
+    A persistent pool of workers that can be shared across many calls to
+    :func:`generate2`.
+
+    The pool is started once, so process startup cost is only paid a single
+    time. Tasks are dispatched lazily by :func:`WorkerPool.imap`, which never
+    has more than ``window`` chunks of tasks in flight. This keeps memory
+    usage proportional to the window instead of to the number of tasks.
+
+    Args:
+        nprocs (int): number of workers (default = get_default_numprocs())
+        futures_threaded (bool): if True workers are threads, otherwise
+            they are processes (default = False)
+        use_pool (bool): if True worker processes are managed by a
+            multiprocessing.Pool instead of a futures executor
+            (default = False)
+        maxtasksperchild (int): number of tasks a worker process completes
+            before it is replaced with a fresh process. Useful when native
+            extensions leak memory. Implies use_pool=True (default = None)
+        window (int): default maximum number of in-flight chunks
+            (default = 4 * nprocs)
+        initializer (func): called at the start of each worker process
+        initargs (tuple): arguments for the initializer
+        blas_threads (int): maximum BLAS / OpenMP threads in each worker
+            process. Setting this to 1 prevents nprocs workers from each
+            starting a thread per cpu. Not available for thread workers, use
+            :func:`limit_blas_threads` instead. (default = None)
+        pin_cpus (bool): if True each worker process is pinned round-robin to
+            one of the cpus available to this process (default = False)
+
+    CommandLine:
+        python -m utool.util_parallel WorkerPool
+
+    Example:
+        >>> # ENABLE_DOCTEST
+        >>> import utool as ut
+        >>> args_list = list(zip(range(100)))
+        >>> expected = [ut.is_prime(x) for x in range(100)]
+        >>> with ut.WorkerPool(nprocs=2, maxtasksperchild=10) as pool:
+        >>>     assert pool.backend == 'mp'
+        >>>     flags1 = list(ut.generate2(ut.is_prime, args_list, pool=pool, verbose=0))
+        >>>     flags2 = list(pool.imap(ut.is_prime, args_list, window=3))
+        >>>     flags3 = sorted(pool.imap(ut.is_prime, args_list, ordered=False))
+        >>> assert flags1 == expected
+        >>> assert flags2 == expected
+        >>> assert flags3 == sorted(expected)
+
+    Example:
+        >>> # ENABLE_DOCTEST
+        >>> import utool as ut
+        >>> pool = ut.WorkerPool(nprocs=2, futures_threaded=True)
+        >>> for _ in range(3):
+        >>>     result = list(pool.imap(ut.is_prime, zip(range(10)), chunksize=3))
+        >>> pool.shutdown()
+        >>> assert result == [ut.is_prime(x) for x in range(10)]
+
+    Example:
+        >>> # ENABLE_DOCTEST
+        >>> import utool as ut
+        >>> import os
+        >>> with ut.WorkerPool(nprocs=2, blas_threads=1, pin_cpus=True) as pool:
+        >>>     environ = list(pool.imap(os.getenv, [('OMP_NUM_THREADS',)] * 4))
+        >>> assert environ == ['1'] * 4
+    """
+
+    def __init__(
+        self,
+        nprocs=None,
+        futures_threaded=False,
+        use_pool=False,
+        maxtasksperchild=None,
+        window=None,
+        initializer=None,
+        initargs=(),
+        blas_threads=None,
+        pin_cpus=False,
+    ):
+        if nprocs is None:
+            nprocs = get_default_numprocs()
+        if maxtasksperchild is not None:
+            if futures_threaded:
+                raise ValueError('maxtasksperchild requires process workers')
+            use_pool = True
+        if blas_threads is not None or pin_cpus:
+            if futures_threaded:
+                raise ValueError(
+                    'blas_threads and pin_cpus require process workers. '
+                    'Use limit_blas_threads with thread workers'
+                )
+            cpu_ids = None
+            if pin_cpus and hasattr(os, 'sched_getaffinity'):
+                cpu_ids = sorted(os.sched_getaffinity(0))
+            counter = multiprocessing.Value('i', 0)
+            initargs = (blas_threads, cpu_ids, counter, initializer, initargs)
+            initializer = _init_worker_limits
+        if window is None:
+            window = __WINDOW_FACTOR__ * nprocs
+        self.nprocs = nprocs
+        self.window = window
+        self.maxtasksperchild = maxtasksperchild
+        self.initializer = initializer
+        self.initargs = initargs
+        self.blas_threads = blas_threads
+        self.pin_cpus = pin_cpus
+        # statistics of the last scheduled imap
+        self.last_stats = None
+        # workers report when they start a task that has a task_timeout
+        self._task_tokens = itertools.count()
+        self._task_starts = {}
+        self._pid_tokens = {}
+        self._start_lock = threading.Lock()
+        if futures_threaded:
+            self.backend = 'thread'
+        elif use_pool:
+            self.backend = 'mp'
+        else:
+            self.backend = 'process'
+        self._start()
+
+    def _start(self):
+        self._pool = None
+        self._executor = None
+        self._start_queue = None
+        # set when a killed worker leaves a result that will never arrive
+        self._orphaned = False
+        if self.backend == 'thread':
+            self._executor = futures.ThreadPoolExecutor(self.nprocs)
+            self._start_queue = queue.Queue()
+        elif self.backend == 'mp':
+            self._start_queue = multiprocessing.SimpleQueue()
+            self._pool = multiprocessing.Pool(
+                self.nprocs,
+                initializer=_init_task_start_queue,
+                initargs=(self._start_queue, self.initializer, self.initargs),
+                maxtasksperchild=self.maxtasksperchild,
+            )
+        else:
+            if self.initializer is not None:
+                self._executor = futures.ProcessPoolExecutor(
+                    self.nprocs, initializer=self.initializer, initargs=self.initargs
+                )
+            else:
+                self._executor = futures.ProcessPoolExecutor(self.nprocs)
+        self.closed = False
+
+    def __repr__(self):
+        return '<WorkerPool(backend=%s, nprocs=%d, window=%d)>' % (
+            self.backend,
+            self.nprocs,
+            self.window,
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type_, value, trace):
+        self.shutdown(wait=trace is None)
+        return False
+
+    def submit(self, func, *args, **kw):
+        """
+        Schedules ``func(*args, **kw)`` and returns a concurrent.futures.Future
+        regardless of the backend.
+        """
+        if self.closed:
+            raise RuntimeError('cannot submit to a closed WorkerPool')
+        if self._pool is not None:
+            fut = futures.Future()
+            # mark as running so the pool result handler always owns the future
+            fut.set_running_or_notify_cancel()
+            self._pool.apply_async(
+                func,
+                args,
+                kw,
+                callback=fut.set_result,
+                error_callback=fut.set_exception,
+            )
+            return fut
+        else:
+            return self._executor.submit(func, *args, **kw)
+
+    def imap(
+        self,
+        func,
+        args_gen,
+        kw_gen=None,
+        ordered=True,
+        chunksize=1,
+        window=None,
+        timeout=None,
+        ntasks=None,
+        transport=None,
+        retries=0,
+        delay_schedule=None,
+        task_timeout=None,
+        records=False,
+        scheduler=None,
+        costs=None,
+    ):
+        """
+        Lazily maps ``args_gen`` onto ``func`` using the workers in this pool.
+
+        Input is only consumed when there is room in the window, so
+        ``args_gen`` may be an arbitrary iterator.
+
+        Args:
+            func (function): live python function
+            args_gen (iterable): tuples of positional arguments
+            kw_gen (iterable): dicts of keyword arguments, or a single dict
+                applied to every task (default = None)
+            ordered (bool): if False results are yielded as they complete
+                (default = True)
+            chunksize (int or str): number of tasks sent to a worker at
+                once. If 'auto' the chunksize is measured using
+                :func:`WorkerPool.estimate_chunksize`. (default = 1)
+            window (int): maximum number of in-flight chunks. Each chunk
+                holds ``chunksize`` tasks. (default = self.window)
+            timeout (float): seconds to wait for any single result
+                (default = None)
+            ntasks (int): number of tasks if known. Used to keep chunks small
+                enough to balance the load when chunksize='auto'.
+            transport (str): if 'shared', large ndarrays in the arguments and
+                results are passed through memory mapped files (in /dev/shm
+                when available) instead of being pickled. The receiving side
+                gets read-only views. Ignored for thread workers.
+                (default = None)
+            retries (int): number of times a failed or timed out task is
+                retried (default = 0)
+            delay_schedule (list): seconds to wait before each retry, the
+                last delay is reused for further retries. Same convention as
+                :func:`utool.util_dev.delayed_retry_gen`.
+                (default = [0.1, 1, 10])
+            task_timeout (float): seconds a single task is allowed to run,
+                measured from when a worker starts it. With the 'mp' backend
+                the worker running a task that exceeds this is killed and
+                replaced. Thread workers cannot be killed, so the task is
+                abandoned and keeps its thread busy. The 'process' backend
+                does not support this. (default = None)
+            records (bool): if True yields ``(index, result)`` tuples, and a
+                task that still fails after all retries yields
+                ``(index, exception)`` instead of stopping the run.
+                (default = False)
+            scheduler (str): None dispatches tasks in input order. 'guided'
+                dispatches chunks that shrink as the remaining work shrinks,
+                so no worker idles at the tail of the job. 'lpt' (longest
+                processing time) is like 'guided' but dispatches the most
+                costly tasks first. The input is materialized, and
+                ``self.last_stats`` reports the parallel efficiency.
+                (default = None)
+            costs (list or func): estimated cost of each task, or a function
+                called like func that returns the cost. Used by the 'lpt'
+                scheduler and to size 'guided' chunks. The measured task
+                times of a previous run (``self.last_stats['task_times']``)
+                make good estimates. (default = None)
+
+        Note:
+            If any of retries, task_timeout, or records is specified each
+            task is dispatched individually (chunksize is ignored). These
+            options cannot be combined with a scheduler.
+
+        Yields:
+            object: result of each call to func
+
+        Example:
+            >>> # ENABLE_DOCTEST
+            >>> import utool as ut
+            >>> args_list = list(zip(range(1000)))
+            >>> with ut.WorkerPool(nprocs=2) as pool:
+            >>>     flags = list(pool.imap(ut.is_prime, args_list, chunksize='auto'))
+            >>> assert flags == [ut.is_prime(x) for x in range(1000)]
+
+        Example:
+            >>> # ENABLE_DOCTEST
+            >>> import utool as ut
+            >>> import numpy as np
+            >>> arrs = [np.full((128, 128), x) for x in range(8)]
+            >>> with ut.WorkerPool(nprocs=2) as pool:
+            >>>     sums = list(pool.imap(np.sum, zip(arrs), transport='shared'))
+            >>>     negs = list(pool.imap(np.negative, zip(arrs), transport='shared',
+            >>>                           chunksize=3))
+            >>> assert sums == [arr.sum() for arr in arrs]
+            >>> assert all(np.all(a == -b) for a, b in zip(negs, arrs))
+            >>> assert not negs[0].flags.writeable
+
+        Example:
+            >>> # ENABLE_DOCTEST
+            >>> import utool as ut
+            >>> import time
+            >>> from concurrent import futures
+            >>> args_list = [(0.0,), (0.05,), (10.0,), ('bad',), (0.0,)]
+            >>> with ut.WorkerPool(nprocs=2, use_pool=True) as pool:
+            >>>     records = list(pool.imap(time.sleep, args_list, retries=1,
+            >>>                              delay_schedule=[0], task_timeout=1.0,
+            >>>                              records=True))
+            >>>     # the pool is still usable after the stuck worker was killed
+            >>>     assert list(pool.imap(abs, [(-1,)])) == [1]
+            >>> assert [index for index, _ in records] == [0, 1, 2, 3, 4]
+            >>> assert records[1][1] is None
+            >>> assert isinstance(records[2][1], futures.TimeoutError)
+            >>> assert isinstance(records[3][1], TypeError)
+
+        Example:
+            >>> # ENABLE_DOCTEST
+            >>> import utool as ut
+            >>> import time
+            >>> import warnings
+            >>> # deadlines start when a task starts, not when it is queued
+            >>> with ut.WorkerPool(nprocs=2, futures_threaded=True) as pool:
+            >>>     with warnings.catch_warnings():
+            >>>         warnings.simplefilter('ignore', RuntimeWarning)
+            >>>         result = list(pool.imap(time.sleep, [(0.3,)] * 7,
+            >>>                                 task_timeout=0.5))
+            >>> assert result == [None] * 7
+
+        Example:
+            >>> # ENABLE_DOCTEST
+            >>> import utool as ut
+            >>> import time
+            >>> # heterogeneous task costs
+            >>> args_list = [(0.001 * (x % 7),) for x in range(40)]
+            >>> costs = [args[0] for args in args_list]
+            >>> with ut.WorkerPool(nprocs=2, futures_threaded=True) as pool:
+            >>>     result1 = list(pool.imap(time.sleep, args_list, scheduler='lpt',
+            >>>                              costs=costs))
+            >>>     stats = pool.last_stats
+            >>>     result2 = list(pool.imap(time.sleep, args_list, scheduler='guided'))
+            >>> assert result1 == result2 == [None] * 40
+            >>> assert stats['ntasks'] == 40 and len(stats['task_times']) == 40
+            >>> assert 0 < stats['efficiency'] <= 1.0
+            >>> # schedulers do not support the fault tolerant options
+            >>> with ut.WorkerPool(nprocs=2, futures_threaded=True) as pool:
+            >>>     res_gen = pool.imap(time.sleep, args_list, scheduler='lpt',
+            >>>                         retries=1)
+            >>>     ut.assert_raises(ValueError, list, res_gen)
+        """
+        if window is None:
+            window = self.window
+        if kw_gen is None:
+            kw_gen = itertools.repeat({})
+        elif isinstance(kw_gen, dict):
+            kw_gen = itertools.repeat(kw_gen)
+        task_iter = zip(args_gen, kw_gen)
+        _check_scheduler_options(scheduler, retries, task_timeout, records)
+        if retries or task_timeout is not None or records:
+            for item in self._imap_tolerant(
+                func,
+                task_iter,
+                ordered,
+                window,
+                timeout,
+                transport,
+                retries,
+                delay_schedule,
+                task_timeout,
+                records,
+            ):
+                yield item
+            return
+        if scheduler is not None:
+            for item in self._imap_scheduled(
+                func, task_iter, ordered, window, timeout, transport, scheduler, costs
+            ):
+                yield item
+            return
+        if chunksize == 'auto':
+            chunksize, warmup_results = self.estimate_chunksize(
+                func, task_iter, ntasks=ntasks
+            )
+            for res in warmup_results:
+                yield res
+        pending = collections.deque() if ordered else set()
+        shared = transport == 'shared' and self.backend != 'thread'
+        if shared:
+            shared_dpath = _make_shared_dpath()
+            func_ = functools.partial(_shared_call_worker, func, shared_dpath)
+        else:
+            func_ = func
+        # maps each future to a flag indicating if it computes a chunk of
+        # results and the shared files holding its arguments
+        fut_info = {}
+
+        def _submit_next():
+            task_chunk = list(itertools.islice(task_iter, chunksize))
+            if len(task_chunk) == 0:
+                return False
+            fpaths = []
+            if shared:
+                task_chunk = _share_ndarrays(task_chunk, shared_dpath, fpaths)
+            if chunksize > 1:
+                fut = self.submit(_chunk_wrap_worker, func_, task_chunk)
+            else:
+                args, kw = task_chunk[0]
+                fut = self.submit(func_, *args, **kw)
+            fut_info[fut] = (chunksize > 1, fpaths)
+            if ordered:
+                pending.append(fut)
+            else:
+                pending.add(fut)
+            return True
+
+        try:
+            exhausted = False
+            while True:
+                while not exhausted and len(pending) < window:
+                    exhausted = not _submit_next()
+                if len(pending) == 0:
+                    break
+                if ordered:
+                    done = [pending.popleft()]
+                else:
+                    done, _ = futures.wait(
+                        pending, timeout=timeout, return_when=futures.FIRST_COMPLETED
+                    )
+                    if len(done) == 0:
+                        raise futures.TimeoutError()
+                    pending.difference_update(done)
+                for fut in done:
+                    result = fut.result(timeout=timeout)
+                    is_chunk, fpaths = fut_info.pop(fut)
+                    result_list = result if is_chunk else [result]
+                    if shared:
+                        _remove_shared_files(fpaths)
+                        result_list = _unshare_ndarrays(result_list, unlink=True)
+                    for res in result_list:
+                        yield res
+        finally:
+            for fut in pending:
+                fut.cancel()
+            if shared:
+                shutil.rmtree(shared_dpath, ignore_errors=True)
+
+    def _imap_tolerant(
+        self,
+        func,
+        task_iter,
+        ordered,
+        window,
+        timeout,
+        transport,
+        retries,
+        delay_schedule,
+        task_timeout,
+        records,
+    ):
+        """ fault tolerant version of imap. See imap for argument details. """
+        if delay_schedule is None:
+            delay_schedule = __RETRY_DELAY_SCHEDULE__
+        if task_timeout is not None:
+            if self.backend == 'process':
+                raise ValueError(
+                    'task_timeout requires use_pool=True or thread workers'
+                )
+            if self.backend == 'thread':
+                warnings.warn(
+                    'Thread workers cannot be killed. A task that exceeds '
+                    'task_timeout keeps running and occupies its thread',
+                    RuntimeWarning,
+                )
+        shared = transport == 'shared' and self.backend != 'thread'
+        if shared:
+            shared_dpath = _make_shared_dpath()
+            func_ = functools.partial(_shared_call_worker, func, shared_dpath)
+        else:
+            func_ = func
+        # threads put start times directly on the queue, processes use the
+        # queue installed by their initializer
+        start_queue = self._start_queue if self.backend == 'thread' else None
+        # maps each future to [index, args, kw, attempt, token, fpaths]
+        pending = {}
+        # min-heap of (ready_time, index, args, kw, attempt) waiting to retry
+        retry_heap = []
+        reorder_buffer = {}
+        next_index = 0
+        index_iter = enumerate(task_iter)
+
+        def _submit(index, args, kw, attempt):
+            fpaths = []
+            if shared:
+                args, kw = _share_ndarrays((args, kw), shared_dpath, fpaths)
+            token = None
+            if task_timeout is None:
+                fut = self.submit(func_, *args, **kw)
+            else:
+                token = next(self._task_tokens)
+                fut = self.submit(
+                    _report_start_worker, start_queue, token, func_, *args, **kw
+                )
+            pending[fut] = [index, args, kw, attempt, token, fpaths]
+
+        def _pop_pending(fut):
+            info = pending.pop(fut)
+            with self._start_lock:
+                self._task_starts.pop(info[4], None)
+            return info
+
+        def _unshare_task(info):
+            # load shared arguments before their files are removed
+            index, args, kw, attempt = info[0:4]
+            if shared:
+                args, kw = _unshare_ndarrays((args, kw), unlink=True)
+            return index, args, kw, attempt
+
+        def _resubmit(info):
+            # resubmitted tasks that were lost do not use an attempt
+            _submit(*_unshare_task(info))
+
+        try:
+            exhausted = False
+            while True:
+                now = util_time.default_timer()
+                while retry_heap and retry_heap[0][0] <= now and len(pending) < window:
+                    _, index, args, kw, attempt = heapq.heappop(retry_heap)
+                    _submit(index, args, kw, attempt)
+                while not exhausted and len(pending) < window:
+                    for index, (args, kw) in index_iter:
+                        _submit(index, args, kw, 0)
+                        break
+                    else:
+                        exhausted = True
+                if len(pending) == 0 and len(retry_heap) == 0:
+                    break
+                # Wake up for the next completion, deadline, or due retry
+                wait_list = []
+                if task_timeout is not None and pending:
+                    self._poll_task_starts()
+                    wall_now = time.time()
+                    for info in pending.values():
+                        started = self._task_starts.get(info[4])
+                        if started is None:
+                            wait_list.append(__TASK_START_POLL__)
+                        else:
+                            wait_list.append(started[1] + task_timeout - wall_now)
+                if retry_heap:
+                    wait_list.append(retry_heap[0][0] - now)
+                wait_time = timeout
+                if wait_list:
+                    wait_time = max(0, min(wait_list))
+                    if timeout is not None:
+                        wait_time = min(wait_time, timeout)
+                if pending:
+                    done, _ = futures.wait(
+                        list(pending), timeout=wait_time, return_when=futures.FIRST_COMPLETED
+                    )
+                else:
+                    time.sleep(wait_time)
+                    done = []
+                if len(done) == 0 and not wait_list:
+                    raise futures.TimeoutError()
+                if task_timeout is not None:
+                    # a finished task always reported its start before this
+                    self._poll_task_starts()
+                completed = []
+                failed = []
+                is_broken = False
+                for fut in done:
+                    info = _pop_pending(fut)
+                    try:
+                        result = fut.result()
+                    except Exception as ex:
+                        is_broken |= type(ex).__name__ == 'BrokenProcessPool'
+                        failed.append((info, ex))
+                    else:
+                        _remove_shared_files(info[5])
+                        if shared:
+                            result = _unshare_ndarrays(result, unlink=True)
+                        completed.append((info[0], result))
+                if task_timeout is not None:
+                    wall_now = time.time()
+                    killed_pids = set()
+                    for fut, info in list(pending.items()):
+                        started = self._task_starts.get(info[4])
+                        if started is None or started[1] + task_timeout > wall_now:
+                            continue
+                        pid = started[0]
+                        _pop_pending(fut)
+                        fut.cancel()
+                        if self.backend == 'mp' and self._kill_task_worker(info[4], pid):
+                            killed_pids.add(pid)
+                        msg = 'task %d timed out after %r seconds' % (
+                            info[0],
+                            task_timeout,
+                        )
+                        failed.append((info, futures.TimeoutError(msg)))
+                    if killed_pids:
+                        # a killed worker may have started another task
+                        self._poll_task_starts()
+                        for fut, info in list(pending.items()):
+                            started = self._task_starts.get(info[4])
+                            if started is not None and started[0] in killed_pids:
+                                _resubmit(_pop_pending(fut))
+                if is_broken:
+                    # every in-flight task was lost with the broken executor
+                    lost = [_pop_pending(fut) for fut in list(pending)]
+                    self._replace_broken_executor()
+                    for info in lost:
+                        _resubmit(info)
+                for info, ex in failed:
+                    index, args, kw, attempt = _unshare_task(info)
+                    if attempt < retries:
+                        delay = delay_schedule[min(attempt, len(delay_schedule) - 1)]
+                        heapq.heappush(retry_heap, (now + delay, index, args, kw, attempt + 1))
+                    elif records:
+                        completed.append((index, ex))
+                    else:
+                        raise ex
+                for index, value in completed:
+                    item = (index, value) if records else value
+                    if ordered:
+                        reorder_buffer[index] = item
+                        while next_index in reorder_buffer:
+                            yield reorder_buffer.pop(next_index)
+                            next_index += 1
+                    else:
+                        yield item
+        finally:
+            for fut in list(pending):
+                _remove_shared_files(_pop_pending(fut)[5])
+                fut.cancel()
+            if shared:
+                shutil.rmtree(shared_dpath, ignore_errors=True)
+
+    def _poll_task_starts(self):
+        """ records the start of tasks that workers reported since last call """
+        with self._start_lock:
+            start_queue = self._start_queue
+            while True:
+                if self.backend == 'thread':
+                    try:
+                        token, pid, start = start_queue.get_nowait()
+                    except queue.Empty:
+                        break
+                elif start_queue is not None and not start_queue.empty():
+                    token, pid, start = start_queue.get()
+                else:
+                    break
+                self._task_starts[token] = (pid, start)
+                self._pid_tokens[pid] = token
+
+    def _kill_task_worker(self, token, pid):
+        """
+        Kills the worker process ``pid`` if it is still running task ``token``.
+        The multiprocessing.Pool replaces the killed worker.
+        """
+        with self._start_lock:
+            if self._pid_tokens.get(pid) != token:
+                return False
+            self._pid_tokens.pop(pid)
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except OSError:
+                return False
+            self._orphaned = True
+            return True
+
+    def _replace_broken_executor(self):
+        """ A process executor is unusable once any of its workers died """
+        self._executor.shutdown(wait=False)
+        self._start()
+
+    def _imap_scheduled(
+        self, func, task_iter, ordered, window, timeout, transport, scheduler, costs
+    ):
+        """ cost aware version of imap. See imap for argument details. """
+        if scheduler not in {'guided', 'lpt'}:
+            raise ValueError('unknown scheduler=%r' % (scheduler,))
+        # Stats from a previous run must not be mistaken for this one
+        self.last_stats = None
+        task_list = list(task_iter)
+        ntasks = len(task_list)
+        if costs is None:
+            cost_list = [1.0] * ntasks
+        elif callable(costs):
+            cost_list = [costs(*args, **kw) for args, kw in task_list]
+        else:
+            cost_list = list(costs)
+        # Guard against zero or negative estimates
+        min_cost = min([c for c in cost_list if c > 0] or [1.0])
+        cost_list = [max(c, min_cost) for c in cost_list]
+        if scheduler == 'lpt':
+            order = sorted(range(ntasks), key=lambda index: -cost_list[index])
+        else:
+            order = list(range(ntasks))
+        # A short queue of chunks lets each chunk be sized just before an idle
+        # worker takes it.
+        window = min(window, 2 * self.nprocs)
+        shared = transport == 'shared' and self.backend != 'thread'
+        if shared:
+            shared_dpath = _make_shared_dpath()
+            func_ = functools.partial(_shared_call_worker, func, shared_dpath)
+        else:
+            func_ = func
+        remaining = collections.deque(order)
+        remaining_cost = [sum(cost_list)]
+        task_times = [None] * ntasks
+        # maps each future to the task indices it computes and shared files
+        pending = {}
+        reorder_buffer = {}
+        next_index = 0
+
+        def _submit_next():
+            if len(remaining) == 0:
+                return False
+            # guided self-scheduling: chunk cost is a fraction of what remains
+            target_cost = remaining_cost[0] / (2 * self.nprocs)
+            index_chunk = [remaining.popleft()]
+            chunk_cost = cost_list[index_chunk[0]]
+            while remaining and chunk_cost + cost_list[remaining[0]] <= target_cost:
+                index_chunk.append(remaining.popleft())
+                chunk_cost += cost_list[index_chunk[-1]]
+            remaining_cost[0] -= chunk_cost
+            task_chunk = [task_list[index] for index in index_chunk]
+            fpaths = []
+            if shared:
+                task_chunk = _share_ndarrays(task_chunk, shared_dpath, fpaths)
+            fut = self.submit(_timed_chunk_worker, func_, task_chunk)
+            pending[fut] = (index_chunk, fpaths)
+            return True
+
+        start_time = util_time.default_timer()
+        try:
+            exhausted = False
+            while True:
+                while not exhausted and len(pending) < window:
+                    exhausted = not _submit_next()
+                if len(pending) == 0:
+                    break
+                done, _ = futures.wait(
+                    list(pending), timeout=timeout, return_when=futures.FIRST_COMPLETED
+                )
+                if len(done) == 0:
+                    raise futures.TimeoutError()
+                for fut in done:
+                    index_chunk, fpaths = pending.pop(fut)
+                    duration_list, result_list = fut.result()
+                    if shared:
+                        _remove_shared_files(fpaths)
+                        result_list = _unshare_ndarrays(result_list, unlink=True)
+                    for index, duration, result in zip(
+                        index_chunk, duration_list, result_list
+                    ):
+                        task_times[index] = duration
+                        if ordered:
+                            reorder_buffer[index] = result
+                        else:
+                            yield result
+                    while next_index in reorder_buffer:
+                        yield reorder_buffer.pop(next_index)
+                        next_index += 1
+            wall_time = util_time.default_timer() - start_time
+            busy_time = sum(task_times)
+            self.last_stats = {
+                'ntasks': ntasks,
+                'nprocs': self.nprocs,
+                'wall_time': wall_time,
+                'busy_time': busy_time,
+                'efficiency': busy_time / max(wall_time * self.nprocs, 1e-9),
+                'task_times': task_times,
+            }
+        finally:
+            for fut in pending:
+                fut.cancel()
+            if shared:
+                shutil.rmtree(shared_dpath, ignore_errors=True)
+
+    def estimate_chunksize(self, func, task_iter, ntasks=None, nwarmup=None):
+        """
+        Chooses a chunksize that amortizes the dispatch overhead of this pool.
+
+        The first ``nwarmup`` tasks are consumed from ``task_iter`` and run as
+        one chunk on a worker, so the worker initializer applies, to measure
+        the per-task latency. The round trip time of sending the warm-up
+        arguments to a worker and back measures the IPC / pickling overhead.
+        Chunks are sized so the overhead is a small fraction of the time
+        spent computing each chunk.
+
+        Args:
+            func (function): live python function
+            task_iter (iterator): iterator over (args, kw) tuples
+            ntasks (int): total number of tasks if known (default = None)
+            nwarmup (int): number of warm-up tasks (default = 8)
+
+        Returns:
+            tuple: (chunksize, warmup_results)
+        """
+        if nwarmup is None:
+            nwarmup = __AUTOCHUNK_WARMUP__
+        warmup_tasks = list(itertools.islice(task_iter, nwarmup))
+        if len(warmup_tasks) == 0:
+            return 1, []
+        duration_list, warmup_results = self.submit(
+            _timed_chunk_worker, func, warmup_tasks
+        ).result()
+        task_time = sum(duration_list) / len(warmup_tasks)
+        dispatch_times = []
+        for _ in range(3):
+            start = util_time.default_timer()
+            self.submit(_identity_worker, warmup_tasks[0]).result()
+            dispatch_times.append(util_time.default_timer() - start)
+        dispatch_time = min(dispatch_times)
+        chunk_time = max(task_time, 1e-9) * __AUTOCHUNK_OVERHEAD__
+        chunksize = int(math.ceil(dispatch_time / chunk_time))
+        if ntasks is not None:
+            # keep enough chunks so every worker stays busy until the end
+            nremain = ntasks - len(warmup_tasks)
+            chunksize = min(chunksize, nremain // (self.nprocs * __WINDOW_FACTOR__))
+        chunksize = max(1, min(chunksize, __AUTOCHUNK_MAX__))
+        return chunksize, warmup_results
+
+    def shutdown(self, wait=True):
+        """ Stops accepting tasks and releases the workers """
+        if self.closed:
+            return
+        self.closed = True
+        if self._pool is not None:
+            # Pool.join never returns while the result of a killed worker's
+            # task is outstanding
+            if wait and not self._orphaned:
+                self._pool.close()
+                self._pool.join()
+            else:
+                self._pool.terminate()
+        else:
+            self._executor.shutdown(wait=wait)
+
+
 def _generate_serial2(
-    func, args_gen, kw_gen=None, ntasks=None, progkw={}, verbose=None, nTasks=None
+    func,
+    args_gen,
+    kw_gen=None,
+    ntasks=None,
+    progkw={},
+    verbose=None,
+    nTasks=None,
+    retries=0,
+    delay_schedule=None,
+    records=False,
 ):
     """ internal serial generator  """
     if verbose is None:
@@ -320,29 +1418,56 @@ def _generate_serial2(
     if ntasks is None:
         ntasks = nTasks
     if ntasks is None:
-        ntasks = len(args_gen)
+        try:
+            ntasks = len(args_gen)
+        except TypeError:
+            # length is unknown when streaming
+            pass
     if verbose > 0:
         print(
-            '[ut._generate_serial2] executing %d %s tasks in serial'
-            % (ntasks, get_funcname(func))
+            '[ut._generate_serial2] executing %s %s tasks in serial'
+            % ('a stream of' if ntasks is None else ntasks, get_funcname(func))
         )
 
     # kw_gen can be a single dict applied to everything
     if kw_gen is None:
-        kw_gen = [{}] * ntasks
+        kw_gen = itertools.repeat({})
     if isinstance(kw_gen, dict):
-        kw_gen = [kw_gen] * ntasks
+        kw_gen = itertools.repeat(kw_gen)
 
     # Get iterator with or without progress
     if verbose > 1:
         lbl = '(sergen) %s: ' % (get_funcname(func),)
         progkw_ = dict(freq=None, bs=True, adjust=False, freq_est='between')
         progkw_.update(progkw)
-        args_gen = util_progress.ProgIter(args_gen, length=ntasks, lbl=lbl, **progkw_)
+        args_gen = util_progress.ProgIter(
+            args_gen, length=0 if ntasks is None else ntasks, lbl=lbl, **progkw_
+        )
+
+    if not retries and not records:
+        for args, kw in zip(args_gen, kw_gen):
+            result = func(*args, **kw)
+            yield result
+        return
 
-    for args, kw in zip(args_gen, kw_gen):
-        result = func(*args, **kw)
-        yield result
+    if delay_schedule is None:
+        delay_schedule = __RETRY_DELAY_SCHEDULE__
+    for index, (args, kw) in enumerate(zip(args_gen, kw_gen)):
+        for attempt in range(retries + 1):
+            try:
+                result = func(*args, **kw)
+            except Exception as ex:
+                if attempt < retries:
+                    time.sleep(delay_schedule[min(attempt, len(delay_schedule) - 1)])
+                    continue
+                if not records:
+                    raise
+                result = ex
+            break
+        if records:
+            yield (index, result)
+        else:
+            yield result
 
 
 def set_num_procs(num_procs):
@@ -363,10 +1488,59 @@ def get_sys_thread_limit():
 
     if ut.LINUX:
         out, err, ret = ut.cmd('ulimit', '-u', verbose=False, quiet=True, shell=True)
+        return int(out.strip()) if out.strip().isdigit() else None
     else:
         raise NotImplementedError('')
 
 
+def _get_cgroup_cpu_quota():
+    """
+    Returns the number of cpus allowed by a cgroup quota (e.g. a docker
+    --cpus limit) or None if there is no quota.
+    """
+    try:
+        # cgroup v2
+        with open('/sys/fs/cgroup/cpu.max', 'r') as file_:
+            quota, period = file_.read().split()[0:2]
+        if quota == 'max':
+            return None
+        return float(quota) / float(period)
+    except (IOError, OSError, ValueError):
+        pass
+    try:
+        # cgroup v1
+        with open('/sys/fs/cgroup/cpu/cpu.cfs_quota_us', 'r') as file_:
+            quota = int(file_.read())
+        with open('/sys/fs/cgroup/cpu/cpu.cfs_period_us', 'r') as file_:
+            period = int(file_.read())
+        if quota <= 0 or period <= 0:
+            return None
+        return quota / period
+    except (IOError, OSError, ValueError):
+        return None
+
+
+def get_available_cpus():
+    """
+    Returns the number of cpus this process may actually use. Respects the
+    cpu affinity mask and cgroup cpu quotas, unlike multiprocessing.cpu_count.
+
+    Example:
+        >>> # ENABLE_DOCTEST
+        >>> from utool.util_parallel import *  # NOQA
+        >>> ncpus = get_available_cpus()
+        >>> assert 1 <= ncpus <= multiprocessing.cpu_count()
+    """
+    if hasattr(os, 'sched_getaffinity'):
+        ncpus = len(os.sched_getaffinity(0))
+    else:
+        ncpus = multiprocessing.cpu_count()
+    quota = _get_cgroup_cpu_quota()
+    if quota is not None:
+        ncpus = min(ncpus, int(math.ceil(quota)))
+    return max(ncpus, 1)
+
+
 def get_default_numprocs():
     if __NUM_PROCS__ is not None:
         return __NUM_PROCS__
@@ -374,10 +1548,92 @@ def get_default_numprocs():
     #    num_procs = 3  # default windows to 3 processes for now
     # else:
     #    num_procs = max(multiprocessing.cpu_count() - 2, 1)
-    num_procs = max(multiprocessing.cpu_count() - 1, 1)
+    num_procs = max(get_available_cpus() - 1, 1)
     return num_procs
 
 
+# Environment variables that control the size of BLAS / OpenMP thread pools
+BLAS_THREAD_ENVVARS = [
+    'OMP_NUM_THREADS',
+    'OPENBLAS_NUM_THREADS',
+    'MKL_NUM_THREADS',
+    'VECLIB_MAXIMUM_THREADS',
+    'NUMEXPR_NUM_THREADS',
+]
+
+
+@contextlib.contextmanager
+def limit_blas_threads(nthreads=1):
+    """
+    Context manager that limits the threads used by BLAS and OpenMP
+    libraries, which avoids oversubscribing the machine when numpy heavy
+    functions run in parallel.
+
+    The environment variables are set so child processes started inside the
+    context are limited. Libraries that are already loaded are limited with
+    threadpoolctl when it is installed.
+
+    Args:
+        nthreads (int): maximum threads per BLAS / OpenMP pool (default = 1)
+
+    Example:
+        >>> # ENABLE_DOCTEST
+        >>> from utool.util_parallel import *  # NOQA
+        >>> import os
+        >>> prev = os.environ.get('OMP_NUM_THREADS')
+        >>> with limit_blas_threads(2):
+        >>>     assert os.environ['OMP_NUM_THREADS'] == '2'
+        >>> assert os.environ.get('OMP_NUM_THREADS') == prev
+    """
+    prev_environ = {key: os.environ.get(key) for key in BLAS_THREAD_ENVVARS}
+    for key in BLAS_THREAD_ENVVARS:
+        os.environ[key] = str(nthreads)
+    limiter = _threadpoolctl_limits(nthreads)
+    try:
+        yield
+    finally:
+        if limiter is not None:
+            limiter.restore_original_limits()
+        for key, value in prev_environ.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+
+
+def _threadpoolctl_limits(nthreads):
+    try:
+        import threadpoolctl
+    except ImportError:
+        return None
+    return threadpoolctl.threadpool_limits(limits=nthreads)
+
+
+# Keeps the threadpoolctl limits of a worker process alive
+__WORKER_LIMITER__ = None
+
+
+def _init_worker_limits(
+    blas_threads, cpu_ids, counter, initializer=None, initargs=()
+):
+    """
+    Worker initializer that limits BLAS / OpenMP threads and pins the worker
+    to a single cpu. Each new worker takes the next cpu in ``cpu_ids``.
+    """
+    global __WORKER_LIMITER__
+    if blas_threads is not None:
+        for key in BLAS_THREAD_ENVVARS:
+            os.environ[key] = str(blas_threads)
+        __WORKER_LIMITER__ = _threadpoolctl_limits(blas_threads)
+    if cpu_ids and hasattr(os, 'sched_setaffinity'):
+        with counter.get_lock():
+            worker_num = counter.value
+            counter.value += 1
+        os.sched_setaffinity(0, {cpu_ids[worker_num % len(cpu_ids)]})
+    if initializer is not None:
+        initializer(*initargs)
+
+
 def init_worker():
     signal.signal(signal.SIGINT, signal.SIG_IGN)
 
@@ -798,7 +2054,9 @@ def _test_buffered_generator_img():
     # _test_buffered_generator_general2(bgfunc, args, sleepfunc_bufwin, target_looptime, serial_cheat, buffer_size=4, show_serial=True)
 
 
-def buffered_generator(source_gen, buffer_size=2, use_multiprocessing=False):
+def buffered_generator(
+    source_gen, buffer_size=2, use_multiprocessing=False, transport=None
+):
     r"""
     Generator that runs a slow source generator in a separate process.
 
@@ -811,6 +2069,9 @@ def buffered_generator(source_gen, buffer_size=2, use_multiprocessing=False):
             (length of the buffer) (default = 2)
         use_multiprocessing (bool): if False uses GIL-hindered threading
             instead of multiprocessing (defualt = False).
+        transport (str): if 'shared' and use_multiprocessing is True, large
+            ndarrays are sent through memory mapped files instead of the
+            queue's pipe and are yielded as read-only views (default = None).
 
     Note:
         use_multiprocessing = True seems to freeze if passed in a generator
@@ -886,18 +2147,29 @@ def buffered_generator(source_gen, buffer_size=2, use_multiprocessing=False):
     # process. A reasonable hack is to use the StopIteration exception instead
     sentinal = StopIteration
 
-    process = Process(target=target, args=(iter(source_gen), buffer_, sentinal))
+    args = (iter(source_gen), buffer_, sentinal)
+    shared_dpath = None
+    if use_multiprocessing and transport == 'shared':
+        shared_dpath = _make_shared_dpath()
+        args = args + (shared_dpath,)
+    process = Process(target=target, args=args)
     # if not use_multiprocessing:
     process.daemon = True
 
     process.start()
 
-    while True:
-        # output = buffer_.get(timeout=1.0)
-        output = buffer_.get()
-        if output is sentinal:
-            return
-        yield output
+    try:
+        while True:
+            # output = buffer_.get(timeout=1.0)
+            output = buffer_.get()
+            if output is sentinal:
+                return
+            if shared_dpath is not None:
+                output = _unshare_ndarrays(output, unlink=True)
+            yield output
+    finally:
+        if shared_dpath is not None:
+            shutil.rmtree(shared_dpath, ignore_errors=True)
 
     # _iter = iter(buffer_.get, sentinal)
     # for data in _iter:
@@ -914,9 +2186,11 @@ def _buffered_generation_thread(source_gen, buffer_, sentinal):
     buffer_.put(sentinal)
 
 
-def _buffered_generation_process(source_gen, buffer_, sentinal):
+def _buffered_generation_process(source_gen, buffer_, sentinal, shared_dpath=None):
     """ helper for buffered_generator """
     for data in source_gen:
+        if shared_dpath is not None:
+            data = _share_ndarrays(data, shared_dpath, [])
         buffer_.put(data, block=True)
     # sentinel: signal the end of the iterator
     buffer_.put(sentinal)
@@ -925,6 +2199,323 @@ def _buffered_generation_process(source_gen, buffer_, sentinal):
     buffer_.close()
 
 
+class PipelineError(Exception):
+    """ raised in the consumer when a Pipeline stage fails """
+    pass
+
+
+# Seconds between checks for errors and shutdown requests in a Pipeline
+__PIPELINE_POLL__ = 0.1
+
+
+def _pipeline_put(queue_, item, stop):
+    """ blocking put that gives up when the pipeline is stopped """
+    while not stop.is_set():
+        try:
+            queue_.put(item, timeout=__PIPELINE_POLL__)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+
+def _pipeline_feeder(source_gen, out_queue, nout, stop, error_queue):
+    """ helper for Pipeline. Feeds (index, item) pairs into the first stage """
+    try:
+        for index, data in enumerate(source_gen):
+            if not _pipeline_put(out_queue, (index, data), stop):
+                return
+        for _ in range(nout):
+            _pipeline_put(out_queue, StopIteration, stop)
+    except Exception as ex:
+        import traceback
+
+        error_queue.put(('source', repr(ex), traceback.format_exc()))
+
+
+def _pipeline_worker(
+    func, name, in_queue, out_queue, nout, nalive, stop, error_queue, count, busy
+):
+    """ helper for Pipeline. Runs a single worker of a stage """
+    try:
+        while not stop.is_set():
+            try:
+                item = in_queue.get(timeout=__PIPELINE_POLL__)
+            except queue.Empty:
+                continue
+            if item is StopIteration:
+                break
+            index, data = item
+            start = util_time.default_timer()
+            result = func(data)
+            ellapsed = util_time.default_timer() - start
+            with count.get_lock():
+                count.value += 1
+            with busy.get_lock():
+                busy.value += ellapsed
+            if not _pipeline_put(out_queue, (index, result), stop):
+                return
+        else:
+            return
+        # The last worker of a stage to finish signals the end of the stream to
+        # every worker of the next stage
+        with nalive.get_lock():
+            nalive.value -= 1
+            is_last = nalive.value == 0
+        if is_last:
+            for _ in range(nout):
+                _pipeline_put(out_queue, StopIteration, stop)
+    except Exception as ex:
+        import traceback
+
+        error_queue.put((name, repr(ex), traceback.format_exc()))
+
+
+class Pipeline(object):
+    r"""
+    Runs a chain of functions concurrently, like a multi-stage
+    :func:`buffered_generator`.
+
+    Each stage has its own number of thread or process workers. Stages are
+    connected by bounded queues, so a slow stage applies backpressure to the
+    stages before it. Exceptions in any stage (or in the source) stop the
+    pipeline and are re-raised in the consumer as a PipelineError, and dead
+    worker processes are detected instead of hanging.
+
+    Args:
+        buffer_size (int): default maximum size of the queue in front of each
+            stage (default = 4)
+        ordered (bool): if True results are yielded in the order of the
+            source even when stages have several workers (default = True)
+
+    CommandLine:
+        python -m utool.util_parallel Pipeline
+
+    Example:
+        >>> # ENABLE_DOCTEST
+        >>> import utool as ut
+        >>> pipe = ut.Pipeline(buffer_size=4)
+        >>> pipe.add_stage(abs, nworkers=2, name='load')
+        >>> pipe.add_stage(ut.is_prime, nworkers=2, use_multiprocessing=True)
+        >>> pipe.add_stage(int, name='write')
+        >>> result = list(pipe.run(range(-100, 0)))
+        >>> assert result == [int(ut.is_prime(abs(x))) for x in range(-100, 0)]
+        >>> stats = pipe.stats()
+        >>> assert list(stats.keys()) == ['load', 'is_prime', 'write']
+        >>> assert stats['is_prime']['count'] == 100
+
+    Example:
+        >>> # ENABLE_DOCTEST
+        >>> import utool as ut
+        >>> def bad_stage(x):
+        >>>     if x == 5:
+        >>>         raise ValueError('bad input')
+        >>>     return x
+        >>> pipe = ut.Pipeline().add_stage(bad_stage, nworkers=2)
+        >>> try:
+        >>>     list(pipe.run(range(10)))
+        >>> except ut.PipelineError as ex:
+        >>>     assert 'bad input' in str(ex)
+        >>> else:
+        >>>     assert False, 'should have raised'
+    """
+
+    def __init__(self, buffer_size=4, ordered=True):
+        self.buffer_size = buffer_size
+        self.ordered = ordered
+        self.stages = []
+        self._stats = None
+
+    def add_stage(
+        self, func, nworkers=1, use_multiprocessing=False, buffer_size=None, name=None
+    ):
+        """
+        Appends a stage that maps ``func`` over each item.
+
+        Args:
+            func (function): called with one item, returns one item
+            nworkers (int): number of workers for this stage (default = 1)
+            use_multiprocessing (bool): if True workers are processes,
+                otherwise threads (default = False)
+            buffer_size (int): maximum size of the input queue of this stage
+                (default = self.buffer_size)
+            name (str): name used in errors and stats (default = funcname)
+
+        Returns:
+            Pipeline: self, so calls can be chained
+        """
+        if name is None:
+            name = get_funcname(func)
+        if buffer_size is None:
+            buffer_size = self.buffer_size
+        stage = dict(
+            func=func,
+            name=name,
+            nworkers=nworkers,
+            use_multiprocessing=use_multiprocessing,
+            buffer_size=buffer_size,
+        )
+        self.stages.append(stage)
+        return self
+
+    def run(self, source_gen):
+        """
+        Pushes every item of ``source_gen`` through all stages.
+
+        Yields:
+            object: the output of the last stage for each source item
+        """
+        if len(self.stages) == 0:
+            raise ValueError('Pipeline has no stages')
+        stages = self.stages
+        any_mp = any(stage['use_multiprocessing'] for stage in stages)
+        stop = multiprocessing.Event() if any_mp else threading.Event()
+        error_queue = multiprocessing.Queue() if any_mp else queue.Queue()
+        # queue_list[i] is the input of stage i, the last queue holds results
+        queue_list = []
+        for count, stage in enumerate(stages):
+            prev_mp = count > 0 and stages[count - 1]['use_multiprocessing']
+            if stage['use_multiprocessing'] or prev_mp:
+                queue_list.append(multiprocessing.Queue(maxsize=stage['buffer_size']))
+            else:
+                queue_list.append(queue.Queue(maxsize=stage['buffer_size']))
+        if stages[-1]['use_multiprocessing']:
+            queue_list.append(multiprocessing.Queue(maxsize=self.buffer_size))
+        else:
+            queue_list.append(queue.Queue(maxsize=self.buffer_size))
+
+        stats = collections.OrderedDict()
+        workers = []
+        for count, stage in enumerate(stages):
+            if count + 1 < len(stages):
+                nout = stages[count + 1]['nworkers']
+            else:
+                nout = 1
+            counter = multiprocessing.Value('l', 0)
+            busy = multiprocessing.Value('d', 0.0)
+            nalive = multiprocessing.Value('i', stage['nworkers'])
+            stats[stage['name']] = dict(
+                nworkers=stage['nworkers'], counter=counter, busy=busy, qsizes=[]
+            )
+            Process = KillableProcess if stage['use_multiprocessing'] else KillableThread
+            for _ in range(stage['nworkers']):
+                worker = Process(
+                    target=_pipeline_worker,
+                    args=(
+                        stage['func'],
+                        stage['name'],
+                        queue_list[count],
+                        queue_list[count + 1],
+                        nout,
+                        nalive,
+                        stop,
+                        error_queue,
+                        counter,
+                        busy,
+                    ),
+                )
+                worker.daemon = True
+                workers.append((stage['name'], worker))
+        feeder = KillableThread(
+            target=_pipeline_feeder,
+            args=(source_gen, queue_list[0], stages[0]['nworkers'], stop, error_queue),
+        )
+        feeder.daemon = True
+        workers.append(('source', feeder))
+        self._stats = stats
+
+        start_time = util_time.default_timer()
+        self._stats_time = (start_time, None)
+        for _, worker in workers:
+            worker.start()
+        result_queue = queue_list[-1]
+        reorder_buffer = {}
+        next_index = 0
+        try:
+            while True:
+                try:
+                    name, exrepr, tbtext = error_queue.get_nowait()
+                except queue.Empty:
+                    pass
+                else:
+                    raise PipelineError(
+                        'Pipeline stage %r failed with %s\n%s' % (name, exrepr, tbtext)
+                    )
+                try:
+                    item = result_queue.get(timeout=__PIPELINE_POLL__)
+                except queue.Empty:
+                    for name, worker in workers:
+                        exitcode = getattr(worker, 'exitcode', None)
+                        if exitcode is not None and exitcode != 0:
+                            raise PipelineError(
+                                'A worker of pipeline stage %r died with exitcode=%r'
+                                % (name, exitcode)
+                            )
+                    continue
+                for stage, queue_ in zip(stages, queue_list):
+                    try:
+                        stats[stage['name']]['qsizes'].append(queue_.qsize())
+                    except NotImplementedError:
+                        # qsize is not available for mp queues on macOS
+                        pass
+                if item is StopIteration:
+                    break
+                index, data = item
+                if self.ordered:
+                    reorder_buffer[index] = data
+                    while next_index in reorder_buffer:
+                        yield reorder_buffer.pop(next_index)
+                        next_index += 1
+                else:
+                    yield data
+        finally:
+            self._stats_time = (start_time, util_time.default_timer())
+            stop.set()
+            for _, worker in workers:
+                worker.join(timeout=__PIPELINE_POLL__ * 10)
+            for _, worker in workers:
+                if worker.is_alive():
+                    if isinstance(worker, KillableProcess):
+                        worker.terminate2()
+                    else:
+                        worker.terminate()
+
+    def stats(self):
+        """
+        Returns throughput and queue depth statistics for each stage of the
+        most recent run.
+
+        Returns:
+            OrderedDict: maps stage names to dicts with the keys: nworkers,
+                count, busy (total seconds spent in func), throughput (items
+                per second), utilization (busy fraction of the workers),
+                mean_qsize and max_qsize (depth of the stage's input queue)
+        """
+        if self._stats is None:
+            return None
+        start_time, end_time = self._stats_time
+        if end_time is None:
+            end_time = util_time.default_timer()
+        total_time = max(end_time - start_time, 1e-9)
+        stats = collections.OrderedDict()
+        for name, info in self._stats.items():
+            qsizes = info['qsizes']
+            count = info['counter'].value
+            busy = info['busy'].value
+            stats[name] = collections.OrderedDict(
+                [
+                    ('nworkers', info['nworkers']),
+                    ('count', count),
+                    ('busy', busy),
+                    ('throughput', count / total_time),
+                    ('utilization', busy / (total_time * info['nworkers'])),
+                    ('mean_qsize', sum(qsizes) / len(qsizes) if qsizes else None),
+                    ('max_qsize', max(qsizes) if qsizes else None),
+                ]
+            )
+        return stats
+
+
 def spawn_background_process(func, *args, **kwargs):
     """
     Run a function in the background
@@ -1060,7 +2651,7 @@ class KillableThread(threading.Thread):
     """
 
     def raise_exc(self, excobj):
-        assert self.isAlive(), 'thread must be started'
+        assert self.is_alive(), 'thread must be started'
         for tid, tobj in threading._active.items():
             if tobj is self:
                 _async_raise(tid, excobj)